@@ -0,0 +1,185 @@
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""
+Streaming decompression and archives extraction of the content retrieved from sources.
+
+The content is processed as an iterable of chunks, so that compressed files and tar archives are decompressed and
+extracted while being downloaded, with bounded memory and without writing the compressed content to disk.
+"""
+
+from __future__ import annotations
+
+import bz2
+import gzip
+import io
+import os
+import shutil
+import tarfile
+import zipfile
+from os import path
+from tempfile import SpooledTemporaryFile
+
+from ecs_files_composer.common import LOG
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHUNK_SIZE = 1024 * 1024
+# Zip archives index is at the end of the file: archives up to that size are kept in memory, larger ones on disk.
+ZIP_SPOOL_MAX_SIZE = 64 * CHUNK_SIZE
+
+
+class ArchiveError(ValueError):
+    """Raised when an archive member cannot be extracted safely"""
+
+
+class ChunksReader(io.RawIOBase):
+    """Read-only file object over an iterable of chunks of bytes"""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self.buffer:
+            self.buffer = next(self.chunks, None)
+            if self.buffer is None:
+                self.buffer = b""
+                return 0
+        size = min(len(buffer), len(self.buffer))
+        buffer[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+
+def iter_chunks(fileobj, chunk_size: int = CHUNK_SIZE):
+    return iter(lambda: fileobj.read(chunk_size), b"")
+
+
+def decompress_stream(fileobj, compression: str):
+    """
+    Returns a file object decompressing the content of fileobj as it is read
+
+    :param fileobj: Readable file object of the compressed content
+    :param str compression: gzip, bz2 or zstd
+    """
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    elif compression == "bz2":
+        return bz2.BZ2File(fileobj, mode="rb")
+    elif compression == "zstd":
+        if zstandard is None:
+            raise ImportError(
+                "zstd decompression requires zstandard. Install ecs_files_composer[zstd]"
+            )
+        return zstandard.ZstdDecompressor().stream_reader(fileobj)
+    raise ValueError(f"Unsupported compression {compression}")
+
+
+def decompress_chunks(chunks, compression: str):
+    """Decompresses the chunks of content, returning chunks of decompressed content"""
+    return iter_chunks(
+        decompress_stream(io.BufferedReader(ChunksReader(chunks)), compression)
+    )
+
+
+def get_member_path(target_dir: str, member_name: str) -> str:
+    """Returns the path to extract the member to, making sure it is within the target directory"""
+    member_path = path.realpath(path.join(target_dir, member_name))
+    if path.commonpath([path.realpath(target_dir), member_path]) != path.realpath(
+        target_dir
+    ):
+        raise ArchiveError(f"{member_name} would be extracted outside of {target_dir}")
+    return member_path
+
+
+def set_attributes(entry_path: str, mode: int, owner: str, group: str) -> None:
+    """
+    Sets the mode (directories get the execute permission where they are readable), owner and group
+    """
+    if path.isdir(entry_path):
+        mode |= (mode & 0o444) >> 2
+    os.chmod(entry_path, mode)
+    try:
+        shutil.chown(
+            entry_path,
+            int(owner) if owner.isdigit() else owner,
+            int(group) if group.isdigit() else group,
+        )
+    except (OSError, LookupError) as error:
+        LOG.error(f"{entry_path} - Failed to set owner {owner}:{group} - {error}")
+
+
+class ArchiveExtractor:
+    """
+    Extracts the regular files and directories of tar and zip archives into the target directory.
+    Other members (links, devices etc.) are skipped.
+    """
+
+    def __init__(self, target_dir: str, mode: str, owner: str, group: str):
+        self.target_dir = target_dir
+        self.mode = int(mode, 8)
+        self.owner = owner
+        self.group = group
+        self.extracted: list = []
+
+    def make_dir(self, dir_path: str) -> None:
+        if not path.isdir(dir_path):
+            os.makedirs(dir_path, exist_ok=True)
+            set_attributes(dir_path, self.mode, self.owner, self.group)
+
+    def write_member(self, member_name: str, member_fd) -> None:
+        member_path = get_member_path(self.target_dir, member_name)
+        self.make_dir(path.dirname(member_path))
+        with open(member_path, "wb") as file_fd:
+            shutil.copyfileobj(member_fd, file_fd, CHUNK_SIZE)
+        set_attributes(member_path, self.mode, self.owner, self.group)
+        self.extracted.append(member_path)
+
+    def extract_tar(self, chunks) -> list:
+        """Extracts the tar archive while it is read. Compressed tar archives are detected."""
+        with tarfile.open(
+            fileobj=io.BufferedReader(ChunksReader(chunks)), mode="r|*"
+        ) as archive:
+            for member in archive:
+                if member.isdir():
+                    self.make_dir(get_member_path(self.target_dir, member.name))
+                elif member.isfile():
+                    self.write_member(member.name, archive.extractfile(member))
+                else:
+                    LOG.warning(f"{member.name} is not a regular file. Skipping")
+        return self.extracted
+
+    def extract_zip(self, chunks) -> list:
+        """Zip archives are indexed at the end, so the archive is spooled before extraction"""
+        with SpooledTemporaryFile(max_size=ZIP_SPOOL_MAX_SIZE) as spool_fd:
+            for chunk in chunks:
+                spool_fd.write(chunk)
+            spool_fd.seek(0)
+            with zipfile.ZipFile(spool_fd) as archive:
+                for member in archive.infolist():
+                    if member.is_dir():
+                        self.make_dir(get_member_path(self.target_dir, member.filename))
+                    else:
+                        with archive.open(member) as member_fd:
+                            self.write_member(member.filename, member_fd)
+        return self.extracted
+
+    def extract(self, chunks, archive_format: str) -> list:
+        """
+        :param chunks: The chunks of content of the archive
+        :param str archive_format: tar or zip
+        :return: The paths of the files extracted
+        """
+        self.make_dir(self.target_dir)
+        if archive_format == "tar":
+            return self.extract_tar(chunks)
+        elif archive_format == "zip":
+            return self.extract_zip(chunks)
+        raise ValueError(f"Unsupported archive format {archive_format}")
@@ -0,0 +1,654 @@
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""
+Asyncio execution core, using aiobotocore & aiohttp.
+All the files of the job are processed concurrently from a single thread, and the Jinja2 templates are rendered
+in async mode, so that template functions calling AWS APIs or the ECS metadata endpoint are awaited.
+
+Requires the ``async`` extra: ``pip install ecs_files_composer[async]``
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from contextlib import AsyncExitStack
+from contextvars import ContextVar
+from dataclasses import asdict
+from enum import Enum
+from functools import partial
+from tempfile import TemporaryDirectory
+
+from botocore.credentials import CredentialProvider, RefreshableCredentials
+from botocore.exceptions import ClientError
+from dacite import Config, from_dict
+from jinja2 import Environment, FileSystemLoader
+
+try:
+    import aiohttp
+    from aiobotocore.config import AioConfig
+    from aiobotocore.credentials import AioCredentials, AioRefreshableCredentials
+    from aiobotocore.session import get_session as get_aio_session
+except ImportError:
+    aiohttp = None
+    AioConfig = None
+    AioCredentials = None
+    AioRefreshableCredentials = None
+    get_aio_session = None
+
+from aws_cfn_custom_resource_resolve_parser import handle
+
+from ecs_files_composer import input
+from ecs_files_composer.archives import CHUNK_SIZE
+from ecs_files_composer.aws_mgmt import (
+    BUCKET_REGIONS,
+    MAX_POOL_CONNECTIONS,
+    RETRIES_COUNTER,
+    AwsResourceHandler,
+    S3Fetcher,
+    SecretFetcher,
+    SsmFetcher,
+    get_bucket_region,
+    get_retries_config,
+)
+from ecs_files_composer.common import LOG
+from ecs_files_composer.envsubst import expandvars
+from ecs_files_composer.files_mgmt import (
+    RENDER_BUFFER_SIZE,
+    AtomicFileWriter,
+    DigestMismatchError,
+    File,
+    MemoryBytecodeCache,
+)
+from ecs_files_composer.jinja2_filters import JINJA_FILTERS
+from ecs_files_composer.jinja2_functions import JINJA_FUNCTIONS
+from ecs_files_composer.jinja2_functions.aws import (
+    define_ecs_metadata_url,
+    get_metadata_property,
+)
+from ecs_files_composer.jinja2_functions.prefetch import prefetch_template_functions
+from ecs_files_composer.shared_cache import SHARED_CACHE
+from ecs_files_composer.tracing import traced
+
+MAX_CONCURRENT_FILES = 64
+
+ASYNC_CLIENTS: ContextVar = ContextVar("async_clients")
+# Templates compiled in async mode differ, so they are kept apart.
+ASYNC_JINJA_BYTECODE_CACHE = MemoryBytecodeCache()
+
+
+class AsyncClients:
+    """
+    Holds the aiobotocore clients and the aiohttp session for the duration of the job.
+    One client is kept per session, service, region and retries settings, as for the synchronous ClientsPool.
+    """
+
+    def __init__(self):
+        if get_aio_session is None or aiohttp is None:
+            raise ImportError(
+                "aiobotocore and aiohttp are required for the async mode."
+                " Install ecs_files_composer[async]"
+            )
+        self._stack = AsyncExitStack()
+        self._clients: dict = {}
+        self._lock = asyncio.Lock()
+        self.http = None
+
+    async def __aenter__(self):
+        self.http = await self._stack.enter_async_context(aiohttp.ClientSession())
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._stack.aclose()
+
+    async def get_client(
+        self, session, service_name: str, retries=None, region_name: str = None
+    ):
+        """
+        Returns the aiobotocore client, using the credentials and region of the boto3 session.
+
+        :param boto3.session.Session session:
+        :param str service_name:
+        :param ecs_files_composer.input.RetriesDef retries:
+        :param str region_name: Overrides the region of the session
+        """
+        retries_config = get_retries_config(retries)
+        region_name = region_name or session.region_name
+        key = (
+            id(session),
+            service_name,
+            region_name,
+            retries_config["mode"],
+            retries_config["max_attempts"],
+        )
+        async with self._lock:
+            if key not in self._clients:
+                aio_session = get_aio_session()
+                aio_session.get_component("credential_provider").insert_before(
+                    "env", SessionCredentialProvider(session)
+                )
+                client = await self._stack.enter_async_context(
+                    aio_session.create_client(
+                        service_name,
+                        region_name=region_name,
+                        config=AioConfig(
+                            retries=retries_config,
+                            max_pool_connections=MAX_POOL_CONNECTIONS,
+                        ),
+                    )
+                )
+                client.meta.events.register("after-call", RETRIES_COUNTER)
+                self._clients[key] = (session, client)
+            return self._clients[key][1]
+
+
+class SessionCredentialProvider(CredentialProvider):
+    """
+    Provides the credentials of the boto3 session to the aiobotocore session.
+    Refreshable credentials, i.e. the assumed role ones from the credentials cache, remain refreshable: when they
+    expire, the aiobotocore credentials are refreshed from the boto3 session ones.
+    """
+
+    METHOD = "boto3-session"
+
+    def __init__(self, session):
+        super().__init__()
+        self.session = session
+
+    def get_metadata(self) -> dict | None:
+        """Returns the credentials of the boto3 session, refreshing them if needed"""
+        credentials = self.session.get_credentials()
+        if not credentials:
+            return None
+        frozen = credentials.get_frozen_credentials()
+        metadata = {
+            "access_key": frozen.access_key,
+            "secret_key": frozen.secret_key,
+            "token": frozen.token,
+        }
+        if isinstance(credentials, RefreshableCredentials):
+            metadata["expiry_time"] = credentials._expiry_time.isoformat()
+        return metadata
+
+    async def refresh(self) -> dict:
+        # Refreshing the credentials can call STS or the credentials endpoints
+        return await asyncio.get_running_loop().run_in_executor(None, self.get_metadata)
+
+    async def load(self):
+        metadata = await self.refresh()
+        if not metadata:
+            return None
+        if "expiry_time" in metadata:
+            return AioRefreshableCredentials.create_from_metadata(
+                metadata, self.refresh, self.METHOD
+            )
+        return AioCredentials(
+            metadata["access_key"],
+            metadata["secret_key"],
+            metadata["token"],
+            method=self.METHOD,
+        )
+
+
+def resolve_source_session(
+    source_iam_override=None, iam_override=None, session_override=None
+):
+    """
+    Resolves the boto3 session to use for a source, with the same priority as for the synchronous fetchers.
+    sts:AssumeRole calls go through the credentials cache.
+    """
+    if source_iam_override:
+        return AwsResourceHandler(iam_config_object=source_iam_override).client_session
+    elif iam_override:
+        return AwsResourceHandler(iam_config_object=iam_override).client_session
+    elif session_override:
+        return session_override
+    return AwsResourceHandler().client_session
+
+
+async def get_source_session(
+    source_iam_override=None, iam_override=None, session_override=None
+):
+    """Resolves the boto3 session in a thread, as assuming the role blocks on the STS call"""
+    return await asyncio.get_running_loop().run_in_executor(
+        None,
+        resolve_source_session,
+        source_iam_override,
+        iam_override,
+        session_override,
+    )
+
+
+class AsyncS3Fetcher:
+    """Async counterpart of S3Fetcher"""
+
+    def __init__(self, clients: AsyncClients, session, retries=None):
+        self.clients = clients
+        self.session = session
+        self.retries = retries
+
+    async def client_for(self, s3_bucket: str, bucket_region: str = None):
+        """Returns the client for the region of the bucket, discovered once with s3:HeadBucket if not set"""
+        client = await self.clients.get_client(self.session, "s3", self.retries)
+        bucket_region = bucket_region or BUCKET_REGIONS.get(s3_bucket)
+        if not bucket_region:
+            try:
+                bucket_region = get_bucket_region(
+                    await client.head_bucket(Bucket=s3_bucket)
+                )
+            except ClientError as error:
+                bucket_region = get_bucket_region(error.response)
+            if not bucket_region:
+                return client
+            BUCKET_REGIONS.set(s3_bucket, bucket_region)
+        return await self.clients.get_client(
+            self.session, "s3", self.retries, region_name=bucket_region
+        )
+
+    async def get_object(
+        self,
+        s3_bucket: str,
+        s3_key: str,
+        checksum_mode: bool = False,
+        bucket_region: str = None,
+    ) -> dict:
+        """Returns the GetObject response, with the SHA256 checksum if checksum_mode is set. The Body is not read."""
+        client = await self.client_for(s3_bucket, bucket_region)
+        object_args = {"Bucket": s3_bucket, "Key": s3_key}
+        if checksum_mode:
+            object_args["ChecksumMode"] = "ENABLED"
+        return await client.get_object(**object_args)
+
+    async def get_content(self, s3_bucket: str, s3_key: str) -> bytes:
+        file_r = await self.get_object(s3_bucket, s3_key)
+        async with file_r["Body"] as body:
+            return await body.read()
+
+
+class AsyncSsmFetcher:
+    """Async counterpart of SsmFetcher"""
+
+    def __init__(self, clients: AsyncClients, session, retries=None):
+        self.clients = clients
+        self.session = session
+        self.retries = retries
+
+    async def get_content(self, parameter_name: str) -> str:
+        client = await self.clients.get_client(self.session, "ssm", self.retries)
+        parameter = await client.get_parameter(
+            Name=SsmFetcher.parse_name(parameter_name), WithDecryption=True
+        )
+        return parameter["Parameter"]["Value"]
+
+
+class AsyncSecretFetcher:
+    """Async counterpart of SecretFetcher"""
+
+    def __init__(self, clients: AsyncClients, session, retries=None):
+        self.clients = clients
+        self.session = session
+        self.retries = retries
+
+    async def get_content(self, secret: input.SecretDef) -> str:
+        client = await self.clients.get_client(
+            self.session, "secretsmanager", self.retries
+        )
+        secret_value = await client.get_secret_value(**SecretFetcher.get_params(secret))
+        return secret_value["SecretString"]
+
+
+class AsyncUrlFetcher:
+    """Async counterpart of the Url source"""
+
+    def __init__(self, clients: AsyncClients):
+        self.clients = clients
+
+    async def iter_content(self, url: input.UrlDef):
+        """Yields the chunks of the content as they are received"""
+        auth = None
+        if url.Username and url.Password:
+            auth = aiohttp.BasicAuth(url.Username, url.Password)
+        async with self.clients.http.get(url.Url, auth=auth) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                yield chunk
+
+
+def iter_async_chunks(chunks, loop):
+    """
+    Iterates, from a thread, over the async iterable of chunks, each chunk being awaited on the event loop.
+    Allows to write the content with File.write_content as it is received.
+    """
+    iterator = chunks.__aiter__()
+
+    async def next_chunk():
+        try:
+            return await iterator.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    while True:
+        chunk = asyncio.run_coroutine_threadsafe(next_chunk(), loop).result()
+        if chunk is None:
+            return
+        yield chunk
+
+
+async def from_ssm(parameter_name: str) -> str:
+    clients = ASYNC_CLIENTS.get()
+    return await AsyncSsmFetcher(clients, await get_source_session()).get_content(
+        parameter_name
+    )
+
+
+async def from_ssm_json(parameter_name: str) -> dict:
+    try:
+        return json.loads(await from_ssm(parameter_name))
+    except json.JSONDecodeError:
+        return {}
+
+
+async def get_ecs_metadata(for_task=False) -> dict:
+    clients = ASYNC_CLIENTS.get()
+    async with clients.http.get(define_ecs_metadata_url(for_task)) as response:
+        return await response.json(content_type=None)
+
+
+async def ecs_container_metadata(property_key=None, fallback_value=None):
+    return get_metadata_property(
+        await get_ecs_metadata(), property_key, fallback_value, "container"
+    )
+
+
+async def ecs_task_metadata(property_key=None, fallback_value=None):
+    return get_metadata_property(
+        await get_ecs_metadata(for_task=True), property_key, fallback_value, "task"
+    )
+
+
+async def using_resolve(resolve_string: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(
+        None, handle, resolve_string
+    )
+
+
+def in_executor(function):
+    """Wraps the blocking function into a coroutine function running it in a thread"""
+
+    async def wrapper(*args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, partial(function, *args, **kwargs)
+        )
+
+    return wrapper
+
+
+ASYNC_JINJA_FUNCTIONS = dict(JINJA_FUNCTIONS)
+ASYNC_JINJA_FUNCTIONS.update(
+    {
+        "ecs_container_metadata": ecs_container_metadata,
+        "ecs_task_metadata": ecs_task_metadata,
+        "from_ssm": from_ssm,
+        "from_ssm_json": from_ssm_json,
+        "from_resolve": using_resolve,
+    }
+)
+
+
+class AsyncFile(File):
+    """
+    Async counterpart of File. Sources are retrieved with the async fetchers, and the templates rendered
+    with Jinja2 in async mode. Writing files and post-processing (chmod/chown/commands) are run in threads.
+    """
+
+    @traced("file")
+    async def handler(
+        self, iam_override=None, session_override=None, retries=None, clients=None
+    ):
+        """
+        Main entrypoint for files to relate
+
+        :param ecs_files_composer.input.IamOverrideDef iam_override:
+        :param boto3.session.Session session_override:
+        :param ecs_files_composer.input.RetriesDef retries: The job level retries settings
+        :param AsyncClients clients:
+        """
+        if not self.dir_prepared and not os.path.exists(self.dir_path):
+            os.makedirs(self.dir_path, exist_ok=True)
+        if (
+            self.context
+            and isinstance(self.context, input.Context)
+            and self.context.value == "jinja2"
+        ):
+            self.templates_dir = self.scratch_dir
+        loop = asyncio.get_running_loop()
+        if self.source and not self.content:
+            retrieved, ignore = await self.handle_sources_async(
+                clients, iam_override, session_override, retries
+            )
+            if not self.source_retrieved(retrieved, ignore):
+                return
+        try:
+            if await loop.run_in_executor(None, self.write_source_content):
+                await self.render_jinja_async()
+        except DigestMismatchError as error:
+            if not self.digest_mismatch_ignored(error):
+                raise
+            return
+        await loop.run_in_executor(None, self.post_processing)
+
+    @traced("fetch")
+    async def handle_sources_async(
+        self,
+        clients: AsyncClients,
+        iam_override=None,
+        session_override=None,
+        retries=None,
+    ) -> tuple[bool, bool]:
+        """
+        Async counterpart of File.handle_sources
+
+        :return: Whether the content was retrieved, and whether to ignore the failure.
+        """
+        ignore = self.ignore_source_failure
+        if SHARED_CACHE.enabled and (self.source.Url or self.source.S3):
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self.handle_sources, iam_override, session_override, retries
+            )
+        try:
+            if self.source.Url:
+                chunks = AsyncUrlFetcher(clients).iter_content(self.source.Url)
+                try:
+                    await self.write_stream(chunks)
+                finally:
+                    await chunks.aclose()
+            elif self.source.Ssm:
+                session = await get_source_session(
+                    self.source.Ssm.IamOverride, iam_override, session_override
+                )
+                self.content = await AsyncSsmFetcher(
+                    clients, session, self.source.Ssm.Retries or retries
+                ).get_content(expandvars(self.source.Ssm.ParameterName))
+            elif self.source.S3:
+                session = await get_source_session(
+                    self.source.S3.IamOverride, iam_override, session_override
+                )
+                object_r = await AsyncS3Fetcher(
+                    clients, session, self.source.S3.Retries or retries
+                ).get_object(
+                    *self.s3_location(),
+                    checksum_mode=bool(self.source.S3.ChecksumMode),
+                    bucket_region=expandvars(self.source.S3.BucketRegion or "") or None,
+                )
+                if self.source.S3.ChecksumMode:
+                    self.s3_checksum = S3Fetcher.checksum_sha256(object_r)
+                    if not self.s3_checksum:
+                        LOG.warning(
+                            f"{self.path} - No SHA256 checksum for the S3 object"
+                        )
+                async with object_r["Body"] as body:
+                    await self.write_stream(body.iter_chunks(CHUNK_SIZE))
+            elif self.source.S3Prefix or self.source.SsmPath:
+                handler = (
+                    self.handle_s3_prefix_source
+                    if self.source.S3Prefix
+                    else self.handle_ssm_path_source
+                )
+                return (
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, handler, iam_override, session_override, retries
+                    ),
+                    ignore,
+                )
+            elif self.source.Secret:
+                session = await get_source_session(
+                    self.source.Secret.IamOverride, iam_override, session_override
+                )
+                self.content = await AsyncSecretFetcher(
+                    clients, session, self.source.Secret.Retries or retries
+                ).get_content(self.source.Secret)
+            if isinstance(self.content, (str, bytes)):
+                self.verify_content_digest()
+            return True, ignore
+        except Exception as error:
+            LOG.error(f"Failed to retrieve {self.path} from source")
+            LOG.error(error)
+            return False, ignore
+
+    async def write_stream(self, chunks) -> None:
+        """
+        Writes the content from the source as it is received, as File.write_content does for the synchronous
+        sources, the writing being run in a thread. The digest, if any, is verified while writing.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None,
+            partial(
+                self.write_content,
+                as_bytes=True,
+                bytes_content=iter_async_chunks(chunks, loop),
+            ),
+        )
+
+    @traced("render")
+    async def render_jinja_async(self):
+        """
+        Async counterpart of File.render_jinja, awaiting the template functions.
+        With prefetch, the recording pass and the values retrieval run in a thread, and the prefetched values
+        functions are run in a thread too, as the values which were not prefetched are retrieved as usual.
+        """
+        LOG.info(f"Rendering Jinja for {self.path} - {self.templates_dir}")
+        jinja_env = Environment(
+            loader=FileSystemLoader(self.templates_dir),
+            autoescape=True,
+            auto_reload=False,
+            enable_async=True,
+            bytecode_cache=ASYNC_JINJA_BYTECODE_CACHE,
+        )
+        jinja_env.filters.update(JINJA_FILTERS)
+        jinja_env.globals.update(ASYNC_JINJA_FUNCTIONS)
+        template = jinja_env.get_template(self.template_name)
+        loop = asyncio.get_running_loop()
+        functions = {}
+        if self.prefetch:
+            functions = await loop.run_in_executor(
+                None, partial(prefetch_template_functions, template, env=os.environ)
+            )
+            functions = {
+                name: in_executor(function) for name, function in functions.items()
+            }
+        if self.stream_render:
+            self.content = None
+            writer = await loop.run_in_executor(None, AtomicFileWriter, self.path)
+            try:
+                buffer: list = []
+                buffered = 0
+                async for chunk in template.generate_async(env=os.environ, **functions):
+                    buffer.append(chunk)
+                    buffered += len(chunk)
+                    if buffered >= RENDER_BUFFER_SIZE:
+                        await loop.run_in_executor(None, writer.write, "".join(buffer))
+                        buffer, buffered = [], 0
+                await loop.run_in_executor(None, writer.write, "".join(buffer))
+            except BaseException:
+                await loop.run_in_executor(None, writer.abort)
+                raise
+            await loop.run_in_executor(None, writer.commit)
+            return
+        self.content = await template.render_async(env=os.environ, **functions)
+        await loop.run_in_executor(None, self.write_content, False)
+
+
+async def process_files_async(
+    job: input.Model,
+    override_session=None,
+    max_concurrency: int = MAX_CONCURRENT_FILES,
+    results: dict = None,
+    ready_file: str = None,
+    all_critical: bool = False,
+    phase: str = "all",
+    exports: dict = None,
+) -> None:
+    """
+    Processes all the files of the job concurrently, at most max_concurrency at once.
+    If results is set, the status of each file processed is set into it.
+    The critical files are processed first, then the readiness signal is published if set, and the other files
+    are processed.
+    """
+    from ecs_files_composer.ecs_files_composer import (
+        get_scratch_base_dir,
+        prepare_directories,
+        schedule_files,
+        select_phase,
+        signal_ready,
+    )
+
+    files: list = []
+    for file_path, file in job.files.items():
+        file_data = asdict(file)
+        # Generated content, i.e. keystores, can be bytes
+        content = file_data.pop("content", None)
+        file_redef = from_dict(
+            data_class=AsyncFile, data=file_data, config=Config(cast=[Enum, bytes])
+        )
+        file_redef.content = content
+        file_redef.path = file_path
+        files.append(file_redef)
+    critical, others = select_phase(*schedule_files(files, all_critical), phase)
+    prepare_directories(critical + others)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def process(file: AsyncFile, clients: AsyncClients):
+        file_path = file.path
+        async with semaphore:
+            if file.exports_only:
+                file.set_export_path(file.scratch_dir)
+            try:
+                await file.handler(
+                    job.IamOverride, override_session, job.Retries, clients
+                )
+            except Exception as error:
+                if results is not None:
+                    results[file_path] = f"failed: {error}"
+                raise
+            if exports is not None:
+                file.export_content(exports)
+            LOG.info(f"Tasks for {file_path} completed.")
+            if results is not None:
+                results[file_path] = "completed"
+
+    with TemporaryDirectory(
+        prefix="files-composer-", dir=get_scratch_base_dir()
+    ) as scratch_dir:
+        async with AsyncClients() as clients:
+            ASYNC_CLIENTS.set(clients)
+            for file in critical + others:
+                file.scratch_dir = scratch_dir
+            await asyncio.gather(*[process(file, clients) for file in critical])
+            if ready_file:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, signal_ready, ready_file
+                )
+            await asyncio.gather(*[process(file, clients) for file in others])
@@ -3,33 +3,394 @@
 
 """AWS module."""
 
+from __future__ import annotations
+
+import base64
+import json
+import os
 import re
+import threading
 
 import boto3
 from boto3.session import Session
+from botocore.config import Config
+from botocore.credentials import RefreshableCredentials
 from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+from botocore.session import get_session
 
 from ecs_files_composer import input
+from ecs_files_composer.archives import CHUNK_SIZE
 from ecs_files_composer.common import LOG
 from ecs_files_composer.envsubst import expandvars
+from ecs_files_composer.shared_cache import SHARED_CACHE
+from ecs_files_composer.tracing import TRACER
+
+
+class AssumedRoleCredentialsCache:
+    """
+    Process-level cache of the sts:AssumeRole credentials, keyed by (RoleArn, ExternalId, SessionName, region).
+    Credentials are wrapped into botocore RefreshableCredentials, so they are renewed before they expire.
+    When a cache directory is set, credentials are also persisted so that consecutive executions
+    (i.e. several init containers in the same task) can re-use them. Prefer a tmpfs path such as /dev/shm.
+    Sessions using static access keys are cached too, by (AccessKeyId, SessionToken), but never persisted.
+    """
+
+    file_name = "credentials.json"
+
+    def __init__(self, cache_dir: str = None):
+        self.cache_dir = cache_dir
+        self._sessions: dict = {}
+        self._persisted: dict = {}
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    @property
+    def file_path(self) -> str | None:
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, self.file_name)
+
+    def set_cache_dir(self, cache_dir: str = None) -> None:
+        with self._lock:
+            self.cache_dir = cache_dir
+            self._persisted = {}
+            self._loaded = False
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions = {}
+            self._persisted = {}
+            self._loaded = False
+
+    @staticmethod
+    def cache_key(
+        role_arn: str,
+        external_id: str = None,
+        session_name: str = None,
+        region: str = None,
+    ) -> str:
+        return "|".join([role_arn, external_id or "", session_name or "", region or ""])
+
+    def _load_persisted(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.file_path or not os.path.exists(self.file_path):
+            return
+        try:
+            with open(self.file_path) as cache_fd:
+                self._persisted = json.load(cache_fd)
+        except (OSError, json.JSONDecodeError) as error:
+            LOG.warning(f"Failed to load credentials cache {self.file_path}: {error}")
+            self._persisted = {}
+
+    def _persist(self, key: str, metadata: dict) -> None:
+        with self._lock:
+            self._persisted[key] = metadata
+            if not self.file_path:
+                return
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = f"{self.file_path}.{os.getpid()}.tmp"
+                with open(
+                    os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600),
+                    "w",
+                ) as cache_fd:
+                    json.dump(self._persisted, cache_fd)
+                os.replace(tmp_path, self.file_path)
+            except OSError as error:
+                LOG.warning(
+                    f"Failed to persist credentials to {self.file_path}: {error}"
+                )
+
+    def get_session(
+        self,
+        role_arn: str,
+        session_name: str,
+        external_id: str = None,
+        region: str = None,
+        source_session: Session = None,
+    ) -> Session:
+        """
+        Returns a boto3 session using the assumed role credentials, creating them only when not already cached.
+
+        :param str role_arn: The IAM role to assume
+        :param str session_name: The RoleSessionName
+        :param str external_id: Optional ExternalId for sts:AssumeRole
+        :param str region: Region name for the new session
+        :param boto3.session.Session source_session: Session used to call sts:AssumeRole
+        :rtype: boto3.session.Session
+        """
+        key = self.cache_key(role_arn, external_id, session_name, region)
+        with self._lock:
+            if key in self._sessions:
+                return self._sessions[key]
+            if source_session is None:
+                source_session = CLIENTS_POOL.default_session
+            params = {"RoleArn": role_arn, "RoleSessionName": session_name}
+            if external_id:
+                params["ExternalId"] = external_id
+
+            def refresh() -> dict:
+                LOG.debug(f"sts:AssumeRole for {role_arn} ({session_name})")
+                with TRACER.span(role_arn, "credentials", session_name=session_name):
+                    creds = source_session.client("sts").assume_role(**params)[
+                        "Credentials"
+                    ]
+                metadata = {
+                    "access_key": creds["AccessKeyId"],
+                    "secret_key": creds["SecretAccessKey"],
+                    "token": creds["SessionToken"],
+                    "expiry_time": creds["Expiration"].isoformat(),
+                }
+                self._persist(key, metadata)
+                return metadata
+
+            self._load_persisted()
+            metadata = self._persisted.get(key) or refresh()
+            credentials = RefreshableCredentials.create_from_metadata(
+                metadata=metadata,
+                refresh_using=refresh,
+                method="sts-assume-role",
+            )
+            botocore_session = get_session()
+            botocore_session._credentials = credentials
+            if region:
+                botocore_session.set_config_variable("region", region)
+            session = boto3.session.Session(botocore_session=botocore_session)
+            self._sessions[key] = session
+            return session
+
+    def get_static_session(
+        self,
+        access_key_id: str,
+        secret_access_key: str,
+        session_token: str = None,
+    ) -> Session:
+        """
+        Returns a boto3 session using the given access keys, so that the clients pool re-uses its clients.
+
+        :param str access_key_id:
+        :param str secret_access_key:
+        :param str session_token:
+        :rtype: boto3.session.Session
+        """
+        key = "|".join(["static", access_key_id or "", session_token or ""])
+        with self._lock:
+            if key not in self._sessions:
+                self._sessions[key] = boto3.session.Session(
+                    aws_access_key_id=access_key_id,
+                    aws_secret_access_key=secret_access_key,
+                    aws_session_token=session_token,
+                )
+            return self._sessions[key]
+
+
+CREDENTIALS_CACHE = AssumedRoleCredentialsCache(
+    cache_dir=os.environ.get("FILES_COMPOSER_CACHE_DIR", None)
+)
+
+
+class BucketRegionsCache:
+    """
+    Process-level cache of the region of the S3 buckets, so that each bucket region is discovered only once.
+    When a cache directory is set, the regions are also persisted for the consecutive executions.
+    """
+
+    file_name = "bucket_regions.json"
+
+    def __init__(self, cache_dir: str = None):
+        self.cache_dir = cache_dir
+        self._regions: dict = {}
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    @property
+    def file_path(self) -> str | None:
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, self.file_name)
+
+    def set_cache_dir(self, cache_dir: str = None) -> None:
+        with self._lock:
+            self.cache_dir = cache_dir
+            self._loaded = False
+
+    def clear(self) -> None:
+        with self._lock:
+            self._regions = {}
+            self._loaded = False
+
+    def _load_persisted(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.file_path or not os.path.exists(self.file_path):
+            return
+        try:
+            with open(self.file_path) as cache_fd:
+                self._regions.update(json.load(cache_fd))
+        except (OSError, json.JSONDecodeError) as error:
+            LOG.warning(
+                f"Failed to load bucket regions cache {self.file_path}: {error}"
+            )
+
+    def _persist(self) -> None:
+        if not self.file_path:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{self.file_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as cache_fd:
+                json.dump(self._regions, cache_fd)
+            os.replace(tmp_path, self.file_path)
+        except OSError as error:
+            LOG.warning(
+                f"Failed to persist bucket regions to {self.file_path}: {error}"
+            )
+
+    def get(self, bucket: str) -> str | None:
+        with self._lock:
+            self._load_persisted()
+            return self._regions.get(bucket)
+
+    def set(self, bucket: str, region: str) -> None:
+        with self._lock:
+            self._load_persisted()
+            if self._regions.get(bucket) == region:
+                return
+            self._regions[bucket] = region
+            self._persist()
+
+
+BUCKET_REGIONS = BucketRegionsCache(
+    cache_dir=os.environ.get("FILES_COMPOSER_CACHE_DIR", None)
+)
+
+
+def get_bucket_region(response: dict) -> str | None:
+    """Returns the bucket region from the x-amz-bucket-region header of the S3 response, or error response"""
+    return (
+        response.get("ResponseMetadata", {})
+        .get("HTTPHeaders", {})
+        .get("x-amz-bucket-region")
+    )
 
 
-def create_session_from_creds(tmp_creds: dict, region: str = None):
+DEFAULT_RETRIES = {
+    "mode": os.environ.get("AWS_RETRY_MODE", "adaptive"),
+    "max_attempts": int(os.environ.get("AWS_MAX_ATTEMPTS", 10)),
+}
+MAX_POOL_CONNECTIONS = 32
+
+
+def get_retries_config(retries: input.RetriesDef = None) -> dict:
     """
-    Function to easily convert the AssumeRole reply into a boto3 session
-    :param tmp_creds:
-    :return:
-    :rtype boto3.session.Session
+    Returns the botocore retries settings, from the RetriesDef if set, otherwise the default ones.
+
+    :param ecs_files_composer.input.RetriesDef retries:
     """
-    creds = tmp_creds["Credentials"]
-    params = {
-        "aws_AccessKeyId": creds["AccessKeyId"],
-        "aws_SecretAccessKey": creds["SecretAccessKey"],
-        "aws_session_token": creds["SessionToken"],
+    if not retries:
+        return dict(DEFAULT_RETRIES)
+    mode = retries.Mode.value if hasattr(retries.Mode, "value") else retries.Mode
+    return {
+        "mode": mode or DEFAULT_RETRIES["mode"],
+        "max_attempts": retries.MaxAttempts or DEFAULT_RETRIES["max_attempts"],
     }
-    if region:
-        params["RegionName"] = region
-    return boto3.session.Session(**params)
+
+
+class RetriesCounter:
+    """
+    Counts the retries that botocore performed for the API calls, per service.
+    """
+
+    def __init__(self):
+        self.retries: dict = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, parsed=None, model=None, **kwargs):
+        if not parsed or not model:
+            return
+        attempts = parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+        if not attempts:
+            return
+        service = model.service_model.service_name
+        with self._lock:
+            self.retries[service] = self.retries.get(service, 0) + attempts
+
+    @property
+    def total(self) -> int:
+        return sum(self.retries.values())
+
+    def reset(self) -> None:
+        with self._lock:
+            self.retries = {}
+
+
+RETRIES_COUNTER = RetriesCounter()
+
+
+class ClientsPool:
+    """
+    Keeps one client per session, service, region and retries settings. Clients are thread safe, and re-using them
+    avoids to re-create the client and its connections pool for each file. With adaptive retries, all the calls
+    made to a service share the same client side rate limiter.
+    """
+
+    def __init__(self):
+        self._clients: dict = {}
+        self._default_session = None
+        self._lock = threading.Lock()
+
+    @property
+    def default_session(self) -> Session:
+        with self._lock:
+            if self._default_session is None:
+                self._default_session = Session()
+            return self._default_session
+
+    def get_client(
+        self,
+        session: Session,
+        service_name: str,
+        region_name: str = None,
+        retries: input.RetriesDef = None,
+    ):
+        """
+        :param boto3.session.Session session:
+        :param str service_name:
+        :param str region_name:
+        :param ecs_files_composer.input.RetriesDef retries:
+        """
+        retries_config = get_retries_config(retries)
+        key = (
+            id(session),
+            service_name,
+            region_name,
+            retries_config["mode"],
+            retries_config["max_attempts"],
+        )
+        with self._lock:
+            if key not in self._clients:
+                client = session.client(
+                    service_name,
+                    region_name=region_name,
+                    config=Config(
+                        retries=retries_config,
+                        max_pool_connections=MAX_POOL_CONNECTIONS,
+                    ),
+                )
+                client.meta.events.register("after-call", RETRIES_COUNTER)
+                self._clients[key] = (session, client)
+            return self._clients[key][1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clients = {}
+
+
+CLIENTS_POOL = ClientsPool()
 
 
 def set_session_from_iam_object(iam_config_object, source_session: Session = None):
@@ -42,27 +403,20 @@ def set_session_from_iam_object(iam_config_object, source_session: Session = Non
     :rtype: boto3.session.Session
     """
     if source_session is None:
-        source_session = boto3.Session()
+        source_session = CLIENTS_POOL.default_session
     if not iam_config_object.AccessKeyId and not iam_config_object.SecretAccessKey:
-        params = {
-            "RoleArn": iam_config_object.RoleArn,
-            "RoleSessionName": f"{iam_config_object.SessionName}@AwsResourceHandlerInit",
-        }
-        if iam_config_object.ExternalId:
-            params["ExternalId"] = iam_config_object.ExternalId
-        tmp_creds = source_session.client("sts").assume_role(**params)
-        client_session = create_session_from_creds(
-            tmp_creds, region=iam_config_object.RegionName
+        client_session = CREDENTIALS_CACHE.get_session(
+            iam_config_object.RoleArn,
+            f"{iam_config_object.SessionName}@AwsResourceHandlerInit",
+            external_id=iam_config_object.ExternalId,
+            region=iam_config_object.RegionName,
+            source_session=source_session,
         )
     else:
-        client_session = boto3.session.Session(
-            aws_access_key_id=iam_config_object.AccessKeyId,
-            aws_secret_access_key=iam_config_object.SecretAccessKey,
-            aws_session_token=(
-                iam_config_object.SessionToken
-                if iam_config_object.SessionToken
-                else None
-            ),
+        client_session = CREDENTIALS_CACHE.get_static_session(
+            iam_config_object.AccessKeyId,
+            iam_config_object.SecretAccessKey,
+            iam_config_object.SessionToken if iam_config_object.SessionToken else None,
         )
     return client_session
 
@@ -79,28 +433,28 @@ class AwsResourceHandler:
         region=None,
         iam_config_object=None,
         client_session_override=None,
+        retries=None,
     ):
         """
         :param str RoleArn:
         :param str ExternalId:
         :param str region:
         :param ecs_files_composer.input.IamOverrideDef iam_config_object:
+        :param ecs_files_composer.input.RetriesDef retries:
         """
-        self.session = Session()
-        self.client_session = Session()
+        self.session = CLIENTS_POOL.default_session
+        self.client_session = CLIENTS_POOL.default_session
+        self.retries = retries
         if client_session_override:
             self.client_session = client_session_override
         elif not client_session_override and (RoleArn or iam_config_object):
             if RoleArn and not iam_config_object:
-                params = {
-                    "RoleArn": RoleArn,
-                    "RoleSessionName": "EcsConfigComposer@AwsResourceHandlerInit",
-                }
-                if ExternalId:
-                    params["ExternalId"] = ExternalId
-                tmp_creds = self.session.client("sts").assume_role(**params)
-                self.client_session = create_session_from_creds(
-                    tmp_creds, region=region
+                self.client_session = CREDENTIALS_CACHE.get_session(
+                    RoleArn,
+                    "EcsConfigComposer@AwsResourceHandlerInit",
+                    external_id=ExternalId,
+                    region=region,
+                    source_session=self.session,
                 )
             elif (
                 iam_config_object
@@ -119,6 +473,7 @@ class S3Fetcher(AwsResourceHandler):
 
     bucket_re = re.compile(r"^s3://(?P<bucket>[a-zA-Z\d\-.]+)/(?P<key>[\S]+)$")
     compose_x_re = re.compile(r"^(?P<bucket>[a-zA-Z\d\-.]+)::(?P<key>[\S]+)$")
+    prefix_re = re.compile(r"^s3://(?P<bucket>[a-zA-Z\d\-.]+)/?(?P<prefix>\S*)$")
 
     def __init__(
         self,
@@ -127,14 +482,154 @@ class S3Fetcher(AwsResourceHandler):
         region=None,
         iam_config_object=None,
         client_session_override=None,
+        retries=None,
     ):
         super().__init__(
-            RoleArn, ExternalId, region, iam_config_object, client_session_override
+            RoleArn,
+            ExternalId,
+            region,
+            iam_config_object,
+            client_session_override,
+            retries,
         )
 
     @property
     def client(self):
-        return self.client_session.client("s3")
+        return CLIENTS_POOL.get_client(self.client_session, "s3", retries=self.retries)
+
+    def discover_region(self, s3_bucket: str) -> str | None:
+        """
+        Discovers the bucket region with s3:HeadBucket. S3 returns the region in the x-amz-bucket-region header,
+        including for redirect and access denied responses.
+        """
+        try:
+            with TRACER.span(f"s3://{s3_bucket}", "fetch", action="HeadBucket"):
+                return get_bucket_region(self.client.head_bucket(Bucket=s3_bucket))
+        except ClientError as error:
+            region = get_bucket_region(error.response)
+            if not region:
+                LOG.warning(
+                    f"Failed to discover the region of bucket {s3_bucket}: {error}"
+                )
+            return region
+
+    def client_for(self, s3_bucket: str, bucket_region: str = None):
+        """
+        Returns the pooled client for the region of the bucket, to avoid the redirects from the other regions.
+
+        :param str s3_bucket:
+        :param str bucket_region: The region of the bucket, if known. Otherwise, discovered once and cached.
+        """
+        if not bucket_region:
+            bucket_region = BUCKET_REGIONS.get(s3_bucket)
+        if not bucket_region:
+            bucket_region = self.discover_region(s3_bucket)
+            if not bucket_region:
+                return self.client
+            BUCKET_REGIONS.set(s3_bucket, bucket_region)
+        if bucket_region == self.client_session.region_name:
+            return self.client
+        return CLIENTS_POOL.get_client(
+            self.client_session, "s3", region_name=bucket_region, retries=self.retries
+        )
+
+    @classmethod
+    def parse_location(
+        cls,
+        s3_uri: str = None,
+        s3_bucket: str = None,
+        s3_key: str = None,
+        composex_uri: str = None,
+    ) -> tuple[str, str]:
+        """Returns the bucket name and key of the object, from the S3 URI, Compose-X URI or bucket and key"""
+        if s3_uri and cls.bucket_re.match(s3_uri):
+            s3_bucket = cls.bucket_re.match(s3_uri).group("bucket")
+            s3_key = cls.bucket_re.match(s3_uri).group("key")
+        elif composex_uri and cls.compose_x_re.match(composex_uri):
+            s3_bucket = cls.compose_x_re.match(composex_uri).group("bucket")
+            s3_key = cls.compose_x_re.match(composex_uri).group("key")
+        return s3_bucket, s3_key
+
+    @staticmethod
+    def checksum_sha256(object_r: dict) -> str | None:
+        """
+        Returns the hex encoded SHA256 checksum of the object from the GetObject/HeadObject response, if any.
+        Checksums of multipart uploads objects (checksum of the parts checksums) cannot be used to verify the content.
+        """
+        checksum = object_r.get("ChecksumSHA256")
+        if not checksum or "-" in checksum:
+            return None
+        return base64.b64decode(checksum).hex()
+
+    def get_object(
+        self,
+        s3_bucket: str,
+        s3_key: str,
+        checksum_mode: bool = False,
+        bucket_region: str = None,
+    ) -> dict:
+        """
+        Returns the GetObject response for the file
+
+        :param bool checksum_mode: Whether to retrieve the checksum of the object with it
+        :param str bucket_region: The region of the bucket, if known
+        """
+        object_args = {"Bucket": s3_bucket, "Key": s3_key}
+        if checksum_mode:
+            object_args["ChecksumMode"] = "ENABLED"
+        client = self.client_for(s3_bucket, bucket_region)
+        try:
+            with TRACER.span(f"s3://{s3_bucket}/{s3_key}", "fetch", action="GetObject"):
+                return client.get_object(**object_args)
+        except client.exceptions.NoSuchKey:
+            LOG.error(f"Failed to download the file {s3_key} from bucket {s3_bucket}")
+            raise
+
+    def get_cached_object(
+        self,
+        s3_bucket: str,
+        s3_key: str,
+        checksum_mode: bool = False,
+        bucket_region: str = None,
+    ) -> dict:
+        """
+        Returns the HeadObject response for the file, with the Body read from the shared cache.
+        The object is cached by VersionId, or ETag, so it is only downloaded by one of the composers sharing the cache.
+
+        :param bool checksum_mode: Whether to retrieve the checksum of the object with it
+        :param str bucket_region: The region of the bucket, if known
+        """
+        object_args = {"Bucket": s3_bucket, "Key": s3_key}
+        client = self.client_for(s3_bucket, bucket_region)
+        head_args = dict(object_args)
+        if checksum_mode:
+            head_args["ChecksumMode"] = "ENABLED"
+        with TRACER.span(f"s3://{s3_bucket}/{s3_key}", "fetch", action="HeadObject"):
+            object_r = client.head_object(**head_args)
+        if object_r.get("VersionId"):
+            object_args["VersionId"] = object_r["VersionId"]
+        else:
+            object_args["IfMatch"] = object_r["ETag"]
+
+        def download():
+            return client.get_object(**object_args)["Body"].iter_chunks(CHUNK_SIZE)
+
+        cache_fd = SHARED_CACHE.open(
+            f"s3://{s3_bucket}/{s3_key}",
+            object_r.get("VersionId") or object_r["ETag"],
+            download,
+        )
+        object_r["Body"] = StreamingBody(cache_fd, object_r["ContentLength"])
+        return object_r
+
+    def list_objects(self, s3_bucket: str, prefix: str = "", bucket_region: str = None):
+        """Lists all the objects under the prefix, going through all the pages of ListObjectsV2"""
+        paginator = self.client_for(s3_bucket, bucket_region).get_paginator(
+            "list_objects_v2"
+        )
+        for page in paginator.paginate(Bucket=s3_bucket, Prefix=prefix):
+            for s3_object in page.get("Contents", []):
+                yield s3_object
 
     def get_content(
         self,
@@ -149,19 +644,8 @@ class S3Fetcher(AwsResourceHandler):
         :return: The Stream Body for the file, allowing to do various things
         """
 
-        if s3_uri and self.bucket_re.match(s3_uri):
-            s3_bucket = self.bucket_re.match(s3_uri).group("bucket")
-            s3_key = self.bucket_re.match(s3_uri).group("key")
-        elif composex_uri and self.compose_x_re.match(composex_uri):
-            s3_bucket = self.compose_x_re.match(composex_uri).group("bucket")
-            s3_key = self.compose_x_re.match(composex_uri).group("key")
-        try:
-            file_r = self.client.get_object(Bucket=s3_bucket, Key=s3_key)
-            file_content = file_r["Body"]
-            return file_content
-        except self.client.exceptions.NoSuchKey:
-            LOG.error(f"Failed to download the file {s3_key} from bucket {s3_bucket}")
-            raise
+        s3_bucket, s3_key = self.parse_location(s3_uri, s3_bucket, s3_key, composex_uri)
+        return self.get_object(s3_bucket, s3_key)["Body"]
 
 
 class SsmFetcher(AwsResourceHandler):
@@ -180,11 +664,26 @@ class SsmFetcher(AwsResourceHandler):
         region=None,
         iam_config_object=None,
         client_session_override=None,
+        retries=None,
     ):
         super().__init__(
-            RoleArn, ExternalId, region, iam_config_object, client_session_override
+            RoleArn,
+            ExternalId,
+            region,
+            iam_config_object,
+            client_session_override,
+            retries,
         )
-        self.client = self.client_session.client("ssm")
+        self.client = CLIENTS_POOL.get_client(
+            self.client_session, "ssm", retries=self.retries
+        )
+
+    @classmethod
+    def parse_name(cls, parameter_name: str) -> str:
+        """Returns the parameter name from the ARN, if parameter_name is an ARN"""
+        if cls.arn_re.match(parameter_name):
+            return cls.arn_re.match(parameter_name).group("name")
+        return parameter_name
 
     def get_content(self, parameter_name):
         """
@@ -194,11 +693,29 @@ class SsmFetcher(AwsResourceHandler):
         :param parameter_name:
         :return:
         """
-        if self.arn_re.match(parameter_name):
-            parameter_name = self.arn_re.match(parameter_name).group("name")
-        parameter = self.client.get_parameter(Name=parameter_name, WithDecryption=True)
+        parameter_name = self.parse_name(parameter_name)
+        with TRACER.span(parameter_name, "fetch", action="GetParameter"):
+            parameter = self.client.get_parameter(
+                Name=parameter_name, WithDecryption=True
+            )
         return parameter["Parameter"]["Value"]
 
+    def get_parameters_by_path(self, parameters_path: str, recursive=True) -> dict:
+        """
+        Retrieves all the parameters under the path, going through all the pages of GetParametersByPath
+
+        :return: The value of each parameter, by name
+        """
+        parameters: dict = {}
+        paginator = self.client.get_paginator("get_parameters_by_path")
+        with TRACER.span(parameters_path, "fetch", action="GetParametersByPath"):
+            for page in paginator.paginate(
+                Path=parameters_path, Recursive=recursive, WithDecryption=True
+            ):
+                for parameter in page["Parameters"]:
+                    parameters[parameter["Name"]] = parameter["Value"]
+        return parameters
+
 
 class SecretFetcher(AwsResourceHandler):
     """
@@ -212,18 +729,26 @@ class SecretFetcher(AwsResourceHandler):
         region=None,
         iam_config_object=None,
         client_session_override=None,
+        retries=None,
     ):
         super().__init__(
-            RoleArn, ExternalId, region, iam_config_object, client_session_override
+            RoleArn,
+            ExternalId,
+            region,
+            iam_config_object,
+            client_session_override,
+            retries,
+        )
+        self.client = CLIENTS_POOL.get_client(
+            self.client_session, "secretsmanager", retries=self.retries
         )
-        self.client = self.client_session.client("secretsmanager")
 
-    def get_content(self, secret):
+    @staticmethod
+    def get_params(secret) -> dict:
         """
-        Import the Content of a given parameter
+        The secretsmanager:GetSecretValue parameters for the secret
 
         :param input.SecretDef secret:
-        :return:
         """
         secret_id = expandvars(secret.SecretId)
         params = {"SecretId": secret_id}
@@ -232,6 +757,16 @@ class SecretFetcher(AwsResourceHandler):
             params["VersionId"] = secret.VersionId
         if secret.VersionStage:
             params["VersionStage"] = secret.VersionStage
+        return params
 
-        parameter = self.client.get_secret_value(**params)
+    def get_content(self, secret):
+        """
+        Import the Content of a given parameter
+
+        :param input.SecretDef secret:
+        :return:
+        """
+        params = self.get_params(secret)
+        with TRACER.span(params["SecretId"], "fetch", action="GetSecretValue"):
+            parameter = self.client.get_secret_value(**params)
         return parameter["SecretString"]
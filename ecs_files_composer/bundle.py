@@ -0,0 +1,279 @@
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""
+Module to create and apply pre-rendered bundles of files.
+
+A bundle is a gzip compressed tar archive, which first member is a manifest listing for each file its
+path, mode, owner, group and sha256 digest. The files are retrieved and rendered once (i.e. at deploy time), and
+applying the bundle only requires to retrieve a single object.
+"""
+
+from __future__ import annotations
+
+import copy
+import hashlib
+import io
+import json
+import os
+import shutil
+import stat
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+
+from ecs_files_composer.aws_mgmt import S3Fetcher
+from ecs_files_composer.common import LOG
+from ecs_files_composer.ecs_files_composer import start_jobs
+
+MANIFEST_NAME = "manifest.json"
+BUNDLE_VERSION = 1
+CHUNK_SIZE = 1024 * 1024
+# Members up to this size are read in memory and written by the workers, larger ones are streamed to disk.
+IN_MEMORY_MAX_SIZE = 8 * CHUNK_SIZE
+
+
+class BundleError(Exception):
+    """Raised when the bundle cannot be created or applied"""
+
+
+class BundleIntegrityError(BundleError):
+    """Raised when a bundle file does not match the manifest"""
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file_fd:
+        for chunk in iter(lambda: file_fd.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stage_config(config: dict, staging_dir: str) -> tuple[dict, dict]:
+    """
+    Re-roots all the files of the job into the staging directory. Certificates and commands are excluded.
+
+    :return: the staged job config, and the mapping of staged path to original file definition
+    """
+    staged_config = copy.deepcopy(config)
+    staged_config.pop("certificates", None)
+    staged_files: dict = {}
+    originals: dict = {}
+    for file_path, file_def in (config.get("files") or {}).items():
+        staged_path = path.join(staging_dir, file_path.lstrip("/"))
+        staged_def = copy.deepcopy(file_def)
+        staged_def.pop("commands", None)
+        staged_files[staged_path] = staged_def
+        originals[staged_path] = dict(file_def, path=file_path)
+    staged_config["files"] = staged_files
+    return staged_config, originals
+
+
+def manifest_entry(staged_path: str, file_path: str, mode: str, file_def: dict) -> dict:
+    return {
+        "path": file_path,
+        "mode": mode,
+        "owner": file_def.get("owner", "root"),
+        "group": file_def.get("group", "root"),
+        "size": path.getsize(staged_path),
+        "sha256": file_sha256(staged_path),
+    }
+
+
+def manifest_entries(staged_path: str, file_def: dict) -> list:
+    """
+    Lists the manifest entries of a rendered file. Directories (extracted archives, S3 prefixes, SSM paths) are walked,
+    and each regular file listed with its path relative to the file path, and the mode it was written with.
+
+    :raises BundleError: if a file is neither a regular file nor a directory, i.e. a symlink
+    """
+    if path.isfile(staged_path) and not path.islink(staged_path):
+        return [
+            manifest_entry(
+                staged_path, file_def["path"], file_def.get("mode", "0644"), file_def
+            )
+        ]
+    if not path.isdir(staged_path) or path.islink(staged_path):
+        raise BundleError(f"{file_def['path']} - unsupported file kind")
+    entries: list = []
+    for dir_path, dir_names, file_names in os.walk(staged_path):
+        dir_names.sort()
+        for name in dir_names + sorted(file_names):
+            member_path = path.join(dir_path, name)
+            member_stat = os.lstat(member_path)
+            if stat.S_ISDIR(member_stat.st_mode):
+                continue
+            relative_path = path.relpath(member_path, staged_path)
+            if not stat.S_ISREG(member_stat.st_mode):
+                raise BundleError(
+                    f"{file_def['path']} - {relative_path} - unsupported file kind"
+                )
+            entries.append(
+                manifest_entry(
+                    member_path,
+                    path.join(file_def["path"], relative_path),
+                    f"{stat.S_IMODE(member_stat.st_mode):04o}",
+                    file_def,
+                )
+            )
+    return entries
+
+
+def create_bundle(config: dict, bundle_path: str) -> dict:
+    """
+    Executes the job into a staging directory and packs the resulting files into the bundle.
+    If bundle_path is an S3 URI, the bundle is uploaded to it.
+
+    :param dict config: The job configuration
+    :param str bundle_path: Local path or s3://bucket/key to write the bundle to
+    :return: The bundle manifest
+    """
+    with TemporaryDirectory() as staging_dir:
+        staged_config, originals = stage_config(config, staging_dir)
+        if staged_config["files"]:
+            start_jobs(staged_config)
+        manifest = {"version": BUNDLE_VERSION, "files": []}
+        for staged_path, file_def in originals.items():
+            if not path.exists(staged_path):
+                LOG.warning(f"{file_def['path']} was not rendered. Skipping")
+                continue
+            manifest["files"] += manifest_entries(staged_path, file_def)
+        if S3Fetcher.bucket_re.match(bundle_path):
+            with NamedTemporaryFile(suffix=".tar.gz") as bundle_fd:
+                write_archive(bundle_fd.name, manifest, staging_dir)
+                bucket, key = S3Fetcher.bucket_re.match(bundle_path).groups()
+                S3Fetcher().client_for(bucket).upload_file(bundle_fd.name, bucket, key)
+        else:
+            write_archive(bundle_path, manifest, staging_dir)
+    LOG.info(f"Bundle {bundle_path} created with {len(manifest['files'])} file(s)")
+    return manifest
+
+
+def write_archive(archive_path: str, manifest: dict, staging_dir: str) -> None:
+    with tarfile.open(archive_path, "w:gz") as archive:
+        manifest_content = json.dumps(manifest).encode("utf-8")
+        manifest_info = tarfile.TarInfo(MANIFEST_NAME)
+        manifest_info.size = len(manifest_content)
+        archive.addfile(manifest_info, io.BytesIO(manifest_content))
+        for file in manifest["files"]:
+            archive.add(
+                path.join(staging_dir, file["path"].lstrip("/")),
+                arcname=file["path"].lstrip("/"),
+                recursive=False,
+            )
+
+
+def set_file_attributes(file_path: str, file: dict) -> None:
+    os.chmod(file_path, int(file["mode"], 8))
+    owner = int(file["owner"]) if file["owner"].isdigit() else file["owner"]
+    group = int(file["group"]) if file["group"].isdigit() else file["group"]
+    try:
+        shutil.chown(file_path, owner, group)
+    except (OSError, LookupError) as error:
+        LOG.error(f"{file['path']} - Failed to set owner {owner}:{group} - {error}")
+
+
+class BundleWriter:
+    """
+    Writes the files of the bundle, checking their integrity against the manifest.
+    Each file is written to a temporary file in the target folder, and only moved into place once the digest matched.
+    """
+
+    def __init__(self, manifest: dict, root_dir: str = "/"):
+        self.root_dir = root_dir
+        self.files = {
+            file["path"].lstrip("/"): file for file in manifest.get("files", [])
+        }
+
+    def target_path(self, file: dict) -> str:
+        return path.join(self.root_dir, file["path"].lstrip("/"))
+
+    def create_dirs(self) -> None:
+        for dir_path in sorted(
+            {path.dirname(self.target_path(file)) for file in self.files.values()}
+        ):
+            os.makedirs(dir_path, exist_ok=True)
+
+    def write(self, file: dict, chunks) -> None:
+        target_path = self.target_path(file)
+        digest = hashlib.sha256()
+        with NamedTemporaryFile(
+            dir=path.dirname(target_path), prefix=".bundle-", delete=False
+        ) as tmp_fd:
+            try:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    tmp_fd.write(chunk)
+            except BaseException:
+                os.unlink(tmp_fd.name)
+                raise
+        if digest.hexdigest() != file["sha256"]:
+            os.unlink(tmp_fd.name)
+            raise BundleIntegrityError(
+                f"{file['path']} - sha256 mismatch",
+                digest.hexdigest(),
+                file["sha256"],
+            )
+        set_file_attributes(tmp_fd.name, file)
+        os.replace(tmp_fd.name, target_path)
+        LOG.info(f"{file['path']} applied from bundle")
+
+
+def apply_bundle(
+    bundle_source: str,
+    root_dir: str = "/",
+    max_workers: int = 4,
+    fetcher: S3Fetcher = None,
+) -> dict:
+    """
+    Extracts the bundle, streaming the decompression, writing the files in parallel and verifying their integrity.
+
+    :param str bundle_source: Local path or s3://bucket/key of the bundle
+    :param str root_dir: Folder to extract the files into. Defaults to /
+    :param int max_workers: Number of threads writing the files
+    :param S3Fetcher fetcher: Fetcher to use to retrieve the bundle from S3
+    :return: The bundle manifest
+    """
+    if S3Fetcher.bucket_re.match(bundle_source):
+        bundle_fd = (fetcher or S3Fetcher()).get_content(s3_uri=bundle_source)
+    else:
+        bundle_fd = open(bundle_source, "rb")
+    try:
+        with tarfile.open(
+            fileobj=bundle_fd, mode="r|gz"
+        ) as archive, ThreadPoolExecutor(max_workers=max_workers) as executor:
+            members = iter(archive)
+            manifest_member = next(members, None)
+            if not manifest_member or manifest_member.name != MANIFEST_NAME:
+                raise BundleIntegrityError(
+                    f"{bundle_source} - {MANIFEST_NAME} must be the first member"
+                )
+            manifest = json.load(archive.extractfile(manifest_member))
+            writer = BundleWriter(manifest, root_dir)
+            writer.create_dirs()
+            futures = []
+            applied = set()
+            for member in members:
+                if not member.isfile() or member.name not in writer.files:
+                    raise BundleIntegrityError(
+                        f"{bundle_source} - {member.name} is not in the manifest"
+                    )
+                file = writer.files[member.name]
+                member_fd = archive.extractfile(member)
+                if member.size <= IN_MEMORY_MAX_SIZE:
+                    futures.append(
+                        executor.submit(writer.write, file, [member_fd.read()])
+                    )
+                else:
+                    writer.write(file, iter(lambda: member_fd.read(CHUNK_SIZE), b""))
+                applied.add(member.name)
+            for future in futures:
+                future.result()
+    finally:
+        bundle_fd.close()
+    missing = set(writer.files.keys()) - applied
+    if missing:
+        raise BundleIntegrityError(f"{bundle_source} - missing files", missing)
+    LOG.info(f"Bundle {bundle_source} applied - {len(applied)} file(s)")
+    return manifest
@@ -8,18 +8,403 @@ from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from ecs_files_composer.input import Model as Job
 
-import pathlib
+import datetime
+import ipaddress
+import json
 import socket
 from dataclasses import asdict
-from os import path
+from enum import Enum
+from os import environ, path
+from tempfile import TemporaryDirectory
 from typing import Any
 
+from botocore.response import StreamingBody
 from compose_x_common.compose_x_common import keyisset
-from dacite import from_dict
-from OpenSSL import crypto
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.hazmat.primitives.serialization import pkcs12
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+from dacite import Config, from_dict
 
+from ecs_files_composer.aws_mgmt import SecretFetcher, SsmFetcher
+from ecs_files_composer.common import LOG
+from ecs_files_composer.envsubst import expandvars
 from ecs_files_composer.files_mgmt import File
-from ecs_files_composer.input import X509CertDef
+from ecs_files_composer.input import (
+    CaDef,
+    KeystoreDef,
+    KeystoreType,
+    KeyType,
+    PasswordDef,
+    SourceDef,
+    X509CertDef,
+)
+from ecs_files_composer.tracing import TRACER, traced
+
+try:
+    import jks
+except ImportError:
+    jks = None
+
+
+def get_password(password: PasswordDef, iam_override=None, retries=None) -> str | None:
+    """
+    Retrieves the password from the environment variable, SSM parameter or secret
+
+    :param ecs_files_composer.input.PasswordDef password:
+    :param ecs_files_composer.input.IamOverrideDef iam_override: The job IAM override
+    :param ecs_files_composer.input.RetriesDef retries: The job retries settings
+    """
+    if not password:
+        return None
+    if password.EnvVar:
+        if password.EnvVar not in environ:
+            raise KeyError(f"Environment variable {password.EnvVar} is not set")
+        return environ[password.EnvVar]
+    if password.Ssm:
+        return SsmFetcher(
+            iam_config_object=password.Ssm.IamOverride or iam_override,
+            retries=password.Ssm.Retries or retries,
+        ).get_content(expandvars(password.Ssm.ParameterName))
+    if password.Secret:
+        value = SecretFetcher(
+            iam_config_object=password.Secret.IamOverride or iam_override,
+            retries=password.Secret.Retries or retries,
+        ).get_content(password.Secret)
+        if password.Secret.JsonKey:
+            return json.loads(value)[password.Secret.JsonKey]
+        return value
+    return None
+
+
+def get_encryption(password: str = None):
+    if password:
+        return serialization.BestAvailableEncryption(password.encode("utf-8"))
+    return serialization.NoEncryption()
+
+
+def pkcs12_keystore(alias: str, key, cert, password: str = None, chain=None) -> bytes:
+    """
+    :param str alias: Friendly name of the key entry
+    :param key: The cryptography private key
+    :param cert: The cryptography certificate
+    :param str password: The keystore password. Without a password, the keystore is not encrypted.
+    :param list chain: The CA certificates of the certificate chain
+    """
+    return pkcs12.serialize_key_and_certificates(
+        alias.encode("utf-8"), key, cert, chain or None, get_encryption(password)
+    )
+
+
+def trusted_aliases(alias: str, certs: list) -> list:
+    return [alias if not index else f"{alias}-{index}" for index in range(len(certs))]
+
+
+def pkcs12_truststore(alias: str, certs: list, password: str = None) -> bytes:
+    """PKCS12 truststore, with the certificates marked as trusted for Java"""
+    return pkcs12.serialize_java_truststore(
+        [
+            pkcs12.PKCS12Certificate(cert, cert_alias.encode("utf-8"))
+            for cert, cert_alias in zip(certs, trusted_aliases(alias, certs))
+        ],
+        get_encryption(password),
+    )
+
+
+def jks_keystore(alias: str, key, cert, password: str, chain=None) -> bytes:
+    key_der = key.private_bytes(
+        serialization.Encoding.DER,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    entry = jks.PrivateKeyEntry.new(
+        alias,
+        [
+            chain_cert.public_bytes(serialization.Encoding.DER)
+            for chain_cert in [cert] + (chain or [])
+        ],
+        key_der,
+        "pkcs8",
+    )
+    return jks.KeyStore.new("jks", [entry]).saves(password)
+
+
+def jks_truststore(alias: str, certs: list, password: str) -> bytes:
+    entries = [
+        jks.TrustedCertEntry.new(
+            cert_alias, cert.public_bytes(serialization.Encoding.DER)
+        )
+        for cert, cert_alias in zip(certs, trusted_aliases(alias, certs))
+    ]
+    return jks.KeyStore.new("jks", entries).saves(password)
+
+
+def build_keystore(
+    keystore: KeystoreDef,
+    key,
+    cert,
+    password: str = None,
+    trusted: bool = False,
+    chain: list = None,
+) -> bytes:
+    """
+    Builds the keystore content, with the private key and certificate, or only the trusted certificates
+
+    :param ecs_files_composer.input.KeystoreDef keystore:
+    :param key: The cryptography private key
+    :param cert: The cryptography certificate
+    :param str password:
+    :param bool trusted: Whether to build a truststore, trusting the CA certificates or the certificate itself
+    :param list chain: The CA certificates which signed the certificate
+    """
+    trusted_certs = chain or [cert]
+    if KeystoreType(keystore.type) == KeystoreType.JKS:
+        if jks is None:
+            raise ImportError(
+                "JKS keystores require pyjks. Install ecs_files_composer[jks]"
+            )
+        if not password:
+            raise ValueError(f"{keystore.fileName} - JKS keystores require a password")
+        if trusted:
+            return jks_truststore(keystore.alias, trusted_certs, password)
+        return jks_keystore(keystore.alias, key, cert, password, chain)
+    if trusted:
+        return pkcs12_truststore(keystore.alias, trusted_certs, password)
+    return pkcs12_keystore(keystore.alias, key, cert, password, chain)
+
+
+def generate_private_key(key_type: KeyType):
+    """RSA 4096 bits, or the much faster to generate EC P-256, private key"""
+    if KeyType(key_type) == KeyType.EC:
+        return ec.generate_private_key(ec.SECP256R1())
+    return rsa.generate_private_key(public_exponent=65537, key_size=4096)
+
+
+def signature_hash(key):
+    if isinstance(key, ec.EllipticCurvePrivateKey):
+        return hashes.SHA256()
+    return hashes.SHA512()
+
+
+def key_matches(key, cert) -> bool:
+    public_format = (
+        serialization.Encoding.DER,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+    return key.public_key().public_bytes(
+        *public_format
+    ) == cert.public_key().public_bytes(*public_format)
+
+
+def remaining_validity(cert) -> float:
+    return (
+        cert.not_valid_after_utc - datetime.datetime.now(datetime.timezone.utc)
+    ).total_seconds()
+
+
+def to_pem(cert) -> str:
+    return cert.public_bytes(serialization.Encoding.PEM).decode("utf-8")
+
+
+def key_to_pem(key) -> str:
+    return key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode("utf-8")
+
+
+def get_source_content(source: SourceDef, iam_override=None, retries=None) -> bytes:
+    """
+    Retrieves the content of the source, i.e. the CA key in Secrets Manager, with the files sources handlers
+
+    :param ecs_files_composer.input.SourceDef source:
+    :param ecs_files_composer.input.IamOverrideDef iam_override:
+    :param ecs_files_composer.input.RetriesDef retries:
+    """
+    with TemporaryDirectory() as tmp_dir:
+        source_file = File(path=path.join(tmp_dir, "content"), source=source)
+        retrieved, _ = source_file.handle_sources(iam_override, None, retries)
+        if not retrieved:
+            raise ValueError(f"Failed to retrieve content from {source}")
+        content = source_file.content
+        if content is None:
+            with open(source_file.path, "rb") as content_fd:
+                return content_fd.read()
+        if isinstance(content, StreamingBody):
+            return content.read()
+        return content.encode("utf-8") if isinstance(content, str) else content
+
+
+def to_def(data_class, value):
+    """The definitions nested in the certificates definitions are dicts, once copied with asdict"""
+    if isinstance(value, dict):
+        return from_dict(data_class=data_class, data=value, config=Config(cast=[Enum]))
+    return value
+
+
+class CertificateAuthority(CaDef):
+    """
+    Certificate authority of the job, generated once or loaded from sources, signing all the x509 certificates.
+    """
+
+    def __init__(self, **data: Any):
+        super().__init__(**data)
+        self.key = None
+        self.cert = None
+        self.chain: list = []
+        self.certSource = to_def(SourceDef, self.certSource)
+        self.keySource = to_def(SourceDef, self.keySource)
+        self.keyPassword = to_def(PasswordDef, self.keyPassword)
+
+    @property
+    def subject(self) -> x509.Name:
+        return x509.Name(
+            [
+                x509.NameAttribute(NameOID.ORGANIZATION_NAME, self.organizationName),
+                x509.NameAttribute(NameOID.COMMON_NAME, self.commonName),
+            ]
+        )
+
+    def file_path(self, file_name: str = None) -> str | None:
+        if not self.dir_path or not file_name:
+            return None
+        return path.abspath(path.join(self.dir_path, file_name))
+
+    def load_from_sources(self, iam_override=None, retries=None) -> None:
+        """Loads the CA certificate, followed by its chain, and the CA key from their sources"""
+        if not self.keySource:
+            raise ValueError("The CA keySource must be set with the certSource")
+        self.chain = x509.load_pem_x509_certificates(
+            get_source_content(self.certSource, iam_override, retries)
+        )
+        password = get_password(self.keyPassword, iam_override, retries)
+        self.key = serialization.load_pem_private_key(
+            get_source_content(self.keySource, iam_override, retries),
+            password.encode("utf-8") if password else None,
+        )
+        self.cert = self.chain[0]
+        if not key_matches(self.key, self.cert):
+            raise ValueError("The CA key does not match the CA certificate")
+
+    def load_existing(self) -> bool:
+        """Loads the CA previously written to dir_path, if still valid long enough"""
+        cert_path = self.file_path(self.certFileName)
+        key_path = self.file_path(self.keyFileName)
+        if not cert_path or not key_path:
+            return False
+        try:
+            with open(cert_path, "rb") as cert_fd:
+                cert = x509.load_pem_x509_certificate(cert_fd.read())
+            with open(key_path, "rb") as key_fd:
+                key = serialization.load_pem_private_key(key_fd.read(), None)
+        except (OSError, ValueError, TypeError) as error:
+            LOG.info(f"{cert_path} - Cannot load existing CA: {error}")
+            return False
+        if (
+            not key_matches(key, cert)
+            or cert.subject != self.subject
+            or remaining_validity(cert) < self.minRemainingValidityInSeconds
+        ):
+            LOG.info(f"{cert_path} - The existing CA cannot be reused")
+            return False
+        LOG.info(f"{cert_path} - Reusing the existing CA")
+        self.key, self.cert, self.chain = key, cert, [cert]
+        return True
+
+    def generate(self) -> None:
+        with TRACER.span(
+            self.dir_path or "CA", "keygen", key_type=KeyType(self.keyType).value
+        ):
+            self.key = generate_private_key(self.keyType)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.cert = (
+            x509.CertificateBuilder()
+            .subject_name(self.subject)
+            .issuer_name(self.subject)
+            .public_key(self.key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now)
+            .not_valid_after(
+                now + datetime.timedelta(seconds=int(self.validityEndInSeconds))
+            )
+            .add_extension(x509.BasicConstraints(ca=True, path_length=0), critical=True)
+            .add_extension(
+                x509.KeyUsage(
+                    digital_signature=True,
+                    content_commitment=False,
+                    key_encipherment=False,
+                    data_encipherment=False,
+                    key_agreement=False,
+                    key_cert_sign=True,
+                    crl_sign=True,
+                    encipher_only=False,
+                    decipher_only=False,
+                ),
+                critical=True,
+            )
+            .add_extension(
+                x509.SubjectKeyIdentifier.from_public_key(self.key.public_key()),
+                critical=False,
+            )
+            .sign(self.key, signature_hash(self.key))
+        )
+        self.chain = [self.cert]
+
+    def init(self, iam_override=None, retries=None) -> None:
+        if self.certSource:
+            self.load_from_sources(iam_override, retries)
+        elif not (self.reuseExisting and self.load_existing()):
+            self.generate()
+
+    def sign(self, builder: x509.CertificateBuilder):
+        """Signs the certificate"""
+        return (
+            builder.issuer_name(self.cert.subject)
+            .add_extension(
+                x509.AuthorityKeyIdentifier.from_issuer_public_key(
+                    self.key.public_key()
+                ),
+                critical=False,
+            )
+            .sign(self.key, signature_hash(self.key))
+        )
+
+    def is_issuer(self, cert) -> bool:
+        """Whether the certificate was signed by the CA"""
+        try:
+            cert.verify_directly_issued_by(self.cert)
+        except (ValueError, TypeError, InvalidSignature):
+            return False
+        return True
+
+    @property
+    def bundle_content(self) -> str:
+        return "".join(to_pem(cert) for cert in self.chain)
+
+    def files(self) -> list:
+        """The CA files to write"""
+        contents = [
+            (self.certFileName, to_pem(self.cert), "0644"),
+            (self.bundleFileName, self.bundle_content, "0644"),
+            (self.keyFileName, key_to_pem(self.key), "0600"),
+        ]
+        return [
+            from_dict(
+                data_class=File,
+                data={
+                    "content": content,
+                    "path": self.file_path(file_name),
+                    "mode": mode,
+                    "owner": self.owner,
+                    "group": self.group,
+                },
+            )
+            for file_name, content, mode in contents
+            if self.file_path(file_name)
+        ]
 
 
 class X509Certificate(X509CertDef):
@@ -29,7 +414,7 @@ class X509Certificate(X509CertDef):
 
     def __init__(self, **data: Any):
         super().__init__(**data)
-        self.key: crypto.PKey = None
+        self.key = None
         self.cert = None
         self.key_content = None
         self.cert_content = None
@@ -37,52 +422,167 @@ class X509Certificate(X509CertDef):
         self.key_file = None
         self.cert_file_path = None
         self.key_file_path = None
-        self.keystore = None
+        self.keystore_file = None
+        self.truststore_file = None
+        self.ca: CertificateAuthority = None
+        self.keystore = to_def(KeystoreDef, self.keystore)
+        self.truststore = to_def(KeystoreDef, self.truststore)
 
     def init_cert_paths(self):
         self.cert_file_path = path.abspath(f"{self.dir_path}/{self.certFileName}")
         self.key_file_path = path.abspath(f"{self.dir_path}/{self.keyFileName}")
-        print(f"Creating {self.dir_path} folder")
-        dir_path = pathlib.Path(path.abspath(self.dir_path))
-        dir_path.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def key_type(self) -> KeyType:
+        """EC keys for the certificates signed by the CA, RSA for self-signed ones, unless set"""
+        if self.keyType:
+            return KeyType(self.keyType)
+        return KeyType.EC if self.ca else KeyType.RSA
 
     def generate_key(self):
-        self.key = crypto.PKey()
-        self.key.generate_key(crypto.TYPE_RSA, 4096)
+        with TRACER.span(self.dir_path, "keygen", key_type=self.key_type.value):
+            self.key = generate_private_key(self.key_type)
 
     def set_common_name(self):
         if self.commonName is None:
             self.commonName = socket.gethostname()
 
-    def generate_cert(self):
+    @property
+    def subject(self) -> x509.Name:
         if not self.commonName:
             self.set_common_name()
-        self.cert = crypto.X509()
-        self.cert.get_subject().C = self.countryName
-        self.cert.get_subject().ST = self.stateOrProvinceName
-        self.cert.get_subject().L = self.localityName
-        self.cert.get_subject().O = self.organizationName
-        self.cert.get_subject().OU = self.organizationUnitName
-        self.cert.get_subject().CN = self.commonName
-        self.cert.get_subject().emailAddress = self.emailAddress
-        self.cert.set_serial_number(0)
-        self.cert.gmtime_adj_notBefore(0)
-        self.cert.gmtime_adj_notAfter(int(self.validityEndInSeconds))
-        self.cert.set_issuer(self.cert.get_subject())
-        self.cert.set_pubkey(self.key)
-        self.cert.sign(self.key, "sha512")
+        return x509.Name(
+            [
+                x509.NameAttribute(NameOID.COUNTRY_NAME, self.countryName),
+                x509.NameAttribute(
+                    NameOID.STATE_OR_PROVINCE_NAME, self.stateOrProvinceName
+                ),
+                x509.NameAttribute(NameOID.LOCALITY_NAME, self.localityName),
+                x509.NameAttribute(NameOID.ORGANIZATION_NAME, self.organizationName),
+                x509.NameAttribute(
+                    NameOID.ORGANIZATIONAL_UNIT_NAME, self.organizationUnitName
+                ),
+                x509.NameAttribute(NameOID.COMMON_NAME, self.commonName),
+                x509.NameAttribute(NameOID.EMAIL_ADDRESS, self.emailAddress),
+            ]
+        )
+
+    @property
+    def subject_alt_names(self) -> list:
+        """The SANs of the definition, as IP addresses or DNS names"""
+        names: list = []
+        for name in self.subjectAltNames or []:
+            try:
+                names.append(x509.IPAddress(ipaddress.ip_address(name)))
+            except ValueError:
+                names.append(x509.DNSName(name))
+        return names
+
+    def generate_cert(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        builder = (
+            x509.CertificateBuilder()
+            .subject_name(self.subject)
+            .public_key(self.key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now)
+            .not_valid_after(
+                now + datetime.timedelta(seconds=int(self.validityEndInSeconds))
+            )
+        )
+        if self.subject_alt_names:
+            builder = builder.add_extension(
+                x509.SubjectAlternativeName(self.subject_alt_names), critical=False
+            )
+        if not self.ca:
+            self.cert = builder.issuer_name(self.subject).sign(
+                self.key, signature_hash(self.key)
+            )
+            return
+        builder = (
+            builder.add_extension(
+                x509.BasicConstraints(ca=False, path_length=None), critical=True
+            )
+            .add_extension(
+                x509.ExtendedKeyUsage(
+                    [ExtendedKeyUsageOID.SERVER_AUTH, ExtendedKeyUsageOID.CLIENT_AUTH]
+                ),
+                critical=False,
+            )
+            .add_extension(
+                x509.SubjectKeyIdentifier.from_public_key(self.key.public_key()),
+                critical=False,
+            )
+        )
+        self.cert = self.ca.sign(builder)
+
+    def load_existing(self) -> bool:
+        """
+        Loads the existing key and certificate, if they can be reused: the key matches the certificate,
+        which has the subject and SANs of the definition, and is valid for at least minRemainingValidityInSeconds.
+
+        :return: Whether the existing key and certificate are reused
+        """
+        if not path.exists(self.key_file_path) or not path.exists(self.cert_file_path):
+            return False
+        try:
+            with open(self.key_file_path, "rb") as key_fd:
+                key = serialization.load_pem_private_key(key_fd.read(), None)
+            with open(self.cert_file_path, "rb") as cert_fd:
+                cert = x509.load_pem_x509_certificate(cert_fd.read())
+        except (OSError, ValueError, TypeError) as error:
+            LOG.info(
+                f"{self.cert_file_path} - Cannot load existing certificate: {error}"
+            )
+            return False
+        if not key_matches(key, cert):
+            LOG.info(f"{self.cert_file_path} - The key does not match the certificate")
+            return False
+        if self.keyType and not isinstance(
+            key,
+            (
+                ec.EllipticCurvePrivateKey
+                if self.key_type == KeyType.EC
+                else rsa.RSAPrivateKey
+            ),
+        ):
+            LOG.info(f"{self.cert_file_path} - The key type changed")
+            return False
+        if (self.ca and not self.ca.is_issuer(cert)) or (
+            not self.ca and cert.issuer != cert.subject
+        ):
+            LOG.info(f"{self.cert_file_path} - The certificate issuer changed")
+            return False
+        if cert.subject != self.subject:
+            LOG.info(f"{self.cert_file_path} - The subject changed")
+            return False
+        try:
+            existing_names = cert.extensions.get_extension_for_class(
+                x509.SubjectAlternativeName
+            ).value
+        except x509.ExtensionNotFound:
+            existing_names = []
+        if set(existing_names) != set(self.subject_alt_names):
+            LOG.info(f"{self.cert_file_path} - The subject alternative names changed")
+            return False
+        remaining = remaining_validity(cert)
+        if remaining < self.minRemainingValidityInSeconds:
+            LOG.info(
+                f"{self.cert_file_path} - The certificate expires in {int(remaining)}s"
+            )
+            return False
+        LOG.info(f"{self.cert_file_path} - Reusing the existing certificate")
+        self.key = key
+        self.cert = cert
+        return True
 
     def generate_cert_content(self):
-        if not self.key:
+        if not self.key and not (self.reuseExisting and self.load_existing()):
             self.generate_key()
         if not self.cert:
             self.generate_cert()
-        self.cert_content = crypto.dump_certificate(
-            crypto.FILETYPE_PEM, self.cert
-        ).decode("utf-8")
-        self.key_content = crypto.dump_privatekey(crypto.FILETYPE_PEM, self.key).decode(
-            "utf-8"
-        )
+        self.cert_content = to_pem(self.cert)
+        self.key_content = key_to_pem(self.key)
 
     def set_cert_files(self):
         if not self.cert_content or not self.key_content:
@@ -109,20 +609,90 @@ class X509Certificate(X509CertDef):
             },
         )
 
+    def store_file(self, keystore: KeystoreDef, content: bytes) -> File:
+        keystore_file = from_dict(
+            data_class=File,
+            data={
+                "path": path.abspath(f"{self.dir_path}/{keystore.fileName}"),
+                "mode": "0600",
+                "owner": self.owner,
+                "group": self.group,
+            },
+        )
+        keystore_file.content = content
+        return keystore_file
 
+    def set_keystores_files(self, iam_override=None, retries=None):
+        """
+        Creates the keystore and truststore files in memory, from the key and certificate,
+        without calling keytool or openssl.
+
+        :param ecs_files_composer.input.IamOverrideDef iam_override: The job IAM override, for the passwords
+        :param ecs_files_composer.input.RetriesDef retries: The job retries settings
+        """
+        if not self.cert_content or not self.key_content:
+            self.generate_cert_content()
+        key = self.key
+        cert = self.cert
+        if self.keystore:
+            self.keystore_file = self.store_file(
+                self.keystore,
+                build_keystore(
+                    self.keystore,
+                    key,
+                    cert,
+                    get_password(self.keystore.password, iam_override, retries),
+                    chain=self.ca.chain if self.ca else None,
+                ),
+            )
+        if self.truststore:
+            self.truststore_file = self.store_file(
+                self.truststore,
+                build_keystore(
+                    self.truststore,
+                    key,
+                    cert,
+                    get_password(self.truststore.password, iam_override, retries),
+                    trusted=True,
+                    chain=self.ca.chain if self.ca else None,
+                ),
+            )
+
+
+def add_certificate_file(job, file_path: str, file) -> None:
+    """Adds the file to the job files. Certificates files are critical, as applications usually need them to start."""
+    if not job.files:
+        job.files = {}
+    file.critical = True
+    job.files[file_path] = file
+
+
+@traced("certificates", "certificates")
 def process_x509_certs(job):
-    """Processes x509 certificates"""
-    if not job.certificates or not job.certificates.x509:
+    """Processes x509 certificates, all signed by the job CA if defined"""
+    if not job.certificates:
+        return
+    ca = None
+    if job.certificates.ca:
+        ca = CertificateAuthority(**asdict(job.certificates.ca))
+        ca.init(job.IamOverride, job.Retries)
+        job.certificates.ca = ca
+        for ca_file in ca.files():
+            add_certificate_file(job, ca_file.path, ca_file)
+    if not job.certificates.x509:
         return
     for cert_path, cert_def in job.certificates.x509.items():
         cert_obj = X509Certificate(
             **asdict(cert_def),
         )
+        cert_obj.ca = ca
         cert_obj.dir_path = cert_path
         cert_obj.init_cert_paths()
         cert_obj.set_cert_files()
+        cert_obj.set_keystores_files(job.IamOverride, job.Retries)
         job.certificates.x509[cert_path] = cert_obj
-        if not job.files:
-            job.files = {}
-        job.files[cert_obj.cert_file.path] = cert_obj.cert_file
-        job.files[cert_obj.key_file_path] = cert_obj.key_file
+        add_certificate_file(job, cert_obj.cert_file.path, cert_obj.cert_file)
+        add_certificate_file(job, cert_obj.key_file_path, cert_obj.key_file)
+        for store_file in [cert_obj.keystore_file, cert_obj.truststore_file]:
+            if store_file:
+                add_certificate_file(job, store_file.path, store_file)
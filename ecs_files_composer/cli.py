@@ -2,51 +2,133 @@
 # Copyright 2020-2022 John Mille<john@compose-x.io>
 
 """Console script for ecs_files_composer."""
+
+from __future__ import annotations
+
 import argparse
+import os
 import sys
-from os import environ
+from os import environ, path
 
+import yaml
+from yaml import Loader
+
+from ecs_files_composer.aws_mgmt import BUCKET_REGIONS, CREDENTIALS_CACHE, S3Fetcher
+from ecs_files_composer.bundle import apply_bundle, create_bundle
 from ecs_files_composer.common import LOG
-from ecs_files_composer.ecs_files_composer import init_config, start_jobs
+from ecs_files_composer.ecs_files_composer import (
+    PHASES,
+    JobResult,
+    init_config,
+    merge_configs,
+    run_jobs,
+    start_jobs,
+)
 from ecs_files_composer.jinja2_functions.aws import dump_ecs_details
+from ecs_files_composer.plan import build_plan
+from ecs_files_composer.profiling import Profiler
+from ecs_files_composer.server import serve, submit_jobs
+from ecs_files_composer.shared_cache import SHARED_CACHE
+from ecs_files_composer.tracing import TRACER
+
+# Options of the manifest entries, and the matching init_config argument
+MANIFEST_SOURCES = {
+    "from-file": "file_path",
+    "from-env-var": "env_var",
+    "from-ssm": "ssm_parameter",
+    "from-s3": "s3_config",
+    "from-secrets": "secret_config",
+}
+
+
+class ConfigSourceAction(argparse.Action):
+    """Appends the configuration source, with the init_config argument to use, keeping the order of the options"""
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        sources = list(getattr(namespace, self.dest) or [])
+        sources.append((self.const, values))
+        setattr(namespace, self.dest, sources)
+
+
+def load_manifest(manifest_path: str) -> tuple[list, bool]:
+    """
+    Loads the manifest listing the configurations to execute.
+
+    :return: the list of configurations sources, and whether to merge them into a single job
+    """
+    with open(manifest_path) as manifest_fd:
+        manifest = yaml.load(manifest_fd, Loader=Loader)
+    sources: list = []
+    for count, entry in enumerate(manifest.get("configs", [])):
+        options = [key for key in MANIFEST_SOURCES if key in entry]
+        if len(options) != 1:
+            raise ValueError(
+                f"{manifest_path} - configs[{count}] must define one of",
+                list(MANIFEST_SOURCES.keys()),
+            )
+        sources.append(
+            {
+                "name": entry.get("name", entry[options[0]]),
+                MANIFEST_SOURCES[options[0]]: entry[options[0]],
+                "decode_base64": entry.get("decode-base64", False),
+                "context": entry.get("context", "jinja2"),
+            }
+        )
+    return sources, manifest.get("merge", False)
 
 
 def main():
     """Console script for ecs_files_composer."""
     parser = argparse.ArgumentParser()
-    options = parser.add_mutually_exclusive_group()
-    options.add_argument(
+    parser.add_argument(
         "-f",
         "--from-file",
-        help="Configuration for execution from a file",
-        type=str,
-        required=False,
-        dest="file_path",
+        help="Configuration for execution from a file. Can be repeated",
+        action=ConfigSourceAction,
+        const="file_path",
+        dest="config_sources",
     )
-    options.add_argument(
+    parser.add_argument(
         "-e",
         "--from-env-var",
-        dest="env_var",
-        required=False,
-        help="Configuration for execution is in an environment variable",
+        help="Configuration for execution is in an environment variable. Can be repeated",
+        action=ConfigSourceAction,
+        const="env_var",
+        dest="config_sources",
     )
-    options.add_argument(
+    parser.add_argument(
         "--from-ssm",
-        dest="ssm_config",
-        help="Configuration for execution is in an SSM Parameter",
-        required=False,
+        help="Configuration for execution is in an SSM Parameter. Can be repeated",
+        action=ConfigSourceAction,
+        const="ssm_parameter",
+        dest="config_sources",
     )
-    options.add_argument(
+    parser.add_argument(
         "--from-s3",
-        dest="s3_config",
-        required=False,
-        help="Configuration for execution is in an S3",
+        help="Configuration for execution is in an S3. Can be repeated",
+        action=ConfigSourceAction,
+        const="s3_config",
+        dest="config_sources",
     )
-    options.add_argument(
+    parser.add_argument(
         "--from-secrets",
-        dest="secret_config",
+        help="Configuration for execution is in an AWS Secrets Manager. Can be repeated",
+        action=ConfigSourceAction,
+        const="secret_config",
+        dest="config_sources",
+    )
+    parser.add_argument(
+        "--manifest",
+        dest="manifest",
         required=False,
-        help="Configuration for execution is in an AWS Secrets Manager",
+        type=str,
+        help="YAML/JSON file listing the configurations to execute, in addition to the --from-* options",
+    )
+    parser.add_argument(
+        "--merge",
+        action="store_true",
+        default=False,
+        help="When using several configurations, merges them into a single job",
     )
     parser.add_argument(
         "--role-arn",
@@ -62,7 +144,7 @@ def main():
     )
     parser.add_argument(
         "--context",
-        help="Indicate which context to use (valid: jinja2|plain). Default is jinja2",
+        help="Indicate which context to use (valid: jinja2|envsubst|plain). Default is jinja2",
         required=False,
         default="jinja2",
     )
@@ -86,66 +168,367 @@ def main():
         help="Display generated config",
         default=False,
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        required=False,
+        type=str,
+        default=environ.get("FILES_COMPOSER_CACHE_DIR", None),
+        help="Directory (preferably tmpfs) to persist caches, such as IAM credentials, across executions."
+        " Defaults to FILES_COMPOSER_CACHE_DIR",
+    )
+    parser.add_argument(
+        "--shared-cache-dir",
+        dest="shared_cache_dir",
+        required=False,
+        type=str,
+        default=environ.get("FILES_COMPOSER_SHARED_CACHE_DIR", None),
+        help="Host directory shared by the composers of the instance, to download the S3 and URL sources only once."
+        " Defaults to FILES_COMPOSER_SHARED_CACHE_DIR",
+    )
+    parser.add_argument(
+        "--shared-cache-max-size",
+        dest="shared_cache_max_size",
+        required=False,
+        type=int,
+        help="Size, in MiB, above which the least recently used entries of the shared cache are evicted."
+        " Defaults to 1024",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        default=False,
+        help="Displays the execution plan of the job (API calls, IAM contexts, files) without executing it",
+    )
+    parser.add_argument(
+        "--plan-size",
+        action="store_true",
+        default=False,
+        help="With --plan, estimates the size of S3 and URL sources using HEAD requests",
+    )
+    parser.add_argument(
+        "--bundle-to",
+        dest="bundle_to",
+        required=False,
+        type=str,
+        help="Retrieves and renders the files (certificates and commands excluded), and packs them into a bundle"
+        " at the given path or s3://bucket/key, instead of writing them",
+    )
+    parser.add_argument(
+        "--apply-bundle",
+        dest="apply_bundle",
+        required=False,
+        type=str,
+        help="Writes the files from a bundle (path or s3://bucket/key) created with --bundle-to",
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        default=False,
+        help="Retrieves and renders all the files concurrently, using asyncio. Requires ecs_files_composer[async]",
+    )
+    parser.add_argument(
+        "--server",
+        dest="server_socket",
+        required=False,
+        type=str,
+        help="Runs as a server, executing the jobs submitted to the given Unix socket path",
+    )
+    parser.add_argument(
+        "--submit",
+        dest="submit_socket",
+        required=False,
+        type=str,
+        help="Submits the configurations to the server listening on the given Unix socket path",
+    )
+    parser.add_argument(
+        "--trace-out",
+        dest="trace_out",
+        required=False,
+        type=str,
+        help="Writes the timeline of the execution to the given file, in the Chrome Trace Event format"
+        " (to open with Perfetto or chrome://tracing)",
+    )
+    parser.add_argument(
+        "--ready-file",
+        dest="ready_file",
+        required=False,
+        type=str,
+        help="Creates the given file once the certificates and critical files were processed, before processing the"
+        " other files. Without critical files, once all the files were processed",
+    )
+    parser.add_argument(
+        "--phase",
+        dest="phase",
+        required=False,
+        choices=PHASES,
+        default="all",
+        help="Processes only the critical files (and certificates), or only the non-critical files. Default is all",
+    )
+    parser.add_argument(
+        "--exec",
+        dest="exec_command",
+        required=False,
+        nargs=argparse.REMAINDER,
+        help="Once the job succeeded, replaces the files composer process with the given command, i.e."
+        " --exec -- nginx -g 'daemon off;'. The content of the files with export_env is set in its environment",
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile_dir",
+        required=False,
+        type=str,
+        help="Profiles the execution with cProfile and tracemalloc, and writes the reports of each phase"
+        " (parse, fetch, render, write, certs) to the given folder",
+    )
+    parser.add_argument(
+        "--profile-top",
+        dest="profile_top",
+        required=False,
+        type=int,
+        default=25,
+        help="Number of functions and allocation sites listed for each phase in the profiling summary",
+    )
+    parser.add_argument(
+        "--profile-sampling-interval",
+        dest="profile_sampling_interval",
+        required=False,
+        type=float,
+        help="Also samples the stacks of all the threads every given milliseconds, when profiling",
+    )
+    options, command = split_exec_command(sys.argv[1:])
+    args = parser.parse_args(options)
     LOG.debug(f"CLI ARGS?: {args}")
-    if args.dump_ecs_details:
-        dump_ecs_details()
-    if not (
-        args.env_var or args.ssm_config or args.s3_config or args.file_path
-    ) and environ.get("ECS_CONFIG_CONTENT", None):
-        LOG.info("Using default env variable ECS_CONFIG_CONTENT")
-        config = init_config(
-            env_var="ECS_CONFIG_CONTENT",
-            decode_base64=bool(environ.get("DECODE_BASE64", False)),
-            context=environ.get("context", "jinja2"),
-            print_generated_config=args.print_generated_config,
+    if args.exec_command is not None:
+        if args.exec_command and command:
+            args.exec_command += ["--"] + command
+        args.exec_command = args.exec_command or command
+        if not args.exec_command:
+            parser.error("--exec requires the command to execute, i.e. --exec -- app")
+    elif command:
+        parser.error(f"unrecognized arguments: -- {' '.join(command)}")
+    exports: dict = {}
+    if args.trace_out:
+        TRACER.enable()
+    profiler = None
+    if args.profile_dir:
+        profiler = Profiler(
+            args.profile_dir,
+            top=args.profile_top,
+            sampling_interval=(
+                args.profile_sampling_interval / 1000
+                if args.profile_sampling_interval
+                else None
+            ),
         )
-    elif args.env_var:
-        config = init_config(
-            env_var=args.env_var,
-            decode_base64=args.decode_base64,
-            context=args.context,
-            override_folder=args.init_folder,
-            print_generated_config=args.print_generated_config,
-        )
-    elif args.file_path:
-        config = init_config(
-            file_path=args.file_path,
-            decode_base64=args.decode_base64,
-            context=args.context,
-            override_folder=args.init_folder,
-            print_generated_config=args.print_generated_config,
-        )
-    elif args.ssm_config:
-        config = init_config(
-            ssm_parameter=args.ssm_config,
-            decode_base64=args.decode_base64,
-            context=args.context,
-            override_folder=args.init_folder,
-            print_generated_config=args.print_generated_config,
+        profiler.start()
+    try:
+        exit_code = execute(args, parser, exports)
+    finally:
+        if profiler:
+            profiler.stop()
+            profiler.write()
+            LOG.info(f"Profiling reports written to {args.profile_dir}")
+        if args.trace_out:
+            TRACER.write(args.trace_out)
+            LOG.info(f"Execution trace written to {args.trace_out}")
+    if args.exec_command and exit_code == 0:
+        exec_command(args.exec_command, exports)
+    return exit_code
+
+
+def split_exec_command(argv: list) -> tuple[list, list]:
+    """
+    Splits the arguments at --, which separates the command of --exec from the options.
+    argparse does not pass the arguments after -- to the options, even with nargs=REMAINDER.
+
+    :return: The options, and the command
+    """
+    if "--" not in argv:
+        return argv, []
+    index = argv.index("--")
+    return argv[:index], argv[index + 1 :]
+
+
+def exec_command(command: list, exports: dict = None) -> None:
+    """
+    Replaces the process with the command, i.e. the application, in the same container.
+    The content of the files exported is set in the environment of the command.
+
+    :param list command: The command and its arguments
+    :param dict exports: The environment variables to set
+    """
+    if exports:
+        environ.update(exports)
+        LOG.info(f"Exported {', '.join(sorted(exports))} to the environment")
+    LOG.info(f"Executing {command[0]}")
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.execvp(command[0], command)
+
+
+def execute(args, parser: argparse.ArgumentParser, exports: dict = None) -> int:
+    """
+    Executes the command, once the arguments are parsed
+
+    :param dict exports: If set, the content of the files with export_env is set into it, by variable name
+    """
+    if args.cache_dir:
+        CREDENTIALS_CACHE.set_cache_dir(args.cache_dir)
+        BUCKET_REGIONS.set_cache_dir(args.cache_dir)
+    if args.shared_cache_dir:
+        SHARED_CACHE.set_cache_dir(
+            args.shared_cache_dir,
+            (
+                args.shared_cache_max_size * 1024 * 1024
+                if args.shared_cache_max_size
+                else None
+            ),
         )
-    elif args.s3_config:
-        config = init_config(
-            s3_config=args.s3_config,
-            decode_base64=args.decode_base64,
-            context=args.context,
-            override_folder=args.init_folder,
-            print_generated_config=args.print_generated_config,
+    if args.dump_ecs_details:
+        dump_ecs_details()
+    if args.apply_bundle:
+        apply_bundle(
+            args.apply_bundle,
+            fetcher=S3Fetcher(RoleArn=args.role_arn) if args.role_arn else None,
         )
-    elif args.secret_config:
-        config = init_config(
-            secret_config=args.secret_config,
-            decode_base64=args.decode_base64,
-            context=args.context,
-            override_folder=args.init_folder,
-            print_generated_config=args.print_generated_config,
+        return 0
+    sources = [
+        {"name": value, kwarg: value, "context": args.context}
+        for kwarg, value in (args.config_sources or [])
+    ]
+    merge = args.merge
+    if args.manifest:
+        manifest_sources, manifest_merge = load_manifest(args.manifest)
+        sources += manifest_sources
+        merge = merge or manifest_merge
+    if args.server_socket:
+        if sources or args.manifest or args.exec_command:
+            parser.error(
+                "--server cannot be used with the --from-*, --manifest or --exec options. "
+                "Configurations are submitted with --submit"
+            )
+        serve(args.server_socket)
+        return 0
+    if not sources and environ.get("ECS_CONFIG_CONTENT", None):
+        LOG.info("Using default env variable ECS_CONFIG_CONTENT")
+        sources.append(
+            {
+                "name": "ECS_CONFIG_CONTENT",
+                "env_var": "ECS_CONFIG_CONTENT",
+                "decode_base64": bool(environ.get("DECODE_BASE64", False)),
+                "context": environ.get("context", "jinja2"),
+            }
         )
-    else:
+    elif not sources:
         raise parser.error(
             "You must specify where the execution configuration comes from or set ECS_CONFIG_CONTENT."
         )
-    start_jobs(config)
-    return 0
+    if args.submit_socket:
+        return submit_sources(args.submit_socket, sources, args)
+    if len(sources) == 1:
+        config = load_source(sources[0], args)
+        if args.plan:
+            print(build_plan(config, with_size=args.plan_size).render())
+            return 0
+        if args.bundle_to:
+            create_bundle(config, args.bundle_to)
+            return 0
+        start_jobs(
+            config,
+            use_async=args.use_async,
+            ready_file=args.ready_file,
+            phase=args.phase,
+            exports=exports,
+        )
+        return 0
+    return run_sources(sources, args, merge, exports)
+
+
+def load_source(source: dict, args) -> dict:
+    """Loads the configuration from its source"""
+    source = dict(source)
+    source.pop("name")
+    source.setdefault("decode_base64", args.decode_base64)
+    return init_config(
+        override_folder=args.init_folder,
+        print_generated_config=args.print_generated_config,
+        **source,
+    )
+
+
+def submit_sources(socket_path: str, sources: list, args) -> int:
+    """
+    Submits the configurations to the server, which loads and executes them.
+
+    :return: the exit code, 1 if any of the configurations failed
+    """
+    jobs: list = []
+    for source in sources:
+        source = dict(source)
+        name = source.pop("name")
+        source.setdefault("decode_base64", args.decode_base64)
+        if "file_path" in source:
+            source["file_path"] = path.abspath(source["file_path"])
+        if "env_var" in source:
+            # The server does not share the environment of the client
+            source["raw"] = environ.get(source.pop("env_var"))
+        jobs.append({"name": name, "source": source, "async": args.use_async})
+    results = submit_jobs(socket_path, jobs)
+    for result in results:
+        status = "succeeded" if result["success"] else f"failed: {result['error']}"
+        LOG.info(f"{result['name']} - {status} ({result['duration']:.2f}s)")
+        if result.get("retries"):
+            LOG.info(f"  AWS API calls retries: {result['retries']}")
+        for file_path, file_status in result["files"].items():
+            LOG.info(f"  {file_path} - {file_status}")
+    return 0 if all(result["success"] for result in results) else 1
+
+
+def run_sources(sources: list, args, merge: bool = False, exports: dict = None) -> int:
+    """
+    Loads and executes several configurations in the same process, and reports the result of each.
+
+    :return: the exit code, 1 if any of the configurations failed
+    """
+    jobs: list = []
+    results: list = []
+    for source in sources:
+        try:
+            jobs.append((source["name"], load_source(source, args)))
+        except Exception as error:
+            LOG.exception(error)
+            results.append(
+                JobResult(name=source["name"], success=False, error=str(error))
+            )
+    if merge or args.bundle_to:
+        jobs = [("merged", merge_configs([config for _, config in jobs]))]
+    if args.plan:
+        for name, config in jobs:
+            print(f"{name}:")
+            print(build_plan(config, with_size=args.plan_size).render())
+        return 0 if not results else 1
+    if args.bundle_to:
+        create_bundle(jobs[0][1], args.bundle_to)
+        return 0 if not results else 1
+    if results and args.ready_file:
+        LOG.warning(
+            f"Some configurations failed to load. {args.ready_file} will not be created"
+        )
+    results += run_jobs(
+        jobs,
+        use_async=args.use_async,
+        ready_file=None if results else args.ready_file,
+        phase=args.phase,
+        exports=exports,
+    )
+    for result in results:
+        status = "succeeded" if result.success else f"failed: {result.error}"
+        LOG.info(f"{result.name} - {status} ({result.duration:.2f}s)")
+        if result.retries:
+            LOG.info(f"  AWS API calls retries: {result.retries}")
+    return 0 if all(result.success for result in results) else 1
 
 
 if __name__ == "__main__":
@@ -5,9 +5,12 @@
 
 from __future__ import annotations
 
+import asyncio
+import copy
 import json
 import os
-from dataclasses import asdict
+import time
+from dataclasses import asdict, dataclass, field
 from enum import Enum
 from os import environ, path
 from tempfile import TemporaryDirectory
@@ -18,12 +21,18 @@ from dacite import Config, from_dict
 from yaml import Loader
 
 from ecs_files_composer import input
-from ecs_files_composer.aws_mgmt import S3Fetcher
+from ecs_files_composer.archives import set_attributes
+from ecs_files_composer.aws_mgmt import RETRIES_COUNTER, S3Fetcher
 from ecs_files_composer.certificates_mgmt import process_x509_certs
 from ecs_files_composer.common import LOG
 from ecs_files_composer.files_mgmt import File
+from ecs_files_composer.tracing import traced
 
+# Files processed by the job: the critical files, the other files, or all of them
+PHASES = ("all", "critical", "non-critical")
 
+
+@traced("config", "config init")
 def init_config(
     raw=None,
     file_path=None,
@@ -81,8 +90,9 @@ def init_config(
     if not initial_config:
         raise ImportError("Failed to import a configuration content")
     LOG.debug(initial_config)
+    temp_dir = None
     if not override_folder:
-        temp_dir = TemporaryDirectory()
+        temp_dir = TemporaryDirectory(dir=get_scratch_base_dir())
         config_path = f"{temp_dir.name}/init.conf"
     else:
         config_path = f"{override_folder}/init.conf"
@@ -118,9 +128,100 @@ def init_config(
     except OSError as error:
         LOG.exception(error)
         LOG.error(f"Failed to read input file from {config_path}")
+    finally:
+        if temp_dir:
+            temp_dir.cleanup()
+
+
+def get_scratch_base_dir() -> str | None:
+    """Returns tmpfs (/dev/shm) for the job scratch folder when usable, otherwise None for the system default"""
+    if path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK | os.X_OK):
+        return "/dev/shm"
+    return None
+
+
+def prepare_directories(files: list[File]) -> None:
+    """
+    Creates the folders for all the files of the job in a single pass, instead of for each file.
+    The folders created get the owner, group and mode (with the execute permission where readable) of the first file
+    they are created for. Folders created or found to exist are kept, so that they are not checked again.
+    Files only exported to the environment are processed in the job scratch folder instead.
+    """
+    files = [file for file in files if not file.exports_only]
+    dirs_files: dict = {}
+    for file in files:
+        dirs_files.setdefault(file.dir_path, file)
+    existing: set = set()
+    for dir_path, file in sorted(dirs_files.items()):
+        missing: list = []
+        parent = dir_path
+        while parent not in existing and not path.isdir(parent):
+            missing.append(parent)
+            parent = path.dirname(parent)
+        existing.add(parent)
+        for missing_path in reversed(missing):
+            print(f"Creating {missing_path} folder")
+            os.makedirs(missing_path, exist_ok=True)
+            set_attributes(missing_path, int(file.mode, 8), file.owner, file.group)
+            existing.add(missing_path)
+    for file in files:
+        file.dir_prepared = True
+
+
+def schedule_files(files: list[File], all_critical: bool = False) -> tuple[list, list]:
+    """
+    Splits the files into the critical ones and the others, each ordered by decreasing priority.
+    Files of the same priority keep the order of the configuration.
 
+    :param bool all_critical: Considers all the files critical, i.e. when none is flagged critical
+    :return: The critical files, and the other files
+    """
+    ordered = sorted(files, key=lambda file: -(file.priority or 0))
+    return (
+        [file for file in ordered if all_critical or file.critical],
+        [file for file in ordered if not (all_critical or file.critical)],
+    )
+
+
+def select_phase(critical: list, others: list, phase: str = "all") -> tuple[list, list]:
+    """Keeps the files of the phase: all, critical or non-critical"""
+    if phase not in PHASES:
+        raise ValueError(f"Unsupported phase {phase}. Expected one of {PHASES}")
+    if phase == "critical":
+        critical, others = critical, []
+    elif phase == "non-critical":
+        critical, others = [], others
+    if not critical and not others and phase != "all":
+        LOG.warning(f"No file to process in the {phase} phase")
+    return critical, others
+
+
+def signal_ready(ready_file: str) -> None:
+    """Publishes the readiness signal, the sentinel file, once the critical files were processed"""
+    os.makedirs(path.dirname(path.abspath(ready_file)), exist_ok=True)
+    with open(ready_file, "w") as ready_fd:
+        ready_fd.write(f"{time.time()}\n")
+    LOG.info(f"Critical files completed. Readiness signalled to {ready_file}")
 
-def process_files(job: input.Model, override_session=None) -> None:
+
+@traced("job", "process files")
+def process_files(
+    job: input.Model,
+    override_session=None,
+    results: dict = None,
+    ready_file: str = None,
+    all_critical: bool = False,
+    phase: str = "all",
+    exports: dict = None,
+) -> None:
+    """
+    Processes the critical files first, then publishes the readiness signal if set, and processes the other files.
+
+    :param str ready_file: Path of the sentinel file created once the critical files were processed
+    :param bool all_critical: Considers all the files critical, i.e. when none is flagged critical
+    :param str phase: Files to process: all, critical or non-critical
+    :param dict exports: If set, the content of the files with export_env is set into it, by variable name
+    """
     files: list = []
     for file_path, file in job.files.items():
         if not isinstance(file, File):
@@ -131,17 +232,199 @@ def process_files(job: input.Model, override_session=None) -> None:
             files.append(file_redef)
         else:
             files.append(file)
-    for file in files:
-        file.handler(job.IamOverride, override_session)
-        LOG.info(f"Tasks for {file.path} completed.")
+    critical, others = select_phase(*schedule_files(files, all_critical), phase)
+    prepare_directories(critical + others)
+
+    def process(file: File, scratch_dir: str) -> None:
+        file_path = file.path
+        file.scratch_dir = scratch_dir
+        if file.exports_only:
+            file.set_export_path(scratch_dir)
+        try:
+            file.handler(job.IamOverride, override_session, job.Retries)
+        except Exception as error:
+            if results is not None:
+                results[file_path] = f"failed: {error}"
+            raise
+        if exports is not None:
+            file.export_content(exports)
+        LOG.info(f"Tasks for {file_path} completed.")
+        if results is not None:
+            results[file_path] = "completed"
 
+    with TemporaryDirectory(
+        prefix="files-composer-", dir=get_scratch_base_dir()
+    ) as scratch_dir:
+        for file in critical:
+            process(file, scratch_dir)
+        if ready_file:
+            signal_ready(ready_file)
+        for file in others:
+            process(file, scratch_dir)
 
-def start_jobs(config: dict, override_session=None):
-    """Starting point to run the files job"""
+
+@traced("job", "job")
+def start_jobs(
+    config: dict,
+    override_session=None,
+    use_async: bool = False,
+    results: dict = None,
+    ready_file: str = None,
+    phase: str = "all",
+    exports: dict = None,
+):
+    """
+    Starting point to run the files job
+
+    :param dict config: The job configuration
+    :param boto3.session.Session override_session:
+    :param bool use_async: Use the asyncio execution core to process the files concurrently
+    :param dict results: If set, the status of each file processed is set into it
+    :param str ready_file: Path of the sentinel file created once the certificates and critical files were
+      processed. When no file is critical, it is created once all the files were processed.
+    :param str phase: Files to process: all, critical (with the certificates) or non-critical
+    :param dict exports: If set, the content of the files with export_env is set into it, by variable name
+    """
+    # The retries are reported for each job
+    RETRIES_COUNTER.reset()
     job = from_dict(
         data_class=input.Model, data=config, config=Config(cast=[Enum, bytes])
     )
-    if job.certificates:
+    if ready_file and path.exists(ready_file):
+        os.unlink(ready_file)
+    # Without critical files, the readiness is signalled once all the files were processed. When the phases are
+    # run separately, the unflagged files are processed by the non-critical phase.
+    all_critical = phase == "all" and not any(
+        file.critical for file in (job.files or {}).values()
+    )
+    if job.certificates and phase != "non-critical":
         process_x509_certs(job)
-    if job.files:
-        process_files(job, override_session)
+    if job.files and use_async:
+        from ecs_files_composer.async_mgmt import process_files_async
+
+        asyncio.run(
+            process_files_async(
+                job,
+                override_session,
+                results=results,
+                ready_file=ready_file,
+                all_critical=all_critical,
+                phase=phase,
+                exports=exports,
+            )
+        )
+    elif job.files:
+        process_files(
+            job,
+            override_session,
+            results,
+            ready_file=ready_file,
+            all_critical=all_critical,
+            phase=phase,
+            exports=exports,
+        )
+    elif ready_file:
+        signal_ready(ready_file)
+    LOG.info(
+        f"AWS API calls retries: {RETRIES_COUNTER.total} {RETRIES_COUNTER.retries}"
+    )
+
+
+@dataclass
+class JobResult:
+    """Outcome of one of the jobs executed in the process"""
+
+    name: str
+    success: bool = True
+    duration: float = 0.0
+    error: str = None
+    files: dict = field(default_factory=dict)
+    retries: dict = field(default_factory=dict)
+
+
+def set_job_settings(source_def: dict, config: dict) -> None:
+    """Sets the job level IamOverride and Retries on the sources which do not define their own"""
+    for source_type, source in (source_def or {}).items():
+        if source_type == "Url" or not isinstance(source, dict):
+            continue
+        for key in ("IamOverride", "Retries"):
+            if key in config and key not in source:
+                source[key] = config[key]
+
+
+def merge_configs(configs: list[dict]) -> dict:
+    """
+    Merges several jobs configurations into a single job. The job level IamOverride and Retries are set on the
+    sources of each file, and of the CA, which do not define their own, so that they keep using the settings of
+    their job. When several jobs define the same file, certificate or a CA, the last one is used.
+    """
+    merged: dict = {"files": {}, "certificates": {"x509": {}}}
+    for config in configs:
+        config = copy.deepcopy(config)
+        for file_path, file_def in (config.get("files") or {}).items():
+            set_job_settings(file_def.get("source"), config)
+            if file_path in merged["files"]:
+                LOG.warning(
+                    f"{file_path} is defined in several jobs. Using the last one"
+                )
+            merged["files"][file_path] = file_def
+        certificates = config.get("certificates") or {}
+        merged["certificates"]["x509"].update(certificates.get("x509") or {})
+        if certificates.get("ca"):
+            ca = certificates["ca"]
+            for source_key in ("certSource", "keySource"):
+                set_job_settings(ca.get(source_key), config)
+            set_job_settings(ca.get("keyPassword"), config)
+            if merged["certificates"].get("ca", ca) != ca:
+                LOG.warning("Several jobs define a different CA. Using the last one")
+            merged["certificates"]["ca"] = ca
+    if not merged["certificates"]["x509"]:
+        del merged["certificates"]["x509"]
+    if not merged["certificates"]:
+        del merged["certificates"]
+    return merged
+
+
+def run_jobs(
+    jobs: list[tuple[str, dict]],
+    use_async: bool = False,
+    ready_file: str = None,
+    phase: str = "all",
+    exports: dict = None,
+) -> list[JobResult]:
+    """
+    Runs several jobs one after the other in the same process, so they share the AWS sessions, clients and
+    credentials cache. A failing job does not prevent the next ones from running.
+
+    :param list jobs: The name and configuration of each job
+    :param bool use_async: Use the asyncio execution core to process the files concurrently
+    :param str ready_file: Path of the readiness sentinel file. With several jobs, it is created once all the jobs
+      succeeded.
+    :param str phase: Files to process: all, critical or non-critical
+    :param dict exports: If set, the content of the files with export_env of all the jobs is set into it
+    :return: The result of each job
+    """
+    results: list = []
+    for name, config in jobs:
+        result = JobResult(name=name)
+        start = time.monotonic()
+        try:
+            start_jobs(
+                config,
+                use_async=use_async,
+                results=result.files,
+                ready_file=ready_file if len(jobs) == 1 else None,
+                phase=phase,
+                exports=exports,
+            )
+        except Exception as error:
+            LOG.exception(error)
+            LOG.error(f"Job {name} failed")
+            result.success = False
+            result.error = str(error)
+        result.duration = time.monotonic() - start
+        result.retries = dict(RETRIES_COUNTER.retries)
+        results.append(result)
+    if ready_file and len(jobs) > 1 and all(result.success for result in results):
+        signal_ready(ready_file)
+    return results
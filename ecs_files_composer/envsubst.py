@@ -5,6 +5,7 @@
 Module to do a better env variables handling.
 """
 
+import codecs
 import os
 import re
 
@@ -15,6 +16,14 @@ IF_UNDEFINED = r":-"
 IF_DEFINED = r":+"
 IF_LITTERAL = re.compile(r"(\$(\{\![^}]+\}))")
 
+VARIABLE_RE = re.compile(ENV_VAR_REGEXP)
+UNESCAPED_VARIABLE_RE = re.compile(r"\$(\w+|\{(?!AWS::)([^}]*)\})")
+SPECIAL_INTERPOLATION_RE = re.compile(SPECIAL_INTERPOLATION)
+# End of a chunk which may be the beginning of a variable continued in the next chunk
+PENDING_VARIABLE_RE = re.compile(r"\$\w*\Z")
+# Above that size, a chunk is not held back waiting for the end of a variable
+MAX_PENDING_SIZE = 64 * 1024
+
 
 def expandvars(path, default=None, skip_escaped=True, enable_litteral=True):
     """
@@ -27,19 +36,73 @@ def expandvars(path, default=None, skip_escaped=True, enable_litteral=True):
 
     def replace_var(match):
         if IF_LITTERAL.match(match.group(0)) and enable_litteral:
-            return re.sub(r"\!", "", IF_LITTERAL.match(match.group(0)).group(0))
-        if re.match(SPECIAL_INTERPOLATION, match.group(0)):
-            groups = re.findall(SPECIAL_INTERPOLATION, match.group(0))
-            if groups[0][-2] == IF_UNDEFINED:
-                return os.environ.get(groups[0][-3]) or expandvars(
-                    groups[0][-1], default, skip_escaped
+            return IF_LITTERAL.match(match.group(0)).group(0).replace("!", "")
+        special = SPECIAL_INTERPOLATION_RE.match(match.group(0))
+        if special:
+            if special.group(5) == IF_UNDEFINED:
+                return os.environ.get(special.group(4)) or expandvars(
+                    special.group(6), default, skip_escaped
                 )
-            elif groups[0][-2] == IF_DEFINED:
-                return expandvars(groups[0][-1])
+            elif special.group(5) == IF_DEFINED:
+                return expandvars(special.group(6))
         return os.environ.get(
             match.group(2) or match.group(1),
             match.group(0) if default is None else default,
         )
 
-    re_string = (IF_ESCAPED if skip_escaped else "") + r"\$(\w+|\{(?!AWS::)([^}]*)\})"
-    return re.sub(re_string, replace_var, path)
+    variable_re = VARIABLE_RE if skip_escaped else UNESCAPED_VARIABLE_RE
+    return variable_re.sub(replace_var, path)
+
+
+def expandvars_chunks(chunks, default=None):
+    """
+    Expands the environment variables in the chunks of text as they are read, with the same semantics as expandvars.
+    The end of a chunk which may be the beginning of a variable is held back until the next chunk.
+
+    :param chunks: Iterable of chunks of text
+    :param str default: Value of the unknown variables. If None, they are left unchanged.
+    :return: The chunks of text with the variables expanded
+    """
+    pending = ""
+    previous = ""
+    for chunk in chunks:
+        if not chunk:
+            continue
+        pending += chunk
+        cut = len(pending)
+        if len(pending) < MAX_PENDING_SIZE:
+            # A ${ not closed yet spans up to the next }, whatever is in between
+            open_variable = pending.find("${", pending.rfind("}") + 1)
+            variable = PENDING_VARIABLE_RE.search(pending)
+            if open_variable >= 0:
+                cut = open_variable
+            elif variable:
+                cut = variable.start()
+        if not cut:
+            continue
+        # The character preceding the text is kept, as a backslash escapes the variable which follows it
+        yield expandvars(previous + pending[:cut], default)[len(previous) :]
+        previous = pending[cut - 1]
+        pending = pending[cut:]
+    if pending:
+        yield expandvars(previous + pending, default)[len(previous) :]
+
+
+def expandvars_bytes_chunks(chunks, encoding: str = "utf-8", default=None):
+    """
+    Expands the environment variables in the chunks of bytes as they are read, i.e. streamed from a source.
+
+    :param chunks: Iterable of chunks of bytes
+    :param str encoding: Encoding of the content
+    :param str default: Value of the unknown variables. If None, they are left unchanged.
+    :return: The chunks of bytes with the variables expanded
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+
+    def decoded():
+        for chunk in chunks:
+            yield decoder.decode(chunk)
+        yield decoder.decode(b"", final=True)
+
+    for text in expandvars_chunks(decoded(), default):
+        yield text.encode(encoding)
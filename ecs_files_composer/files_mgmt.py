@@ -6,31 +6,144 @@
 from __future__ import annotations
 
 import base64
+import collections
+import hashlib
 import os
 import pathlib
 import subprocess
+import threading
 import warnings
+from collections import OrderedDict
 from os import path
-from tempfile import TemporaryDirectory
+from tempfile import NamedTemporaryFile, TemporaryDirectory
 from typing import Any
+from urllib.parse import quote
 
 import jinja2.exceptions
 import requests
 from botocore.response import StreamingBody
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import BytecodeCache, Environment, FileSystemLoader
 
+from ecs_files_composer.archives import (
+    CHUNK_SIZE,
+    ArchiveExtractor,
+    decompress_chunks,
+    iter_chunks,
+)
 from ecs_files_composer.aws_mgmt import S3Fetcher, SecretFetcher, SsmFetcher
 from ecs_files_composer.common import LOG
-from ecs_files_composer.envsubst import expandvars
+from ecs_files_composer.envsubst import expandvars, expandvars_bytes_chunks
 from ecs_files_composer.input import (
     Context,
     Encoding,
     FileDef,
+    Format,
     IgnoreFailureItem,
     SourceDef,
 )
 from ecs_files_composer.jinja2_filters import JINJA_FILTERS
 from ecs_files_composer.jinja2_functions import JINJA_FUNCTIONS
+from ecs_files_composer.jinja2_functions.prefetch import prefetch_template_functions
+from ecs_files_composer.s3_sync import S3PrefixSync
+from ecs_files_composer.shared_cache import SHARED_CACHE, url_version
+from ecs_files_composer.ssm_path import render_parameters, write_parameters_files
+from ecs_files_composer.tracing import traced
+
+# Rendered output is written in chunks of at least that many characters.
+RENDER_BUFFER_SIZE = 64 * 1024
+
+
+class DigestMismatchError(ValueError):
+    """Raised when the content retrieved from the source does not match the expected digest"""
+
+
+class AtomicFileWriter:
+    """
+    Writes into a temporary file in the same folder as the target, which is moved into place once complete.
+    If writing fails, the temporary file is removed and the target is left untouched.
+    """
+
+    def __init__(self, file_path: str, mode: str = "w"):
+        self.file_path = file_path
+        self.tmp_fd = NamedTemporaryFile(
+            mode=mode,
+            dir=path.dirname(path.abspath(file_path)),
+            prefix=".files-composer-",
+            delete=False,
+        )
+
+    def write(self, data) -> None:
+        self.tmp_fd.write(data)
+
+    def commit(self) -> None:
+        self.tmp_fd.close()
+        os.replace(self.tmp_fd.name, self.file_path)
+
+    def abort(self) -> None:
+        self.tmp_fd.close()
+        os.unlink(self.tmp_fd.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type:
+            self.abort()
+        else:
+            self.commit()
+
+
+def buffer_chunks(chunks, size: int = RENDER_BUFFER_SIZE):
+    """Groups the (small) chunks of rendered output into chunks of at least size characters"""
+    buffer: list = []
+    buffered = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield "".join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+class MemoryBytecodeCache(BytecodeCache):
+    """
+    Keeps the compiled templates in memory, for processes rendering the same files several times (i.e. server mode).
+    Templates are identified by their name, the path of the file they render, as the folder they are loaded from
+    changes with each job. Jinja2 recompiles the template if its source changed.
+    """
+
+    def __init__(self, max_size: int = 512):
+        self.max_size = max_size
+        self.buckets: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_cache_key(self, name: str, filename: str = None) -> str:
+        return super().get_cache_key(name)
+
+    def load_bytecode(self, bucket) -> None:
+        with self.lock:
+            code = self.buckets.get(bucket.key)
+            if code is not None:
+                self.buckets.move_to_end(bucket.key)
+        if code is not None:
+            bucket.bytecode_from_string(code)
+
+    def dump_bytecode(self, bucket) -> None:
+        code = bucket.bytecode_to_string()
+        with self.lock:
+            self.buckets[bucket.key] = code
+            self.buckets.move_to_end(bucket.key)
+            while len(self.buckets) > self.max_size:
+                self.buckets.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.buckets.clear()
+
+
+JINJA_BYTECODE_CACHE = MemoryBytecodeCache()
 
 
 class File(FileDef):
@@ -41,48 +154,112 @@ class File(FileDef):
     def __init__(self, **data: Any):
         super().__init__(**data)
         self.templates_dir = None
+        self.s3_checksum = None
+        self.digest = None
+        self.scratch_dir = None
+        self.dir_prepared = False
 
-    def handler(self, iam_override=None, session_override=None):
+    @traced("file")
+    def handler(self, iam_override=None, session_override=None, retries=None):
         """
         Main entrypoint for files to relate
 
         :param ecs_files_composer.input.IamOverrideDef iam_override:
         :param boto3.session.Session session_override:
+        :param ecs_files_composer.input.RetriesDef retries: The job level retries settings
         """
-        if not path.exists(self.dir_path):
+        if not self.dir_prepared and not path.exists(self.dir_path):
             print(f"Creating {self.dir_path} folder")
             dir_path = pathlib.Path(path.abspath(self.dir_path))
             dir_path.mkdir(parents=True, exist_ok=True)
         if self.commands and self.commands.pre:
             warnings.warn("Commands are not yet implemented", Warning)
+        own_scratch_dir = None
         if (
             self.context
             and isinstance(self.context, Context)
             and self.context.value == "jinja2"
         ):
-            self.templates_dir = TemporaryDirectory()
+            if not self.scratch_dir:
+                own_scratch_dir = TemporaryDirectory()
+            self.templates_dir = (
+                self.scratch_dir if self.scratch_dir else own_scratch_dir.name
+            )
+        try:
+            self.process(iam_override, session_override, retries)
+        finally:
+            if own_scratch_dir:
+                own_scratch_dir.cleanup()
+
+    def process(self, iam_override=None, session_override=None, retries=None):
+        """
+        Retrieves, renders and writes the file, and runs the post-processing.
+
+        :param ecs_files_composer.input.IamOverrideDef iam_override:
+        :param boto3.session.Session session_override:
+        :param ecs_files_composer.input.RetriesDef retries:
+        """
         if self.source and not self.content:
             retrieved, ignore = self.handle_sources(
-                iam_override=iam_override, session_override=session_override
+                iam_override=iam_override,
+                session_override=session_override,
+                retries=retries,
             )
-            if not retrieved and ignore:
-                LOG.warn(
-                    f"Failed to fetch content for {self.path}. Ignoring all post processing."
-                )
+            if not self.source_retrieved(retrieved, ignore):
                 return
-            elif not retrieved and not ignore:
-                raise Exception("Failed to retrieve content from source", self.path)
-        self.files_content_processing()
+        try:
+            self.files_content_processing()
+        except DigestMismatchError as error:
+            if not self.digest_mismatch_ignored(error):
+                raise
+            return
         self.post_processing()
 
-    def files_content_processing(self) -> None:
+    def source_retrieved(self, retrieved: bool, ignore: bool) -> bool:
+        """
+        :return: Whether the content was retrieved from the source, False if the failure is ignored.
+        :raises Exception: if the content was not retrieved and the failure is not ignored
+        """
+        if not retrieved and ignore:
+            LOG.warning(
+                f"Failed to fetch content for {self.path}. Ignoring all post processing."
+            )
+            return False
+        elif not retrieved and not ignore:
+            raise Exception("Failed to retrieve content from source", self.path)
+        return True
+
+    def digest_mismatch_ignored(self, error: DigestMismatchError) -> bool:
+        LOG.error(error)
+        if not self.ignore_source_failure:
+            return False
+        LOG.warning(f"{self.path} - Ignoring all post processing.")
+        return True
+
+    def decode_content(self) -> None:
         if self.content and self.encoding and self.encoding == Encoding["base64"]:
-            self.content = base64.b64decode(self.content).decode()
-        if self.templates_dir:
-            self.write_content(is_template=True)
+            self.content = base64.b64decode(self.content)
+            if not self.decompress and not self.extract:
+                self.content = self.content.decode()
+
+    def files_content_processing(self) -> None:
+        if self.write_source_content():
             self.render_jinja()
-        else:
-            self.write_content(is_template=False)
+
+    def write_source_content(self) -> bool:
+        """
+        Writes the content retrieved, into the templates folder if it is to be rendered.
+
+        :return: Whether the content written is a template to render
+        """
+        if self.is_directory and not self.extract:
+            return False
+        self.decode_content()
+        if self.templates_dir and not self.extract:
+            self.write_content(is_template=True)
+            return True
+        self.write_content(is_template=False)
+        return False
 
     def post_processing(self):
         self.set_unix_settings()
@@ -93,55 +270,156 @@ class File(FileDef):
     def dir_path(self) -> str:
         return path.abspath(path.dirname(self.path))
 
+    @property
+    def is_directory(self) -> bool:
+        """Whether path is a directory the content is written into"""
+        if self.source and self.source.SsmPath:
+            return Format(self.source.SsmPath.Format) == Format.files
+        return bool(self.extract or (self.source and self.source.S3Prefix))
+
+    @property
+    def exports_only(self) -> bool:
+        """Whether the content is only exported to the environment, and not written to the file path"""
+        return bool(self.export_env and self.export_only)
+
+    def set_export_path(self, scratch_dir: str) -> None:
+        """Files only exported are processed in the job scratch folder, which is removed once the job completed"""
+        self.path = path.join(scratch_dir, "exports", self.template_name)
+        self.dir_prepared = False
+
+    def export_content(self, exports: dict) -> None:
+        """Sets the content of the file written into exports, for the environment variable"""
+        if not self.export_env or not path.isfile(self.path):
+            return
+        with open(self.path) as file_fd:
+            exports[self.export_env] = file_fd.read()
+
+    @property
+    def substitutes_env(self) -> bool:
+        """Whether the environment variables are substituted in the content while it is written (envsubst context)"""
+        return self.context == Context.envsubst and not self.is_directory
+
+    @property
+    def template_name(self) -> str:
+        """Unique name of the template for the file, as templates of the job share the same folder"""
+        return quote(path.abspath(self.path), safe="")
+
+    @traced("fetch")
     def handle_sources(
-        self, iam_override=None, session_override=None
+        self, iam_override=None, session_override=None, retries=None
     ) -> tuple[bool, bool]:
         """
         Handles files from external sources
 
         :param ecs_files_composer.input.IamOverrideDef iam_override:
         :param boto3.session.Session session_override:
+        :param ecs_files_composer.input.RetriesDef retries:
         """
-        ignore_source_download_error = (
-            self.ignore_failure
-            if self.ignore_failure and isinstance(self.ignore_failure, bool)
-            else False
-        )
-        if self.ignore_failure and isinstance(self.ignore_failure, IgnoreFailureItem):
-            ignore_source_download_error = self.ignore_failure.source_download
+        ignore_source_download_error = self.ignore_source_failure
         retrieved = False
         LOG.debug(self.source)
         if self.source.Url:
             retrieved = self.handle_url_source()
         elif self.source.Ssm:
-            retrieved = self.handle_ssm_source(iam_override, session_override)
+            retrieved = self.handle_ssm_source(iam_override, session_override, retries)
+        elif self.source.SsmPath:
+            retrieved = self.handle_ssm_path_source(
+                iam_override, session_override, retries
+            )
         elif self.source.S3:
-            retrieved = self.handle_s3_source(iam_override, session_override)
+            retrieved = self.handle_s3_source(iam_override, session_override, retries)
+        elif self.source.S3Prefix:
+            retrieved = self.handle_s3_prefix_source(
+                iam_override, session_override, retries
+            )
         elif self.source.Secret:
-            retrieved = self.handle_secret_source(iam_override, session_override)
+            retrieved = self.handle_secret_source(
+                iam_override, session_override, retries
+            )
+        if retrieved and isinstance(self.content, (str, bytes)):
+            try:
+                self.verify_content_digest()
+            except DigestMismatchError as error:
+                LOG.error(error)
+                retrieved = False
         LOG.debug(
             f"Return from source for {self.path}: {retrieved}-{ignore_source_download_error}"
         )
         return retrieved, ignore_source_download_error
 
-    def handle_ssm_source(self, iam_override=None, session_override=None) -> bool:
+    @property
+    def ignore_source_failure(self) -> bool:
+        if self.ignore_failure and isinstance(self.ignore_failure, IgnoreFailureItem):
+            return self.ignore_failure.source_download
+        return (
+            self.ignore_failure
+            if self.ignore_failure and isinstance(self.ignore_failure, bool)
+            else False
+        )
+
+    @property
+    def expected_digest(self) -> tuple[str, str] | None:
+        """The algorithm and hex encoded digest the content from the source must match, if any"""
+        if self.source and self.source.Sha512:
+            return "sha512", self.source.Sha512.lower()
+        elif self.source and self.source.Sha256:
+            return "sha256", self.source.Sha256.lower()
+        elif self.s3_checksum:
+            return "sha256", self.s3_checksum
+        return None
+
+    def check_digest(self, digest) -> None:
+        """
+        Keeps the digest of the content, and checks it against the expected one.
+
+        :param hashlib._Hash digest:
+        :raises DigestMismatchError: if the digest does not match
+        """
+        self.digest = digest.hexdigest()
+        algorithm, expected = self.expected_digest
+        if self.digest != expected:
+            raise DigestMismatchError(
+                f"{self.path} - {algorithm} digest {self.digest} does not match the expected {expected}"
+            )
+
+    def verify_content_digest(self) -> None:
+        """Verifies the digest of the content already retrieved in memory"""
+        if not self.expected_digest:
+            return
+        digest = hashlib.new(self.expected_digest[0])
+        digest.update(
+            self.content.encode("utf-8")
+            if isinstance(self.content, str)
+            else self.content
+        )
+        self.check_digest(digest)
+
+    def handle_ssm_source(
+        self, iam_override=None, session_override=None, retries=None
+    ) -> bool:
         """
         Handles retrieving the content from SSM Parameter
 
         :param ecs_files_composer.input.IamOverrideDef iam_override:
         :param boto3.session.Session session_override:
+        :param ecs_files_composer.input.RetriesDef retries:
         :return:
         """
         parameter_name = expandvars(self.source.Ssm.ParameterName)
         LOG.debug(f"Retrieving ssm://{parameter_name}")
+        retries = self.source.Ssm.Retries or retries
         if self.source.Ssm.IamOverride:
-            fetcher = SsmFetcher(iam_config_object=self.source.Ssm.IamOverride)
+            fetcher = SsmFetcher(
+                iam_config_object=self.source.Ssm.IamOverride, retries=retries
+            )
         elif iam_override:
-            fetcher = SsmFetcher(iam_config_object=iam_override)
+            fetcher = SsmFetcher(iam_config_object=iam_override, retries=retries)
         elif session_override:
-            fetcher = SsmFetcher(client_session_override=session_override)
+            fetcher = SsmFetcher(
+                client_session_override=session_override, retries=retries
+            )
         else:
-            fetcher = SsmFetcher()
+            fetcher = SsmFetcher(retries=retries)
         try:
             self.content = fetcher.get_content(parameter_name=parameter_name)
             return True
@@ -150,12 +428,64 @@ class File(FileDef):
             LOG.error(error)
             return False
 
-    def handle_s3_source(self, iam_override=None, session_override=None) -> bool:
+    def handle_ssm_path_source(
+        self, iam_override=None, session_override=None, retries=None
+    ) -> bool:
+        """
+        Retrieves all the SSM parameters under the path, and writes each to its own file under the directory at path,
+        or renders them all as the content of the file.
+
+        :param ecs_files_composer.input.IamOverrideDef iam_override:
+        :param boto3.session.Session session_override:
+        :param ecs_files_composer.input.RetriesDef retries:
+        :return: bool, result of the retrieval
+        """
+        source = self.source.SsmPath
+        parameters_path = expandvars(source.Path)
+        retries = source.Retries or retries
+        if source.IamOverride:
+            fetcher = SsmFetcher(iam_config_object=source.IamOverride, retries=retries)
+        elif iam_override:
+            fetcher = SsmFetcher(iam_config_object=iam_override, retries=retries)
+        elif session_override:
+            fetcher = SsmFetcher(
+                client_session_override=session_override, retries=retries
+            )
+        else:
+            fetcher = SsmFetcher(retries=retries)
+        try:
+            parameters = fetcher.get_parameters_by_path(
+                parameters_path, recursive=source.Recursive
+            )
+            LOG.info(f"Retrieved {len(parameters)} parameters from {parameters_path}")
+            if self.is_directory:
+                write_parameters_files(
+                    parameters,
+                    parameters_path,
+                    self.path,
+                    self.mode,
+                    self.owner,
+                    self.group,
+                )
+            else:
+                self.content = render_parameters(
+                    parameters, parameters_path, Format(source.Format).value
+                )
+            return True
+        except Exception as error:
+            LOG.error(f"Failed to retrieve the parameters under {parameters_path}")
+            LOG.error(error)
+            return False
+
+    def handle_s3_source(
+        self, iam_override=None, session_override=None, retries=None
+    ) -> bool:
         """
         Handles retrieving the content from S3
 
         :param ecs_files_composer.input.IamOverrideDef iam_override:
         :param boto3.session.Session session_override:
+        :param ecs_files_composer.input.RetriesDef retries:
         :return: bool, result of the download from S3.
         """
         from ecs_files_composer.input import S3Def
@@ -163,52 +493,126 @@ class File(FileDef):
         if not isinstance(self.source.S3, S3Def):
             raise TypeError("S3 source is not of type S3Def", type(self.source.S3))
 
+        retries = self.source.S3.Retries or retries
         if self.source.S3.IamOverride:
-            fetcher = S3Fetcher(iam_config_object=self.source.S3.IamOverride)
+            fetcher = S3Fetcher(
+                iam_config_object=self.source.S3.IamOverride, retries=retries
+            )
         elif iam_override:
-            fetcher = S3Fetcher(iam_config_object=iam_override)
+            fetcher = S3Fetcher(iam_config_object=iam_override, retries=retries)
         elif session_override:
-            fetcher = S3Fetcher(client_session_override=session_override)
+            fetcher = S3Fetcher(
+                client_session_override=session_override, retries=retries
+            )
         else:
-            fetcher = S3Fetcher()
+            fetcher = S3Fetcher(retries=retries)
         try:
-            if self.source.S3.S3Uri:
-                self.content = fetcher.get_content(
-                    s3_uri=self.source.S3.S3Uri,
-                )
-            elif self.source.S3.ComposeXUri:
-                self.content = fetcher.get_content(
-                    composex_uri=self.source.S3.ComposeXUri,
-                )
-            else:
-                bucket_name = expandvars(self.source.S3.BucketName)
-                key = expandvars(self.source.S3.Key)
-                self.content = fetcher.get_content(
-                    s3_bucket=bucket_name,
-                    s3_key=key,
-                )
+            bucket_name, key = self.s3_location()
+            get_object = (
+                fetcher.get_cached_object
+                if SHARED_CACHE.enabled
+                else fetcher.get_object
+            )
+            object_r = get_object(
+                bucket_name,
+                key,
+                checksum_mode=bool(self.source.S3.ChecksumMode),
+                bucket_region=expandvars(self.source.S3.BucketRegion or "") or None,
+            )
+            if self.source.S3.ChecksumMode:
+                self.s3_checksum = S3Fetcher.checksum_sha256(object_r)
+                if not self.s3_checksum:
+                    LOG.warning(f"{self.path} - No SHA256 checksum for the S3 object")
+            self.content = object_r["Body"]
             return True
         except Exception as error:
             LOG.error("Failed to retrieve file from AWS S3")
             LOG.error(error)
             return False
 
-    def handle_secret_source(self, iam_override=None, session_override=None) -> bool:
+    def s3_location(self) -> tuple[str, str]:
+        """Returns the bucket name and key of the S3 source"""
+        if self.source.S3.S3Uri:
+            return S3Fetcher.parse_location(s3_uri=self.source.S3.S3Uri)
+        elif self.source.S3.ComposeXUri:
+            return S3Fetcher.parse_location(composex_uri=self.source.S3.ComposeXUri)
+        return expandvars(self.source.S3.BucketName), expandvars(self.source.S3.Key)
+
+    def handle_s3_prefix_source(
+        self, iam_override=None, session_override=None, retries=None
+    ) -> bool:
+        """
+        Synchronizes the objects under the S3 prefix into the directory at path
+
+        :param ecs_files_composer.input.IamOverrideDef iam_override:
+        :param boto3.session.Session session_override:
+        :param ecs_files_composer.input.RetriesDef retries:
+        :return: bool, result of the synchronization
+        """
+        source = self.source.S3Prefix
+        retries = source.Retries or retries
+        if source.IamOverride:
+            fetcher = S3Fetcher(iam_config_object=source.IamOverride, retries=retries)
+        elif iam_override:
+            fetcher = S3Fetcher(iam_config_object=iam_override, retries=retries)
+        elif session_override:
+            fetcher = S3Fetcher(
+                client_session_override=session_override, retries=retries
+            )
+        else:
+            fetcher = S3Fetcher(retries=retries)
+        if source.S3Uri:
+            bucket_name, prefix = S3Fetcher.prefix_re.match(source.S3Uri).groups()
+        else:
+            bucket_name, prefix = expandvars(source.BucketName), expandvars(
+                source.Prefix or ""
+            )
+        try:
+            S3PrefixSync(
+                fetcher,
+                bucket_name,
+                prefix,
+                self.path,
+                self.mode,
+                self.owner,
+                self.group,
+                bucket_region=expandvars(source.BucketRegion or "") or None,
+            ).sync(
+                include=source.Include,
+                exclude=source.Exclude,
+                delete=source.Delete,
+                max_workers=source.MaxConcurrency,
+            )
+            return True
+        except Exception as error:
+            LOG.error(f"Failed to synchronize s3://{bucket_name}/{prefix}")
+            LOG.error(error)
+            return False
+
+    def handle_secret_source(
+        self, iam_override=None, session_override=None, retries=None
+    ) -> bool:
         """
         Handles retrieving secrets from AWS Secrets Manager
 
         :param ecs_files_composer.input.IamOverrideDef iam_override:
         :param boto3.session.Session session_override:
+        :param ecs_files_composer.input.RetriesDef retries:
         :return:
         """
+        retries = self.source.Secret.Retries or retries
         if self.source.Secret.IamOverride:
-            fetcher = SecretFetcher(iam_config_object=self.source.Secret.IamOverride)
+            fetcher = SecretFetcher(
+                iam_config_object=self.source.Secret.IamOverride, retries=retries
+            )
         elif iam_override:
-            fetcher = SecretFetcher(iam_config_object=iam_override)
+            fetcher = SecretFetcher(iam_config_object=iam_override, retries=retries)
         elif session_override:
-            fetcher = SecretFetcher(client_session_override=session_override)
+            fetcher = SecretFetcher(
+                client_session_override=session_override, retries=retries
+            )
         else:
-            fetcher = SecretFetcher()
+            fetcher = SecretFetcher(retries=retries)
         try:
             self.content = fetcher.get_content(self.source.Secret)
             return True
@@ -222,22 +626,57 @@ class File(FileDef):
         Fetches the content from a provided URI
 
         """
-        if not self.source.Url.Username or not self.source.Url.Password:
-            req = requests.get(self.source.Url.Url)
-        else:
-            req = requests.get(
-                self.source.Url.Url,
-                auth=(self.source.Url.Username, self.source.Url.Password),
-            )
+        auth = None
+        if self.source.Url.Username and self.source.Url.Password:
+            auth = (self.source.Url.Username, self.source.Url.Password)
+        if SHARED_CACHE.enabled:
+            cached = self.handle_cached_url_source(auth)
+            if cached is not None:
+                return cached
+        req = requests.get(self.source.Url.Url, auth=auth, stream=True)
         try:
             req.raise_for_status()
-            self.write_content(as_bytes=True, bytes_content=req.content)
+            self.write_content(
+                as_bytes=True, bytes_content=req.iter_content(CHUNK_SIZE)
+            )
+            return True
+        except (requests.exceptions.HTTPError, DigestMismatchError) as error:
+            LOG.error("Failed to retrieve file provided URL")
+            LOG.error(error)
+            return False
+        finally:
+            req.close()
+
+    def handle_cached_url_source(self, auth: tuple = None) -> bool | None:
+        """
+        Fetches the content through the shared cache, when its version can be identified from a HEAD request.
+
+        :return: The result of the download, or None if the content cannot be cached
+        """
+        url = self.source.Url.Url
+        head = requests.head(url, auth=auth, allow_redirects=True)
+        version = url_version(head.headers) if head.ok else None
+        if not version:
+            return None
+
+        def download():
+            with requests.get(url, auth=auth, stream=True) as req:
+                req.raise_for_status()
+                yield from req.iter_content(CHUNK_SIZE)
+
+        identity = f"{auth[0]}@{url}" if auth else url
+        try:
+            with SHARED_CACHE.open(identity, version, download) as cache_fd:
+                self.write_content(
+                    as_bytes=True, bytes_content=iter_chunks(cache_fd, CHUNK_SIZE)
+                )
             return True
-        except requests.exceptions.HTTPError as error:
+        except (requests.exceptions.HTTPError, DigestMismatchError) as error:
             LOG.error("Failed to retrieve file provided URL")
             LOG.error(error)
             return False
 
+    @traced("render")
     def render_jinja(self):
         """
         Allows to use the temp directory as environment base, the original file as source template, and render
@@ -245,27 +684,44 @@ class File(FileDef):
         """
         from os import listdir
 
-        LOG.info(f"Rendering Jinja for {self.path} - {self.templates_dir.name}")
+        LOG.info(f"Rendering Jinja for {self.path} - {self.templates_dir}")
         jinja_env = Environment(
-            loader=FileSystemLoader(self.templates_dir.name),
+            loader=FileSystemLoader(self.templates_dir),
             autoescape=True,
             auto_reload=False,
+            bytecode_cache=JINJA_BYTECODE_CACHE,
         )
         jinja_env.filters.update(JINJA_FILTERS)
         jinja_env.globals.update(JINJA_FUNCTIONS)
         try:
-            template = jinja_env.get_template(path.basename(self.path))
-            self.content = template.render(env=os.environ)
+            template = jinja_env.get_template(self.template_name)
+            functions = {}
+            if self.prefetch:
+                functions = prefetch_template_functions(template, env=os.environ)
+            if self.stream_render:
+                self.content = None
+                LOG.info(f"Outputting {self.path} (streaming)")
+                with AtomicFileWriter(self.path) as writer:
+                    for chunk in buffer_chunks(
+                        template.generate(env=os.environ, **functions)
+                    ):
+                        writer.write(chunk)
+                return
+            self.content = template.render(env=os.environ, **functions)
             self.write_content(is_template=False)
         except jinja2.exceptions.TemplateNotFound:
-            LOG.error(listdir(self.templates_dir.name))
+            LOG.error(listdir(self.templates_dir))
             raise
 
+    @traced("chmod/chown")
     def set_unix_settings(self):
         """
-        Applies UNIX settings to given file
+        Applies UNIX settings to given file. For directories (extracted archives, S3 prefixes), these are set on
+        the files as they are written.
 
         """
+        if self.is_directory:
+            return
         ignore_mode_failure = (
             self.ignore_failure
             if self.ignore_failure and isinstance(self.ignore_failure, bool)
@@ -310,6 +766,7 @@ class File(FileDef):
             else:
                 raise
 
+    @traced("post commands")
     def exec_post_commands(self):
         ignore_post_command_failure = (
             self.ignore_failure
@@ -345,27 +802,116 @@ class File(FileDef):
                 else:
                     raise
 
+    @traced("write")
     def write_content(self, is_template=True, as_bytes=False, bytes_content=None):
         """
         Function to write the content retrieved to path.
 
         :param bool is_template: Whether the content should be considered to be a template.
         :param as_bytes:
-        :param bytes_content:
+        :param bytes_content: The content, or an iterable of chunks of content, to write
         :return:
         """
         file_path = (
-            f"{self.templates_dir.name}/{path.basename(self.path)}"
+            f"{self.templates_dir}/{self.template_name}"
             if (self.templates_dir and is_template)
             else self.path
         )
         LOG.info(f"Outputting {self.path} to {file_path}")
         if isinstance(self.content, str):
             with open(file_path, "w") as file_fd:
+                file_fd.write(
+                    expandvars(self.content) if self.substitutes_env else self.content
+                )
+        elif isinstance(self.content, bytes) and (
+            self.decompress or self.extract or self.substitutes_env
+        ):
+            self.write_chunks(file_path, [self.content])
+        elif isinstance(self.content, bytes):
+            with open(file_path, "wb") as file_fd:
                 file_fd.write(self.content)
         elif isinstance(self.content, StreamingBody):
-            with open(file_path, "wb") as file_fd:
-                file_fd.write(self.content.read())
+            try:
+                self.write_chunks(file_path, self.content.iter_chunks(CHUNK_SIZE))
+            finally:
+                self.content.close()
         elif as_bytes and bytes_content:
+            self.write_chunks(
+                file_path,
+                [bytes_content] if isinstance(bytes_content, bytes) else bytes_content,
+            )
+
+    def write_chunks(self, file_path: str, chunks) -> None:
+        """
+        Writes the content from the source as it is received, decompressing, substituting the environment variables
+        or extracting it if set.
+        When a digest is expected, it is computed on the content received while writing to a temporary file,
+        which is only moved into place if the digest matched, so that no invalid content gets written and the
+        file is not read again.
+
+        :raises DigestMismatchError: if the digest does not match the expected one
+        """
+        digest = None
+        if self.expected_digest:
+            digest = hashlib.new(self.expected_digest[0])
+            chunks = hash_chunks(chunks, digest)
+        received = chunks
+        if self.decompress:
+            chunks = decompress_chunks(chunks, self.decompress.value)
+        if self.substitutes_env:
+            chunks = expandvars_bytes_chunks(chunks)
+        if self.extract:
+            self.extract_chunks(chunks, received, digest)
+            return
+        if not digest:
             with open(file_path, "wb") as file_fd:
-                file_fd.write(bytes_content)
+                for chunk in chunks:
+                    file_fd.write(chunk)
+            return
+        with NamedTemporaryFile(
+            dir=path.dirname(file_path), prefix=".files-composer-", delete=False
+        ) as tmp_fd:
+            try:
+                for chunk in chunks:
+                    tmp_fd.write(chunk)
+                collections.deque(received, maxlen=0)
+                self.check_digest(digest)
+            except BaseException:
+                os.unlink(tmp_fd.name)
+                raise
+        os.replace(tmp_fd.name, file_path)
+
+    def extract_chunks(self, chunks, received, digest=None) -> None:
+        """
+        Extracts the archive into the directory at path, applying mode, owner and group to the extracted files.
+        With a digest to verify, the archive is extracted into a staging folder, and the files moved into place
+        once the digest matched.
+        """
+        archive_format = self.extract.value
+        if not digest:
+            extracted = ArchiveExtractor(
+                self.path, self.mode, self.owner, self.group
+            ).extract(chunks, archive_format)
+            LOG.info(f"{self.path} - extracted {len(extracted)} file(s)")
+            return
+        target = ArchiveExtractor(self.path, self.mode, self.owner, self.group)
+        target.make_dir(self.path)
+        with TemporaryDirectory(
+            dir=path.dirname(path.abspath(self.path)), prefix=".files-composer-"
+        ) as staging_dir:
+            staging = ArchiveExtractor(staging_dir, self.mode, self.owner, self.group)
+            staging.extract(chunks, archive_format)
+            collections.deque(received, maxlen=0)
+            self.check_digest(digest)
+            for staged_path in staging.extracted:
+                file_path = path.join(self.path, path.relpath(staged_path, staging_dir))
+                target.make_dir(path.dirname(file_path))
+                os.replace(staged_path, file_path)
+        LOG.info(f"{self.path} - extracted {len(staging.extracted)} file(s)")
+
+
+def hash_chunks(chunks, digest):
+    """Updates the digest with the chunks as they are consumed"""
+    for chunk in chunks:
+        digest.update(chunk)
+        yield chunk
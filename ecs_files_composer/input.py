@@ -21,6 +21,46 @@ class Encoding(str, Enum):
 class Context(str, Enum):
     plain = "plain"
     jinja2 = "jinja2"
+    envsubst = "envsubst"
+
+
+class Format(str, Enum):
+    files = "files"
+    json = "json"
+    yaml = "yaml"
+    env = "env"
+    properties = "properties"
+
+
+class Decompress(str, Enum):
+    gzip = "gzip"
+    bz2 = "bz2"
+    zstd = "zstd"
+
+
+class Extract(str, Enum):
+    tar = "tar"
+    zip = "zip"
+
+
+class ChecksumMode(str, Enum):
+    ENABLED = "ENABLED"
+
+
+class KeystoreType(str, Enum):
+    PKCS12 = "PKCS12"
+    JKS = "JKS"
+
+
+class KeyType(str, Enum):
+    RSA = "RSA"
+    EC = "EC"
+
+
+class RetryMode(str, Enum):
+    adaptive = "adaptive"
+    standard = "standard"
+    legacy = "legacy"
 
 
 @dataclass
@@ -53,6 +93,16 @@ class IamOverrideDef:
     SessionToken: Optional[str] = None
 
 
+@dataclass
+class RetriesDef:
+    """
+    Retries settings for the AWS API calls. Defaults to adaptive mode with client side rate limiting.
+    """
+
+    Mode: Optional[RetryMode] = "adaptive"
+    MaxAttempts: Optional[int] = 10
+
+
 @dataclass
 class CommandsDefItem:
     """
@@ -82,11 +132,41 @@ class X509CertDef:
     validityEndInSeconds: Optional[float] = 8035200
     group: Optional[str] = "root"
     owner: Optional[str] = "root"
+    subjectAltNames: Optional[List[str]] = None
+    keyType: Optional[KeyType] = None
+    reuseExisting: Optional[bool] = False
+    minRemainingValidityInSeconds: Optional[float] = 604800
+    keystore: Optional[KeystoreDef] = None
+    truststore: Optional[KeystoreDef] = None
+
+
+@dataclass
+class CaDef:
+    """
+    Certificate authority of the job, signing all its x509 certificates. Generated, or loaded from sources.
+    """
+
+    dir_path: Optional[str] = None
+    certFileName: Optional[str] = "ca.crt"
+    keyFileName: Optional[str] = None
+    bundleFileName: Optional[str] = None
+    commonName: Optional[str] = "Files Composer CA"
+    organizationName: Optional[str] = "NoOne"
+    validityEndInSeconds: Optional[float] = 31536000
+    keyType: Optional[KeyType] = "RSA"
+    certSource: Optional[SourceDef] = None
+    keySource: Optional[SourceDef] = None
+    keyPassword: Optional[PasswordDef] = None
+    reuseExisting: Optional[bool] = False
+    minRemainingValidityInSeconds: Optional[float] = 604800
+    group: Optional[str] = "root"
+    owner: Optional[str] = "root"
 
 
 @dataclass
 class Certificates:
     x509: Optional[Dict[str, X509CertDef]] = None
+    ca: Optional[CaDef] = None
 
 
 @dataclass
@@ -99,6 +179,20 @@ class Commands:
 class SsmDef:
     ParameterName: Optional[str] = None
     IamOverride: Optional[IamOverrideDef] = None
+    Retries: Optional[RetriesDef] = None
+
+
+@dataclass
+class SsmPathDef:
+    """
+    Retrieves all the SSM parameters under a path, with GetParametersByPath
+    """
+
+    Path: str
+    Recursive: Optional[bool] = True
+    Format: Optional[Format] = "files"
+    IamOverride: Optional[IamOverrideDef] = None
+    Retries: Optional[RetriesDef] = None
 
 
 @dataclass
@@ -108,6 +202,30 @@ class SecretDef:
     VersionStage: Optional[str] = None
     JsonKey: Optional[str] = None
     IamOverride: Optional[IamOverrideDef] = None
+    Retries: Optional[RetriesDef] = None
+
+
+@dataclass
+class PasswordDef:
+    """
+    Source of a password: environment variable, SSM parameter or Secrets Manager secret
+    """
+
+    EnvVar: Optional[str] = None
+    Ssm: Optional[SsmDef] = None
+    Secret: Optional[SecretDef] = None
+
+
+@dataclass
+class KeystoreDef:
+    """
+    Keystore (or truststore) created from the certificate, in the same folder as the certificate files
+    """
+
+    fileName: str
+    type: Optional[KeystoreType] = "PKCS12"
+    alias: Optional[str] = "files-composer"
+    password: Optional[PasswordDef] = None
 
 
 @dataclass
@@ -118,14 +236,38 @@ class S3Def:
     BucketRegion: Optional[str] = None
     Key: Optional[str] = None
     IamOverride: Optional[IamOverrideDef] = None
+    Retries: Optional[RetriesDef] = None
+    ChecksumMode: Optional[ChecksumMode] = None
+
+
+@dataclass
+class S3PrefixDef:
+    """
+    Synchronizes all the objects under an S3 prefix into the directory at the file path
+    """
+
+    S3Uri: Optional[str] = None
+    BucketName: Optional[str] = None
+    BucketRegion: Optional[str] = None
+    Prefix: Optional[str] = ""
+    Include: Optional[List[str]] = None
+    Exclude: Optional[List[str]] = None
+    Delete: Optional[bool] = False
+    MaxConcurrency: Optional[int] = 16
+    IamOverride: Optional[IamOverrideDef] = None
+    Retries: Optional[RetriesDef] = None
 
 
 @dataclass
 class SourceDef:
     Url: Optional[UrlDef] = None
     Ssm: Optional[SsmDef] = None
+    SsmPath: Optional[SsmPathDef] = None
     S3: Optional[S3Def] = None
+    S3Prefix: Optional[S3PrefixDef] = None
     Secret: Optional[SecretDef] = None
+    Sha256: Optional[str] = None
+    Sha512: Optional[str] = None
 
 
 @dataclass
@@ -140,6 +282,14 @@ class FileDef:
     context: Optional[Context] = "plain"
     ignore_failure: Optional[Union[IgnoreFailureItem, bool]] = None
     commands: Optional[Commands] = None
+    prefetch: Optional[bool] = False
+    decompress: Optional[Decompress] = None
+    extract: Optional[Extract] = None
+    stream_render: Optional[bool] = False
+    priority: Optional[int] = 0
+    critical: Optional[bool] = False
+    export_env: Optional[str] = None
+    export_only: Optional[bool] = False
 
 
 @dataclass
@@ -151,3 +301,4 @@ class Model:
     files: Optional[Dict[str, FileDef]] = None
     certificates: Optional[Certificates] = None
     IamOverride: Optional[IamOverrideDef] = None
+    Retries: Optional[RetriesDef] = None
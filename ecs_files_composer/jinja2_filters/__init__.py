@@ -4,9 +4,14 @@
 """
 Package allowing to expand the Jinja filters to use.
 """
+
+from __future__ import annotations
+
 import json
 import re
 from base64 import b64decode, b64encode
+from bisect import bisect_left
+from functools import lru_cache
 from os import environ
 
 import yaml
@@ -75,22 +80,145 @@ def from_metadata_to_flat_keys(metadata):
     return new_metadata
 
 
-def get_property(metadata, property_key, separator: str = None):
-    if separator is None:
-        separator = r"::"
-    metadata_mapping = FlatterDict(metadata)
-    metadata_mapping.set_delimiter(separator)
-    LOG.debug(metadata_mapping)
-    if property_key in metadata_mapping:
-        return metadata_mapping[property_key]
+DEFAULT_SEPARATOR = r"::"
+REGEX_SPECIAL_CHARS = set(".^$*+?{}[]\\|()")
+
+
+@lru_cache(maxsize=256)
+def compile_property_re(property_key: str) -> re.Pattern:
+    return re.compile(property_key)
+
+
+def get_literal_prefix(property_key: str) -> str | None:
+    """
+    Returns the literal prefix of a pattern anchored at the start (i.e. ^Networks_0), None if not anchored.
+    """
+    if not property_key.startswith("^") or "|" in property_key:
+        return None
+    prefix = ""
+    for char in property_key[1:]:
+        if char in REGEX_SPECIAL_CHARS:
+            if char in "*?{" and prefix:
+                prefix = prefix[:-1]
+            break
+        prefix += char
+    return prefix
+
+
+class PropertyIndex:
+    """
+    Index of a metadata document (or any dict), built once, to look up properties.
+
+    * Paths using the separator (i.e. Networks::0::PrivateDNSName) to any value or container are found in O(1).
+      Containers are returned as FlatterDict, i.e. Networks then ['0::PrivateDNSName'], as they always were.
+    * Otherwise, the property key is used as a regular expression against the simplified keys
+      (i.e. Networks_0_PrivateDNSName), using a sorted index of the keys for patterns anchored with ^.
+      The first key in the document order that matches is used.
+
+    The document must not be changed once indexed.
+    """
+
+    def __init__(self, metadata: dict, separator: str = None):
+        self.metadata = metadata
+        self.separator = separator if separator is not None else DEFAULT_SEPARATOR
+        self.paths: dict = {}
+        self.index_paths(metadata, None)
+        self.flat_keys: dict = from_metadata_to_flat_keys(metadata)
+        self.keys_order: dict = {key: order for order, key in enumerate(self.flat_keys)}
+        self.sorted_keys: list = sorted(self.flat_keys)
+        self.matches: dict = {}
+        self._flatter = None
+
+    @property
+    def flatter(self) -> FlatterDict:
+        """The FlatterDict of the document, built when a container is first looked up"""
+        if self._flatter is None:
+            self._flatter = FlatterDict(self.metadata, delimiter=self.separator)
+        return self._flatter
 
-    metadata_mapping = from_metadata_to_flat_keys(metadata)
-    LOG.debug(metadata_mapping)
-    property_re = re.compile(property_key)
-    for key, value in metadata_mapping.items():
-        if property_re.findall(key):
-            return value
-    return None
+    def index_paths(self, value, parent_path: str | None) -> None:
+        if isinstance(value, dict):
+            items = value.items()
+        elif isinstance(value, list):
+            items = enumerate(value)
+        else:
+            return
+        for key, child in items:
+            child_path = (
+                str(key)
+                if parent_path is None
+                else f"{parent_path}{self.separator}{key}"
+            )
+            self.paths[child_path] = child
+            self.index_paths(child, child_path)
+
+    def candidates(self, property_key: str) -> list:
+        """Returns the keys the pattern could match, in the document order"""
+        prefix = get_literal_prefix(property_key)
+        if not prefix:
+            return list(self.flat_keys)
+        keys = []
+        for key in self.sorted_keys[bisect_left(self.sorted_keys, prefix) :]:
+            if not key.startswith(prefix):
+                break
+            keys.append(key)
+        return sorted(keys, key=self.keys_order.get)
+
+    def search(self, property_key: str):
+        if property_key not in self.matches:
+            property_re = compile_property_re(property_key)
+            self.matches[property_key] = None
+            for key in self.candidates(property_key):
+                if property_re.search(key):
+                    self.matches[property_key] = key
+                    break
+        key = self.matches[property_key]
+        return self.flat_keys[key] if key is not None else None
+
+    def get(self, property_key: str, default=None):
+        """Returns the value for the property path, or the first match of the property regex."""
+        value = self.paths.get(property_key)
+        if isinstance(value, (dict, list)):
+            return self.flatter[property_key]
+        if value is None:
+            value = self.search(property_key)
+        return value if value is not None else default
+
+    def __getitem__(self, property_key: str):
+        value = self.get(property_key)
+        if value is None:
+            raise KeyError(property_key)
+        return value
+
+    def __contains__(self, property_key: str) -> bool:
+        return self.get(property_key) is not None
+
+
+def property_index(metadata: dict, separator: str = None) -> PropertyIndex:
+    """
+    Filter to index a dict once, to look up several properties
+    """
+    if isinstance(metadata, PropertyIndex):
+        return metadata
+    return PropertyIndex(metadata, separator)
+
+
+def get_property(metadata: dict | PropertyIndex, property_key, separator: str = None):
+    """
+    Returns the value of the property from the metadata, or None.
+
+    :param metadata: The metadata, or its PropertyIndex to re-use
+    :param str property_key: The path to the property, or regular expression
+    :param str separator: The path separator, defaults to ::
+    """
+    if not isinstance(metadata, PropertyIndex) or (
+        separator is not None and separator != metadata.separator
+    ):
+        metadata = PropertyIndex(
+            metadata.metadata if isinstance(metadata, PropertyIndex) else metadata,
+            separator,
+        )
+    return metadata.get(property_key)
 
 
 def to_yaml(value):
@@ -124,4 +252,6 @@ JINJA_FILTERS = {
     "env_override": env_override,
     "base64encode": base64encode,
     "base64decode": base64decode,
+    "property_index": property_index,
+    "get_property": get_property,
 }
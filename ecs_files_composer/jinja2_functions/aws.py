@@ -18,10 +18,13 @@ from botocore.exceptions import ClientError
 from compose_x_common.aws.ec2 import get_ec2_subnet_from_vpc_and_ip_cidr
 from compose_x_common.compose_x_common import keyisset
 
-from ecs_files_composer.jinja2_filters import get_property
+from ecs_files_composer.jinja2_filters import PropertyIndex, get_property
 
+# Index of the last metadata document fetched, by metadata type
+METADATA_INDEXES: dict = {}
 
-def define_ecs_metadata(for_task=False):
+
+def define_ecs_metadata_url(for_task=False) -> str:
     meta_v4 = "ECS_CONTAINER_METADATA_URI_V4"
     meta_v3 = "ECS_CONTAINER_METADATA_URI"
 
@@ -32,9 +35,12 @@ def define_ecs_metadata(for_task=False):
     else:
         raise OSError("No ECS Metadata URL provided. This filter only works on ECS")
     if for_task:
-        return requests.get(f"{meta_url}/task")
-    else:
-        return requests.get(meta_url)
+        return f"{meta_url}/task"
+    return meta_url
+
+
+def define_ecs_metadata(for_task=False):
+    return requests.get(define_ecs_metadata_url(for_task))
 
 
 def msk_bootstrap(msk_arn: str, broker_type: str) -> str:
@@ -117,28 +123,53 @@ def from_ssm(parameter_name: str) -> str:
     )
 
 
-def ecs_container_metadata(property_key=None, fallback_value=None):
-    metadata_raw = define_ecs_metadata()
-    metadata = metadata_raw.json()
+def index_metadata(metadata: dict, metadata_type: str = "task") -> PropertyIndex:
+    """
+    Returns the PropertyIndex of the fetched metadata document. The index, and the property lookups it cached,
+    are re-used as long as the document fetched is unchanged.
+    """
+    index = METADATA_INDEXES.get(metadata_type)
+    if index is None or index.metadata != metadata:
+        index = PropertyIndex(metadata)
+        METADATA_INDEXES[metadata_type] = index
+    return index
+
+
+def get_metadata_property(
+    metadata: dict | PropertyIndex,
+    property_key=None,
+    fallback_value=None,
+    metadata_type="task",
+):
+    """
+    Returns the property from the ECS metadata if property_key is set, otherwise the whole metadata.
+    The metadata can be given as a PropertyIndex, to re-use it across lookups.
+    """
+    if isinstance(metadata, PropertyIndex) and not property_key:
+        return metadata.metadata
     if property_key:
+        if not isinstance(metadata, PropertyIndex):
+            metadata = index_metadata(metadata, metadata_type)
         value = get_property(metadata, property_key)
         if value is None:
-            print(f"No container property found matching {property_key}")
+            print(f"No {metadata_type} property found matching {property_key}")
             return fallback_value
         return value
     return metadata
 
 
+def ecs_container_metadata(property_key=None, fallback_value=None):
+    metadata_raw = define_ecs_metadata()
+    return get_metadata_property(
+        metadata_raw.json(), property_key, fallback_value, "container"
+    )
+
+
 def ecs_task_metadata(property_key=None, fallback_value=None):
     metadata_raw = define_ecs_metadata(for_task=True)
-    metadata = metadata_raw.json()
-    if property_key:
-        value = get_property(metadata, property_key)
-        if value is None:
-            print(f"No task property found matching {property_key}")
-            return fallback_value
-        return value
-    return metadata
+    return get_metadata_property(
+        metadata_raw.json(), property_key, fallback_value, "task"
+    )
 
 
 def using_resolve(resolve_string: str) -> str:
@@ -0,0 +1,258 @@
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""
+Two-pass rendering of templates.
+
+The first pass renders the template with functions that only record the calls to from_ssm, from_ssm_json,
+from_resolve and the ECS metadata functions. The values are then retrieved concurrently and in batches
+(ssm:GetParameters, secretsmanager:BatchGetSecretValue, a single call per metadata endpoint), and the second
+pass renders the template with functions returning the prefetched values.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from aws_cfn_custom_resource_resolve_parser import parse_secret_resolve_string
+from jinja2 import ChainableUndefined
+
+from ecs_files_composer.aws_mgmt import CLIENTS_POOL
+from ecs_files_composer.common import LOG
+from ecs_files_composer.jinja2_filters import PropertyIndex
+from ecs_files_composer.jinja2_functions.aws import (
+    define_ecs_metadata,
+    ecs_container_metadata,
+    ecs_task_metadata,
+    from_ssm,
+    get_metadata_property,
+    using_resolve,
+)
+from ecs_files_composer.plan import DEFAULT_IAM_CONTEXT, ExecutionPlan, PlannedFetch
+
+MAX_WORKERS = 8
+
+
+class CallsRecorder:
+    """
+    Functions for the first pass, recording the values to retrieve.
+    The calls return undefined values which render as empty strings, and allow chained attribute access.
+    """
+
+    def __init__(self):
+        self.ssm_parameters: list = []
+        self.resolve_strings: list = []
+        self.task_metadata = False
+        self.container_metadata = False
+
+    def from_ssm(self, parameter_name: str):
+        if parameter_name not in self.ssm_parameters:
+            self.ssm_parameters.append(parameter_name)
+        return ChainableUndefined(name=parameter_name)
+
+    def from_resolve(self, resolve_string: str):
+        if resolve_string not in self.resolve_strings:
+            self.resolve_strings.append(resolve_string)
+        return ChainableUndefined(name=resolve_string)
+
+    def ecs_task_metadata(self, property_key=None, fallback_value=None):
+        self.task_metadata = True
+        return ChainableUndefined(name=property_key)
+
+    def ecs_container_metadata(self, property_key=None, fallback_value=None):
+        self.container_metadata = True
+        return ChainableUndefined(name=property_key)
+
+    @staticmethod
+    def skip(*args, **kwargs):
+        """Functions that are not prefetched are only called during the second pass"""
+        return ChainableUndefined()
+
+    @property
+    def functions(self) -> dict:
+        return {
+            "msk_bootstrap": self.skip,
+            "msk_endpoints": self.skip,
+            "msk_cluster_zookeeper": self.skip,
+            "ec2_zone_id": self.skip,
+            "subnet_zone_id": self.skip,
+            "from_ssm": self.from_ssm,
+            "from_ssm_json": self.from_ssm,
+            "from_resolve": self.from_resolve,
+            "ecs_task_metadata": self.ecs_task_metadata,
+            "ecs_container_metadata": self.ecs_container_metadata,
+        }
+
+
+class PrefetchedValues:
+    """
+    Retrieves the recorded values, and provides the functions for the second pass.
+    Values that could not be prefetched are retrieved as usual when called.
+    """
+
+    def __init__(self, recorder: CallsRecorder):
+        self.recorder = recorder
+        self.ssm_parameters: dict = {}
+        self.secrets: dict = {}
+        self.parsed_secrets: dict = {}
+        self.resolved: dict = {}
+        self.task_metadata = None
+        self.container_metadata = None
+
+    def fetch_ssm_parameters(self, names: list) -> None:
+        client = CLIENTS_POOL.get_client(CLIENTS_POOL.default_session, "ssm")
+        parameters_r = client.get_parameters(Names=names, WithDecryption=True)
+        for parameter in parameters_r["Parameters"]:
+            self.ssm_parameters[parameter["Name"]] = parameter["Value"]
+            self.ssm_parameters[parameter["ARN"]] = parameter["Value"]
+
+    def fetch_secrets(self, secret_ids: list) -> None:
+        client = CLIENTS_POOL.get_client(CLIENTS_POOL.default_session, "secretsmanager")
+        secrets_r = client.batch_get_secret_value(SecretIdList=secret_ids)
+        for secret in secrets_r["SecretValues"]:
+            value = secret.get("SecretString", secret.get("SecretBinary"))
+            self.secrets[secret["Name"]] = value
+            self.secrets[secret["ARN"]] = value
+
+    def secret_value(self, secret: str):
+        """
+        Parses the prefetched secret when first looked up, as using_resolve does, so that a secret which is not JSON
+        only fails its own lookups.
+        """
+        if secret not in self.parsed_secrets:
+            value = self.secrets[secret]
+            self.parsed_secrets[secret] = json.loads(
+                value if isinstance(value, str) else base64.b64decode(value)
+            )
+        return self.parsed_secrets[secret]
+
+    def resolve(self, resolve_string: str) -> None:
+        self.resolved[resolve_string] = using_resolve(resolve_string)
+
+    def fetch_metadata(self, for_task: bool) -> None:
+        metadata = PropertyIndex(define_ecs_metadata(for_task=for_task).json())
+        if for_task:
+            self.task_metadata = metadata
+        else:
+            self.container_metadata = metadata
+
+    def plan(self) -> tuple[ExecutionPlan, list]:
+        """
+        The plan of the batch API calls retrieving the recorded SSM parameters and secrets, and the resolve strings
+        of secrets versions, retrieved one by one.
+        """
+        plan = ExecutionPlan()
+        to_resolve: list = []
+        for parameter_name in self.recorder.ssm_parameters:
+            plan.add_fetch(PlannedFetch("ssm", "GetParameters", parameter_name))
+        for resolve_string in self.recorder.resolve_strings:
+            try:
+                secret, key, stage = parse_secret_resolve_string(resolve_string)
+            except ValueError:
+                continue
+            if stage not in [None, "AWSCURRENT"]:
+                to_resolve.append(resolve_string)
+            else:
+                plan.add_fetch(
+                    PlannedFetch("secretsmanager", "BatchGetSecretValue", secret)
+                )
+        return plan, to_resolve
+
+    def prefetch(self) -> None:
+        """Retrieves all the recorded values concurrently"""
+        plan, to_resolve = self.plan()
+        batch_fetchers = {
+            "ssm": self.fetch_ssm_parameters,
+            "secretsmanager": self.fetch_secrets,
+        }
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = []
+            for service, fetches in plan.grouped().get(DEFAULT_IAM_CONTEXT, {}).items():
+                for batch in plan.batches(service, fetches):
+                    futures.append(
+                        executor.submit(
+                            batch_fetchers[service], [fetch.resource for fetch in batch]
+                        )
+                    )
+            futures += [
+                executor.submit(self.resolve, resolve_string)
+                for resolve_string in to_resolve
+            ]
+            if self.recorder.task_metadata:
+                futures.append(executor.submit(self.fetch_metadata, True))
+            if self.recorder.container_metadata:
+                futures.append(executor.submit(self.fetch_metadata, False))
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as error:
+                    LOG.warning(f"Failed to prefetch template values: {error}")
+
+    def from_ssm(self, parameter_name: str) -> str:
+        if parameter_name in self.ssm_parameters:
+            return self.ssm_parameters[parameter_name]
+        return from_ssm(parameter_name)
+
+    def from_ssm_json(self, parameter_name: str) -> dict:
+        try:
+            return json.loads(self.from_ssm(parameter_name))
+        except json.JSONDecodeError:
+            return {}
+
+    def from_resolve(self, resolve_string: str):
+        if resolve_string in self.resolved:
+            return self.resolved[resolve_string]
+        try:
+            secret, key, stage = parse_secret_resolve_string(resolve_string)
+        except ValueError:
+            secret, key = None, None
+        if secret in self.secrets:
+            value = self.secret_value(secret)
+            if key and key not in value:
+                raise KeyError(f"Secret {secret} does not have a key {key}")
+            return value[key] if key else value
+        return using_resolve(resolve_string)
+
+    def ecs_task_metadata(self, property_key=None, fallback_value=None):
+        if self.task_metadata is None:
+            return ecs_task_metadata(property_key, fallback_value)
+        return get_metadata_property(
+            self.task_metadata, property_key, fallback_value, "task"
+        )
+
+    def ecs_container_metadata(self, property_key=None, fallback_value=None):
+        if self.container_metadata is None:
+            return ecs_container_metadata(property_key, fallback_value)
+        return get_metadata_property(
+            self.container_metadata, property_key, fallback_value, "container"
+        )
+
+    @property
+    def functions(self) -> dict:
+        return {
+            "from_ssm": self.from_ssm,
+            "from_ssm_json": self.from_ssm_json,
+            "from_resolve": self.from_resolve,
+            "ecs_task_metadata": self.ecs_task_metadata,
+            "ecs_container_metadata": self.ecs_container_metadata,
+        }
+
+
+def prefetch_template_functions(template, **render_kwargs) -> dict:
+    """
+    Renders the template a first time to record the calls, prefetches the values, and returns the functions
+    to render the template with.
+
+    :param jinja2.Template template:
+    :param render_kwargs: The variables to render the template with
+    """
+    recorder = CallsRecorder()
+    try:
+        template.render(**render_kwargs, **recorder.functions)
+    except Exception as error:
+        LOG.debug(f"Template recording pass stopped early: {error}")
+    values = PrefetchedValues(recorder)
+    values.prefetch()
+    return values.functions
@@ -0,0 +1,330 @@
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""
+Module to compute the execution plan of a job, without any side effect.
+Sources are normalized, grouped by IAM context & service, and duplicates collapsed, which allows
+to evaluate the number of API calls that the job will make, and where calls could be batched.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from enum import Enum
+
+import requests
+from dacite import Config, from_dict
+
+from ecs_files_composer import input
+from ecs_files_composer.aws_mgmt import S3Fetcher, SsmFetcher
+from ecs_files_composer.common import LOG
+from ecs_files_composer.envsubst import expandvars
+
+DEFAULT_IAM_CONTEXT = "default"
+
+# Maximum number of items that can be retrieved in a single batch API call, per service.
+BATCH_SIZES: dict = {
+    "ssm": ("GetParameters", 10),
+    "secretsmanager": ("BatchGetSecretValue", 20),
+}
+
+
+def iam_context_name(iam_override: input.IamOverrideDef = None) -> str:
+    """Returns a string representing the IAM context the API calls will be made with"""
+    if not iam_override:
+        return DEFAULT_IAM_CONTEXT
+    if iam_override.AccessKeyId:
+        return f"access-key:{iam_override.AccessKeyId}"
+    if not iam_override.RoleArn:
+        return DEFAULT_IAM_CONTEXT
+    parts = [iam_override.RoleArn]
+    if iam_override.ExternalId:
+        parts.append(f"external-id:{iam_override.ExternalId}")
+    if iam_override.RegionName:
+        parts.append(iam_override.RegionName)
+    return " ".join(parts)
+
+
+@dataclass
+class PlannedFetch:
+    """A single API call to retrieve a source, possibly shared by several files"""
+
+    service: str
+    action: str
+    resource: str
+    iam_context: str = DEFAULT_IAM_CONTEXT
+    iam_override: input.IamOverrideDef = None
+    files: list = field(default_factory=list)
+    size: int = None
+
+    @property
+    def key(self) -> tuple:
+        return self.service, self.resource, self.iam_context
+
+
+@dataclass
+class ExecutionPlan:
+    """
+    The plan of all the actions a job will execute.
+    """
+
+    fetches: list = field(default_factory=list)
+    inline_files: list = field(default_factory=list)
+    templates: list = field(default_factory=list)
+    certificates: dict = field(default_factory=dict)
+    iam_contexts: dict = field(default_factory=dict)
+
+    def add_fetch(self, fetch: PlannedFetch) -> PlannedFetch:
+        """Adds the fetch to the plan, or the files to an identical existing fetch"""
+        for existing in self.fetches:
+            if existing.key == fetch.key:
+                existing.files += fetch.files
+                return existing
+        self.fetches.append(fetch)
+        if fetch.iam_context not in self.iam_contexts:
+            self.iam_contexts[fetch.iam_context] = fetch.iam_override
+        return fetch
+
+    @property
+    def files_count(self) -> int:
+        return sum(len(fetch.files) for fetch in self.fetches) + len(self.inline_files)
+
+    @property
+    def assume_role_calls(self) -> int:
+        return len(
+            [
+                iam_override
+                for iam_override in self.iam_contexts.values()
+                if iam_override
+                and iam_override.RoleArn
+                and not iam_override.AccessKeyId
+            ]
+        )
+
+    def grouped(self) -> dict:
+        """Fetches grouped by IAM context and then by service"""
+        groups: dict = {}
+        for fetch in self.fetches:
+            groups.setdefault(fetch.iam_context, {}).setdefault(
+                fetch.service, []
+            ).append(fetch)
+        return groups
+
+    @staticmethod
+    def batches(service: str, fetches: list) -> list:
+        """Splits the fetches of the service into the batches of its batch API call"""
+        if service not in BATCH_SIZES:
+            return [[fetch] for fetch in fetches]
+        size = BATCH_SIZES[service][1]
+        return [fetches[i : i + size] for i in range(0, len(fetches), size)]
+
+    def batched_calls(self, service: str, fetches: list) -> int:
+        return len(self.batches(service, fetches))
+
+    @property
+    def api_calls(self) -> int:
+        return len(self.fetches) + self.assume_role_calls
+
+    @property
+    def api_calls_batched(self) -> int:
+        total = self.assume_role_calls
+        for services in self.grouped().values():
+            for service, fetches in services.items():
+                total += self.batched_calls(service, fetches)
+        return total
+
+    @property
+    def estimated_size(self) -> int | None:
+        sizes = [fetch.size for fetch in self.fetches if fetch.size is not None]
+        return sum(sizes) if sizes else None
+
+    def render(self) -> str:
+        """Human readable version of the plan"""
+        lines = [
+            f"Execution plan: {self.files_count} file(s), "
+            f"{len(self.certificates)} certificate(s)"
+        ]
+        for context, services in self.grouped().items():
+            lines.append(f"IAM context: {context}")
+            for service, fetches in services.items():
+                calls = f"  {service} {fetches[0].action} x{len(fetches)}"
+                if service in BATCH_SIZES and self.batched_calls(
+                    service, fetches
+                ) < len(fetches):
+                    calls += (
+                        f" (batchable into {self.batched_calls(service, fetches)}"
+                        f" {BATCH_SIZES[service][0]} call(s))"
+                    )
+                lines.append(calls)
+                for fetch in fetches:
+                    size = f" ({fetch.size} bytes)" if fetch.size is not None else ""
+                    lines.append(
+                        f"    {fetch.resource}{size} -> {', '.join(fetch.files)}"
+                    )
+        if self.inline_files:
+            lines.append(f"Inline content: {', '.join(self.inline_files)}")
+        if self.templates:
+            lines.append(
+                f"Jinja2 templates (template functions API calls not planned): "
+                f"{', '.join(self.templates)}"
+            )
+        for cert_path, key_generation in self.certificates.items():
+            lines.append(f"Certificate: {cert_path} ({key_generation})")
+        lines.append(
+            f"Total: {self.api_calls} API call(s), of which {self.assume_role_calls} sts:AssumeRole."
+            f" {self.api_calls_batched} API call(s) with batching."
+        )
+        if self.estimated_size is not None:
+            lines.append(f"Estimated download size: {self.estimated_size} bytes")
+        return "\n".join(lines)
+
+
+def plan_ssm_source(source: input.SsmDef) -> tuple:
+    return (
+        "ssm",
+        "GetParameter",
+        SsmFetcher.parse_name(expandvars(source.ParameterName)),
+    )
+
+
+def plan_s3_source(source: input.S3Def) -> tuple:
+    if source.S3Uri:
+        bucket, key = S3Fetcher.parse_location(s3_uri=source.S3Uri)
+    elif source.ComposeXUri:
+        bucket, key = S3Fetcher.parse_location(composex_uri=source.ComposeXUri)
+    else:
+        bucket, key = expandvars(source.BucketName), expandvars(source.Key)
+    return "s3", "GetObject", f"s3://{bucket}/{key}"
+
+
+def plan_s3_prefix_source(source: input.S3PrefixDef) -> tuple:
+    if source.S3Uri and S3Fetcher.prefix_re.match(source.S3Uri):
+        bucket, prefix = S3Fetcher.prefix_re.match(source.S3Uri).groups()
+    else:
+        bucket, prefix = expandvars(source.BucketName), expandvars(source.Prefix or "")
+    return "s3", "ListObjectsV2", f"s3://{bucket}/{prefix}"
+
+
+def plan_secret_source(source: input.SecretDef) -> tuple:
+    resource = expandvars(source.SecretId)
+    if source.VersionId:
+        resource += f"@{source.VersionId}"
+    elif source.VersionStage:
+        resource += f"@{source.VersionStage}"
+    return "secretsmanager", "GetSecretValue", resource
+
+
+def plan_file(
+    plan: ExecutionPlan, file_path: str, file: input.FileDef, job: input.Model
+) -> None:
+    context = file.context.value if isinstance(file.context, Enum) else file.context
+    if context == "jinja2":
+        plan.templates.append(file_path)
+    if not file.source or file.content:
+        plan.inline_files.append(file_path)
+        return
+    source = file.source
+    iam_override = None
+    if source.Url:
+        service, action, resource = "url", "GET", source.Url.Url
+    elif source.Ssm:
+        service, action, resource = plan_ssm_source(source.Ssm)
+        iam_override = source.Ssm.IamOverride
+    elif source.S3:
+        service, action, resource = plan_s3_source(source.S3)
+        iam_override = source.S3.IamOverride
+    elif source.SsmPath:
+        service, action, resource = (
+            "ssm",
+            "GetParametersByPath",
+            expandvars(source.SsmPath.Path),
+        )
+        iam_override = source.SsmPath.IamOverride
+    elif source.S3Prefix:
+        service, action, resource = plan_s3_prefix_source(source.S3Prefix)
+        iam_override = source.S3Prefix.IamOverride
+    elif source.Secret:
+        service, action, resource = plan_secret_source(source.Secret)
+        iam_override = source.Secret.IamOverride
+    else:
+        plan.inline_files.append(file_path)
+        return
+    if service != "url" and not iam_override:
+        iam_override = job.IamOverride
+    plan.add_fetch(
+        PlannedFetch(
+            service=service,
+            action=action,
+            resource=resource,
+            iam_context=iam_context_name(iam_override),
+            iam_override=iam_override,
+            files=[file_path],
+        )
+    )
+
+
+def estimate_size(fetch: PlannedFetch) -> int | None:
+    """Uses HEAD requests to retrieve the size of S3 objects & URL sources."""
+    try:
+        if fetch.service == "s3" and fetch.action == "GetObject":
+            bucket, key = S3Fetcher.bucket_re.match(fetch.resource).groups()
+            fetcher = S3Fetcher(iam_config_object=fetch.iam_override)
+            return fetcher.client_for(bucket).head_object(Bucket=bucket, Key=key)[
+                "ContentLength"
+            ]
+        elif fetch.service == "url":
+            req = requests.head(fetch.resource, allow_redirects=True)
+            req.raise_for_status()
+            if req.headers.get("Content-Length"):
+                return int(req.headers["Content-Length"])
+    except Exception as error:
+        LOG.warning(f"Unable to estimate size of {fetch.resource}: {error}")
+    return None
+
+
+KEY_TYPES = {"RSA": "RSA 4096", "EC": "EC P-256"}
+
+
+def plan_certificates(certificates: input.Certificates) -> dict:
+    """Describes the keys generated for the certificates, and the CA signing them"""
+    planned: dict = {}
+    ca = certificates.ca
+    if ca and ca.certSource:
+        planned[ca.dir_path or "CA"] = "CA loaded from sources"
+    elif ca:
+        planned[ca.dir_path or "CA"] = (
+            f"CA, {KEY_TYPES[input.KeyType(ca.keyType).value]} key generation"
+            + (" unless reused" if ca.reuseExisting else "")
+        )
+    for cert_path, cert_def in (certificates.x509 or {}).items():
+        key_type = input.KeyType(cert_def.keyType or ("EC" if ca else "RSA")).value
+        description = f"{KEY_TYPES[key_type]} key generation, " + (
+            "signed by the job CA" if ca else "self-signed"
+        )
+        if cert_def.reuseExisting:
+            description += ", unless reused"
+        planned[cert_path] = description
+    return planned
+
+
+def build_plan(config: dict, with_size: bool = False) -> ExecutionPlan:
+    """
+    Builds the execution plan for the job configuration.
+
+    :param dict config: The job configuration, as for start_jobs
+    :param bool with_size: Whether to use HEAD requests to estimate the download size
+    :rtype: ExecutionPlan
+    """
+    job = from_dict(
+        data_class=input.Model, data=config, config=Config(cast=[Enum, bytes])
+    )
+    plan = ExecutionPlan()
+    if job.certificates:
+        plan.certificates = plan_certificates(job.certificates)
+    if job.files:
+        for file_path, file in job.files.items():
+            plan_file(plan, file_path, file, job)
+    if with_size:
+        for fetch in plan.fetches:
+            fetch.size = estimate_size(fetch)
+    return plan
@@ -0,0 +1,288 @@
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""
+Profiling of the execution, by phase (parse, fetch, render, write, certs), with the standard library only.
+
+The phases are the spans of the execution timeline: each phase has its own cProfile profile, enabled while the phase
+is the innermost one running, and its own memory accounting with tracemalloc: peak of the traced memory and the
+allocation sites of the memory still allocated when the phase ends. Time and memory out of these phases are reported
+as the "other" phase.
+
+Optionally, a sampling profiler records the stacks of all the threads at a fixed interval, attributed to the phase
+running, in the collapsed stacks format of flame graphs tools (i.e. speedscope, flamegraph.pl).
+"""
+
+from __future__ import annotations
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from os import path
+
+from ecs_files_composer.tracing import TRACER
+
+# Spans categories, and the phase they are profiled as
+PHASES = {
+    "config": "parse",
+    "fetch": "fetch",
+    "render": "render",
+    "write": "write",
+    "certificates": "certs",
+    "keygen": "certs",
+}
+OTHER_PHASE = "other"
+# Allocations by the profiling itself, and the imports machinery, are not reported
+IGNORED_ALLOCATIONS = (
+    tracemalloc.__file__,
+    __file__,
+    "<frozen importlib._bootstrap>",
+    "<frozen importlib._bootstrap_external>",
+    "<unknown>",
+)
+
+
+def format_size(size: int) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+class PhaseProfile:
+    """Profile and memory accounting of all the runs of a phase"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.profile = cProfile.Profile()
+        self.runs = 0
+        self.duration = 0.0
+        self.peak_memory = 0
+        self.allocations: dict = {}
+        self.samples: Counter = Counter()
+
+    def add_allocations(self, snapshot, start_snapshot) -> None:
+        """Adds the memory allocated during the run of the phase, and not released, by allocation site"""
+        for stat in snapshot.compare_to(start_snapshot, "lineno"):
+            if stat.size_diff <= 0 or stat.traceback[0].filename in IGNORED_ALLOCATIONS:
+                continue
+            site = str(stat.traceback)
+            size, count = self.allocations.get(site, (0, 0))
+            self.allocations[site] = (size + stat.size_diff, count + stat.count_diff)
+
+    def stats(self) -> pstats.Stats | None:
+        stats = pstats.Stats(self.profile)
+        return stats if stats.stats else None
+
+
+class PhaseRun:
+    """A run of a phase, i.e. the fetch of a file"""
+
+    def __init__(self, phase: PhaseProfile, with_snapshot: bool = True):
+        self.phase = phase
+        self.peak_memory = 0
+        self.start_memory = tracemalloc.get_traced_memory()[0]
+        self.start_snapshot = tracemalloc.take_snapshot() if with_snapshot else None
+        self.start = time.perf_counter()
+
+
+class Profiler:
+    """
+    Profiles the phases of the execution run on the thread which started the profiler.
+    With asyncio, phases of concurrent tasks overlap: the time is attributed to the phase started last.
+    """
+
+    def __init__(self, output_dir: str, top: int = 25, sampling_interval: float = None):
+        """
+        :param str output_dir: Folder to write the reports to
+        :param int top: Number of functions and allocation sites listed for each phase
+        :param float sampling_interval: Interval in seconds of the sampling profiler. Disabled if not set.
+        """
+        self.output_dir = output_dir
+        self.top = top
+        self.sampling_interval = sampling_interval
+        self.phases: dict = {}
+        self.runs: list = []
+        self.thread_ident = None
+        self.peak_memory = 0
+        self._started_tracemalloc = False
+        self._sampler = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def get_phase(self, name: str) -> PhaseProfile:
+        if name not in self.phases:
+            self.phases[name] = PhaseProfile(name)
+        return self.phases[name]
+
+    @property
+    def current(self) -> PhaseProfile:
+        return self.runs[-1].phase
+
+    def start(self) -> None:
+        os.makedirs(self.output_dir, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self.thread_ident = threading.get_ident()
+        self.runs = [PhaseRun(self.get_phase(OTHER_PHASE), with_snapshot=False)]
+        self.current.profile.enable()
+        TRACER.listeners.append(self.phase)
+        if self.sampling_interval:
+            self._stop.clear()
+            self._sampler = threading.Thread(
+                target=self.sample, name="files-composer-sampler", daemon=True
+            )
+            self._sampler.start()
+
+    def stop(self) -> None:
+        if self.phase in TRACER.listeners:
+            TRACER.listeners.remove(self.phase)
+        if self._sampler:
+            self._stop.set()
+            self._sampler.join()
+            self._sampler = None
+        self.current.profile.disable()
+        self.update_peaks()
+        for run in self.runs:
+            self.end_run(run)
+        self.peak_memory = max(
+            [self.peak_memory] + [run.peak_memory for run in self.runs]
+        )
+        self.runs = []
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def update_peaks(self) -> None:
+        """Records the peak of the memory in the running phases, before it is reset"""
+        peak = tracemalloc.get_traced_memory()[1]
+        for run in self.runs:
+            run.peak_memory = max(run.peak_memory, peak)
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+
+    def end_run(self, run: PhaseRun) -> None:
+        phase = run.phase
+        phase.runs += 1
+        phase.duration += time.perf_counter() - run.start
+        phase.peak_memory = max(phase.peak_memory, run.peak_memory - run.start_memory)
+        if run.start_snapshot:
+            phase.add_allocations(tracemalloc.take_snapshot(), run.start_snapshot)
+
+    @contextmanager
+    def phase(self, name: str, category: str):
+        """
+        Listener of the tracer spans, running the block as the phase of the span category.
+        Profiles are disabled while the profiler accounts for the memory, so that it is not in the reports.
+        """
+        phase_name = PHASES.get(category)
+        if (
+            not phase_name
+            or threading.get_ident() != self.thread_ident
+            or not self.runs
+        ):
+            yield
+            return
+        self.current.profile.disable()
+        self.update_peaks()
+        run = PhaseRun(self.get_phase(phase_name))
+        with self._lock:
+            self.runs.append(run)
+        run.phase.profile.enable()
+        try:
+            yield
+        finally:
+            if run in self.runs:
+                self.current.profile.disable()
+                self.update_peaks()
+                with self._lock:
+                    self.runs.remove(run)
+                self.end_run(run)
+                self.current.profile.enable()
+
+    def sample(self) -> None:
+        """Records the stacks of the threads, until stopped"""
+        while not self._stop.wait(self.sampling_interval):
+            with self._lock:
+                if not self.runs:
+                    continue
+                phase = self.current
+            for ident, frame in sys._current_frames().items():
+                if ident == threading.get_ident():
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({path.basename(code.co_filename)}:{frame.f_lineno})"
+                    )
+                    frame = frame.f_back
+                phase.samples[";".join(reversed(stack))] += 1
+
+    def phase_summary(self, phase: PhaseProfile) -> str:
+        lines = [
+            f"== {phase.name}: {phase.runs} run(s), {phase.duration:.3f}s,"
+            f" peak memory {format_size(phase.peak_memory)}",
+        ]
+        stats = phase.stats()
+        if stats:
+            hotspots = io.StringIO()
+            stats.stream = hotspots
+            stats.sort_stats("tottime").print_stats(self.top)
+            lines.append(hotspots.getvalue().strip())
+        if phase.allocations:
+            lines.append(f"Top {self.top} allocation sites (memory still allocated):")
+            for site, (size, count) in sorted(
+                phase.allocations.items(), key=lambda item: item[1][0], reverse=True
+            )[: self.top]:
+                lines.append(f"  {site}: {format_size(size)} in {count} blocks")
+        return "\n".join(lines)
+
+    def write(self) -> list:
+        """
+        Writes the pstats file of each phase, the profile of all the phases, the summary with the hotspots and
+        allocation sites of each phase, and the sampled stacks.
+
+        :return: The paths of the files written
+        """
+        written: list = []
+        all_stats = None
+        for phase in self.phases.values():
+            stats = phase.stats()
+            if not stats:
+                continue
+            stats_path = path.join(self.output_dir, f"{phase.name}.pstats")
+            stats.dump_stats(stats_path)
+            written.append(stats_path)
+            if all_stats is None:
+                all_stats = pstats.Stats(stats_path)
+            else:
+                all_stats.add(stats_path)
+        if all_stats:
+            stats_path = path.join(self.output_dir, "profile.pstats")
+            all_stats.dump_stats(stats_path)
+            written.append(stats_path)
+        summary_path = path.join(self.output_dir, "summary.txt")
+        with open(summary_path, "w") as summary_fd:
+            summary_fd.write(f"Peak memory: {format_size(self.peak_memory)}\n\n")
+            for phase in self.phases.values():
+                summary_fd.write(self.phase_summary(phase) + "\n\n")
+        written.append(summary_path)
+        for phase in self.phases.values():
+            if not phase.samples:
+                continue
+            samples_path = path.join(self.output_dir, f"{phase.name}.folded")
+            with open(samples_path, "w") as samples_fd:
+                for stack, count in phase.samples.most_common():
+                    samples_fd.write(f"{stack} {count}\n")
+            written.append(samples_path)
+        return written
@@ -0,0 +1,178 @@
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""
+Synchronization of all the objects under an S3 prefix into a local directory.
+
+Objects are listed with ListObjectsV2, filtered with glob patterns, and downloaded concurrently using the same client.
+Local files which have the same size, and the same modification time or MD5 digest as the object ETag, are not
+downloaded again.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from fnmatch import fnmatch
+from os import path
+from tempfile import NamedTemporaryFile
+
+from ecs_files_composer.archives import (
+    CHUNK_SIZE,
+    get_member_path,
+    iter_chunks,
+    set_attributes,
+)
+from ecs_files_composer.aws_mgmt import S3Fetcher
+from ecs_files_composer.common import LOG
+
+
+@dataclass
+class SyncResult:
+    downloaded: list = field(default_factory=list)
+    unchanged: list = field(default_factory=list)
+    deleted: list = field(default_factory=list)
+
+
+def is_selected(relative_key: str, include: list = None, exclude: list = None) -> bool:
+    """Whether the relative key matches one of the include patterns, if any, and none of the exclude patterns"""
+    if include and not any(fnmatch(relative_key, pattern) for pattern in include):
+        return False
+    if exclude and any(fnmatch(relative_key, pattern) for pattern in exclude):
+        return False
+    return True
+
+
+def file_md5(file_path: str) -> str:
+    digest = hashlib.md5()
+    with open(file_path, "rb") as file_fd:
+        for chunk in iter_chunks(file_fd, CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_unchanged(file_path: str, s3_object: dict) -> bool:
+    """
+    Whether the local file is the same as the object: same size, and either the modification time set when it was
+    downloaded, or the same MD5 as the ETag of objects not uploaded in multiple parts.
+    """
+    if not path.isfile(file_path) or path.getsize(file_path) != s3_object["Size"]:
+        return False
+    if int(path.getmtime(file_path)) == int(s3_object["LastModified"].timestamp()):
+        return True
+    etag = s3_object["ETag"].strip('"')
+    return "-" not in etag and file_md5(file_path) == etag
+
+
+class S3PrefixSync:
+    """
+    Synchronizes the objects under the prefix into the target directory.
+    """
+
+    def __init__(
+        self,
+        fetcher: S3Fetcher,
+        s3_bucket: str,
+        prefix: str,
+        target_dir: str,
+        mode: str = "0644",
+        owner: str = "root",
+        group: str = "root",
+        bucket_region: str = None,
+    ):
+        self.fetcher = fetcher
+        self.s3_bucket = s3_bucket
+        self.bucket_region = bucket_region
+        self.prefix = prefix if not prefix or prefix.endswith("/") else f"{prefix}/"
+        self.target_dir = target_dir
+        self.mode = int(mode, 8)
+        self.owner = owner
+        self.group = group
+
+    def relative_key(self, key: str) -> str:
+        return key[len(self.prefix) :]
+
+    def download(self, s3_object: dict, file_path: str) -> None:
+        """Downloads the object to a temporary file in the same folder, moved into place once complete"""
+        os.makedirs(path.dirname(file_path), exist_ok=True)
+        body = self.fetcher.get_object(
+            self.s3_bucket, s3_object["Key"], bucket_region=self.bucket_region
+        )["Body"]
+        with NamedTemporaryFile(
+            dir=path.dirname(file_path), prefix=".files-composer-", delete=False
+        ) as tmp_fd:
+            try:
+                for chunk in body.iter_chunks(CHUNK_SIZE):
+                    tmp_fd.write(chunk)
+            except BaseException:
+                os.unlink(tmp_fd.name)
+                raise
+        modified = s3_object["LastModified"].timestamp()
+        os.utime(tmp_fd.name, (modified, modified))
+        set_attributes(tmp_fd.name, self.mode, self.owner, self.group)
+        os.replace(tmp_fd.name, file_path)
+
+    def delete_extraneous(
+        self, synced: set, include: list = None, exclude: list = None
+    ) -> list:
+        """Deletes the files matching the filters that are not in the prefix"""
+        deleted: list = []
+        for dir_path, _, file_names in os.walk(self.target_dir):
+            for file_name in file_names:
+                file_path = path.realpath(path.join(dir_path, file_name))
+                relative_path = path.relpath(file_path, path.realpath(self.target_dir))
+                if file_path in synced or not is_selected(
+                    relative_path, include, exclude
+                ):
+                    continue
+                os.unlink(file_path)
+                deleted.append(file_path)
+        return deleted
+
+    def sync(
+        self,
+        include: list = None,
+        exclude: list = None,
+        delete: bool = False,
+        max_workers: int = 16,
+    ) -> SyncResult:
+        """
+        :param list include: Glob patterns of the objects to retrieve, relative to the prefix. Defaults to all.
+        :param list exclude: Glob patterns of the objects to ignore, relative to the prefix
+        :param bool delete: Deletes the files matching the filters which are not in the prefix
+        :param int max_workers: Maximum number of objects downloaded concurrently
+        """
+        result = SyncResult()
+        synced: set = set()
+        os.makedirs(self.target_dir, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = []
+            for s3_object in self.fetcher.list_objects(
+                self.s3_bucket, self.prefix, self.bucket_region
+            ):
+                relative_key = self.relative_key(s3_object["Key"])
+                if (
+                    not relative_key
+                    or relative_key.endswith("/")
+                    or not is_selected(relative_key, include, exclude)
+                ):
+                    continue
+                file_path = get_member_path(self.target_dir, relative_key)
+                synced.add(file_path)
+                if is_unchanged(file_path, s3_object):
+                    result.unchanged.append(file_path)
+                    continue
+                futures.append(executor.submit(self.download, s3_object, file_path))
+                result.downloaded.append(file_path)
+            for future in futures:
+                future.result()
+        if delete:
+            result.deleted = self.delete_extraneous(synced, include, exclude)
+        LOG.info(
+            f"s3://{self.s3_bucket}/{self.prefix} synchronized to {self.target_dir}: "
+            f"{len(result.downloaded)} downloaded, {len(result.unchanged)} unchanged, "
+            f"{len(result.deleted)} deleted"
+        )
+        return result
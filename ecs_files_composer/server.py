@@ -0,0 +1,141 @@
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""
+Server mode, keeping the composer resident to execute jobs submitted over a local Unix socket.
+
+The imports, AWS sessions, clients, IAM credentials and compiled templates are kept warm across jobs.
+The protocol is one JSON document per line: each request gets one response line.
+
+Request: {"name": "app", "config": {<job configuration>}, "async": false}
+     or: {"name": "app", "source": {"ssm_parameter": "/config/app", "decode_base64": false, "context": "jinja2"}}
+     or: {"name": "app", "source": {"raw": "<job configuration content>"}}
+Response: {"name": "app", "success": true, "duration": 0.1, "error": null, "files": {"/path": "completed"}, "retries": {"s3": 1}}
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import signal
+import socket
+import socketserver
+from dataclasses import asdict
+
+from ecs_files_composer.common import LOG
+from ecs_files_composer.ecs_files_composer import JobResult, init_config, run_jobs
+
+# init_config arguments a request source can set
+SOURCE_KEYS = [
+    "raw",
+    "file_path",
+    "env_var",
+    "ssm_parameter",
+    "s3_config",
+    "secret_config",
+    "decode_base64",
+    "context",
+]
+
+
+def execute_request(request: dict) -> dict:
+    """Loads the job configuration of the request, executes it and returns the result"""
+    name = request.get("name", "job")
+    try:
+        if "config" in request:
+            config = request["config"]
+        elif "source" in request:
+            config = init_config(
+                **{
+                    key: value
+                    for key, value in request["source"].items()
+                    if key in SOURCE_KEYS
+                }
+            )
+        else:
+            raise ValueError("The request must define either config or source")
+    except Exception as error:
+        LOG.exception(error)
+        return asdict(JobResult(name=name, success=False, error=str(error)))
+    return asdict(run_jobs([(name, config)], use_async=request.get("async", False))[0])
+
+
+class JobRequestHandler(socketserver.StreamRequestHandler):
+    """Executes the jobs requests received on the connection, one per line"""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as error:
+                response = asdict(
+                    JobResult(name="invalid", success=False, error=str(error))
+                )
+            else:
+                response = execute_request(request)
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class JobsServer(socketserver.UnixStreamServer):
+    """
+    Jobs are executed one at a time, in the order they are received, so that they safely share the process caches.
+    """
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        # The socket is created with the 0600 mode, so that no other user can connect before it is restricted
+        umask = os.umask(0o077)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+        os.chmod(self.server_address, 0o600)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def serve(socket_path: str) -> None:
+    """
+    Listens on the Unix socket and executes the jobs submitted, until interrupted.
+
+    :param str socket_path: Path of the Unix socket to create. Only the current user can connect to it.
+    """
+
+    def interrupt(signum, frame):
+        raise KeyboardInterrupt()
+
+    signal.signal(signal.SIGTERM, interrupt)
+    with JobsServer(socket_path, JobRequestHandler) as server:
+        LOG.info(f"Listening for jobs on {socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            LOG.info("Stopping server")
+
+
+def submit_jobs(socket_path: str, jobs: list, timeout: float = None) -> list:
+    """
+    Submits the jobs requests to the server, over a single connection.
+
+    :param str socket_path: Path to the server Unix socket
+    :param list jobs: The jobs requests
+    :param float timeout: Timeout, in seconds, for each job
+    :return: The result of each job
+    """
+    responses: list = []
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(socket_path)
+        with client.makefile("rwb") as stream:
+            for request in jobs:
+                stream.write(json.dumps(request).encode("utf-8") + b"\n")
+                stream.flush()
+                responses.append(json.loads(stream.readline()))
+    return responses
@@ -0,0 +1,168 @@
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""
+Download cache shared by the composers running on the same host, i.e. a host path bind-mounted into the tasks.
+
+Entries are addressed by the source and the version of its content (S3 VersionId or ETag, HTTP ETag), so a new
+version of the content is a new entry. Composers cooperate with file locks: only one downloads an entry, while the
+others wait for it and then copy it. The least recently used entries are evicted when the cache exceeds its size.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import os
+from contextlib import contextmanager
+from os import environ, path
+
+from ecs_files_composer.common import LOG
+
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+
+
+def url_version(headers) -> str | None:
+    """Returns the version of the content of the URL from the HTTP response headers, if it can be identified"""
+    if headers.get("ETag"):
+        return headers["ETag"]
+    if headers.get("Last-Modified") and headers.get("Content-Length"):
+        return f"{headers['Last-Modified']}|{headers['Content-Length']}"
+    return None
+
+
+class SharedCache:
+    """
+    Content addressed download cache in a folder shared between processes.
+    Composers sharing the cache must run as the same user: entries are only readable by their owner.
+    """
+
+    def __init__(self, cache_dir: str = None, max_size: int = DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.cache_dir)
+
+    @property
+    def entries_dir(self) -> str:
+        return path.join(self.cache_dir, "entries")
+
+    @property
+    def locks_dir(self) -> str:
+        return path.join(self.cache_dir, "locks")
+
+    def set_cache_dir(self, cache_dir: str = None, max_size: int = None) -> None:
+        self.cache_dir = cache_dir
+        if max_size:
+            self.max_size = max_size
+
+    @staticmethod
+    def entry_key(identity: str, version: str) -> str:
+        return hashlib.sha256(f"{identity}\n{version}".encode("utf-8")).hexdigest()
+
+    def entry_path(self, key: str) -> str:
+        return path.join(self.entries_dir, key)
+
+    @contextmanager
+    def lock(self, key: str, operation: int):
+        """
+        Holds the lock of the entry. Lock files are kept, so that all the processes always lock the same file.
+
+        :param int operation: fcntl.LOCK_SH or fcntl.LOCK_EX, optionally with fcntl.LOCK_NB
+        """
+        lock_fd = os.open(path.join(self.locks_dir, key), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock_fd, operation)
+            yield
+        finally:
+            os.close(lock_fd)
+
+    def open_entry(self, key: str):
+        """Opens the entry if it exists, marking it as the most recently used"""
+        try:
+            entry_fd = open(self.entry_path(key), "rb")
+        except FileNotFoundError:
+            return None
+        os.utime(self.entry_path(key))
+        return entry_fd
+
+    def download(self, key: str, chunks) -> None:
+        tmp_path = path.join(self.entries_dir, f".{key}.{os.getpid()}.tmp")
+        try:
+            with open(
+                os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb"
+            ) as tmp_fd:
+                for chunk in chunks:
+                    tmp_fd.write(chunk)
+            os.replace(tmp_path, self.entry_path(key))
+        except BaseException:
+            if path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def open(self, identity: str, version: str, download):
+        """
+        Returns the cached content, opened in binary mode. When not cached, only one of the processes
+        downloads it, while the others wait for it.
+
+        :param str identity: The source of the content, i.e. s3://bucket/key
+        :param str version: The version of the content, i.e. the S3 object ETag
+        :param download: Callable returning an iterable of the chunks of the content, to download it
+        """
+        os.makedirs(self.entries_dir, mode=0o700, exist_ok=True)
+        os.makedirs(self.locks_dir, mode=0o700, exist_ok=True)
+        key = self.entry_key(identity, version)
+        with self.lock(key, fcntl.LOCK_SH):
+            entry_fd = self.open_entry(key)
+        if entry_fd:
+            LOG.debug(f"{identity} ({version}) - found in the shared cache")
+            return entry_fd
+        with self.lock(key, fcntl.LOCK_EX):
+            entry_fd = self.open_entry(key)
+            if not entry_fd:
+                LOG.debug(f"{identity} ({version}) - downloading to the shared cache")
+                self.download(key, download())
+                entry_fd = self.open_entry(key)
+        self.evict(keep=key)
+        return entry_fd
+
+    def evict(self, keep: str = None) -> list:
+        """
+        Removes the least recently used entries until the cache is within its size.
+        Entries being read or downloaded by other processes are skipped.
+
+        :return: The keys of the entries removed
+        """
+        entries: list = []
+        for entry in os.scandir(self.entries_dir):
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+            entry_stat = entry.stat()
+            entries.append((entry_stat.st_mtime, entry_stat.st_size, entry.name))
+        total_size = sum(size for _, size, _ in entries)
+        evicted: list = []
+        for _, size, key in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            if key == keep:
+                continue
+            try:
+                with self.lock(key, fcntl.LOCK_EX | fcntl.LOCK_NB):
+                    os.unlink(self.entry_path(key))
+            except (BlockingIOError, FileNotFoundError):
+                continue
+            total_size -= size
+            evicted.append(key)
+        if evicted:
+            LOG.debug(f"Evicted {len(evicted)} entries from the shared cache")
+        return evicted
+
+
+SHARED_CACHE = SharedCache(
+    cache_dir=environ.get("FILES_COMPOSER_SHARED_CACHE_DIR", None),
+    max_size=int(environ.get("FILES_COMPOSER_SHARED_CACHE_MAX_SIZE", 1024))
+    * 1024
+    * 1024,
+)
@@ -0,0 +1,130 @@
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""
+Rendering of SSM parameters hierarchies, retrieved with GetParametersByPath.
+The parameters are either written each to its own file, or rendered together into a single file.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import shlex
+from os import path
+
+import yaml
+
+from ecs_files_composer.archives import get_member_path, set_attributes
+from ecs_files_composer.common import LOG
+
+ENV_KEY_RE = re.compile(r"[^A-Za-z\d_]")
+
+
+def relative_name(parameter_name: str, parameters_path: str) -> str:
+    """Name of the parameter relative to the path, i.e. db/host for /app/prod/db/host under /app/prod"""
+    return parameter_name[len(parameters_path.rstrip("/")) :].strip("/")
+
+
+def by_depth(parameters: dict) -> list:
+    return sorted(parameters, key=lambda name: (name.count("/"), name))
+
+
+def to_tree(parameters: dict, parameters_path: str) -> dict:
+    """
+    Nests the parameters by the levels of their relative name.
+    A parameter cannot also be the parent level of other parameters: these other parameters are skipped.
+    """
+    tree: dict = {}
+    for parameter_name in by_depth(parameters):
+        levels = relative_name(parameter_name, parameters_path).split("/")
+        node = tree
+        for level in levels[:-1]:
+            node = node.setdefault(level, {})
+            if not isinstance(node, dict):
+                LOG.warning(f"{parameter_name} is under another parameter. Skipping")
+                break
+        else:
+            node[levels[-1]] = parameters[parameter_name]
+    return tree
+
+
+def to_env(parameters: dict, parameters_path: str) -> str:
+    lines = []
+    for parameter_name, value in sorted(parameters.items()):
+        key = ENV_KEY_RE.sub("_", relative_name(parameter_name, parameters_path))
+        lines.append(f"{key.upper()}={shlex.quote(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def escape_property(value: str, is_key: bool = False) -> str:
+    value = (
+        value.replace("\\", "\\\\")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+        .replace("\t", "\\t")
+    )
+    if is_key:
+        value = re.sub(r"([=: #!])", r"\\\1", value)
+    return value
+
+
+def to_properties(parameters: dict, parameters_path: str) -> str:
+    lines = []
+    for parameter_name, value in sorted(parameters.items()):
+        key = relative_name(parameter_name, parameters_path).replace("/", ".")
+        lines.append(f"{escape_property(key, True)}={escape_property(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def render_parameters(
+    parameters: dict, parameters_path: str, output_format: str
+) -> str:
+    """
+    Renders the parameters into a single document
+
+    :param dict parameters: The value of each parameter, by name
+    :param str parameters_path: The path the parameters were retrieved from
+    :param str output_format: json, yaml, env or properties
+    """
+    if output_format == "json":
+        return json.dumps(to_tree(parameters, parameters_path), indent=2)
+    elif output_format == "yaml":
+        return yaml.dump(to_tree(parameters, parameters_path), Dumper=yaml.Dumper)
+    elif output_format == "env":
+        return to_env(parameters, parameters_path)
+    elif output_format == "properties":
+        return to_properties(parameters, parameters_path)
+    raise ValueError(f"Unsupported format {output_format}")
+
+
+def write_parameters_files(
+    parameters: dict,
+    parameters_path: str,
+    target_dir: str,
+    mode: str = "0644",
+    owner: str = "root",
+    group: str = "root",
+) -> list:
+    """
+    Writes each parameter to its own file, at its relative name in the target directory.
+    A parameter cannot also be the parent level of other parameters: these other parameters are skipped.
+
+    :return: The paths of the files written
+    """
+    written: list = []
+    for parameter_name in by_depth(parameters):
+        file_path = get_member_path(
+            target_dir, relative_name(parameter_name, parameters_path)
+        )
+        try:
+            os.makedirs(path.dirname(file_path), exist_ok=True)
+        except (FileExistsError, NotADirectoryError):
+            LOG.warning(f"{parameter_name} is under another parameter. Skipping")
+            continue
+        with open(file_path, "w") as file_fd:
+            file_fd.write(parameters[parameter_name])
+        set_attributes(file_path, int(mode, 8), owner, group)
+        written.append(file_path)
+    return written
@@ -0,0 +1,175 @@
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""
+Timeline of the execution, in the Chrome Trace Event format, to open with Perfetto (ui.perfetto.dev) or
+chrome://tracing.
+
+Each phase (configuration, credentials, fetch, render, write, post-processing, key generation) is recorded as a
+complete event, on the track of the thread, or of the asyncio task, which ran it. Tracing is disabled by default,
+in which case recording a span only checks the flag.
+
+Listeners (i.e. the profiler) can also be notified of the spans, to run the phases of the execution in their context.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+
+def current_track() -> tuple:
+    """The asyncio task running the code, if any, otherwise the thread"""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is not None:
+        return ("task", id(task)), f"task {task.get_name()}"
+    thread = threading.current_thread()
+    return ("thread", thread.ident), thread.name
+
+
+class Tracer:
+    """Records the spans of the execution"""
+
+    def __init__(self):
+        self.enabled = False
+        self.listeners: list = []
+        self.events: list = []
+        self.tracks: dict = {}
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    def enable(self) -> None:
+        with self._lock:
+            self.enabled = True
+            self.events = []
+            self.tracks = {}
+            self._origin = time.perf_counter()
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    @property
+    def active(self) -> bool:
+        """Whether the spans are recorded, or notified to listeners"""
+        return self.enabled or bool(self.listeners)
+
+    def timestamp(self) -> float:
+        """Microseconds since tracing was enabled"""
+        return (time.perf_counter() - self._origin) * 1e6
+
+    def track_id(self) -> int:
+        key, name = current_track()
+        with self._lock:
+            if key not in self.tracks:
+                self.tracks[key] = (len(self.tracks) + 1, name)
+            return self.tracks[key][0]
+
+    @contextmanager
+    def span(self, name: str, category: str, **args):
+        """
+        Records the execution of the block as a complete event
+
+        :param str name: Name of the event, i.e. the file path
+        :param str category: Phase of the execution, i.e. fetch, render
+        :param args: Details displayed with the event
+        """
+        if not self.active:
+            yield
+            return
+        with ExitStack() as listeners:
+            for listener in list(self.listeners):
+                listeners.enter_context(listener(name, category))
+            if not self.enabled:
+                yield
+                return
+            track_id = self.track_id()
+            start = self.timestamp()
+            try:
+                yield
+            finally:
+                event = {
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": start,
+                    "dur": self.timestamp() - start,
+                    "pid": os.getpid(),
+                    "tid": track_id,
+                }
+                if args:
+                    event["args"] = args
+                with self._lock:
+                    self.events.append(event)
+
+    def trace_events(self) -> list:
+        """The recorded events, with the names of the threads and tasks tracks"""
+        with self._lock:
+            metadata = [
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": os.getpid(),
+                    "tid": track_id,
+                    "args": {"name": name},
+                }
+                for track_id, name in self.tracks.values()
+            ]
+            return metadata + sorted(self.events, key=lambda event: event["ts"])
+
+    def write(self, file_path: str) -> None:
+        with open(file_path, "w") as trace_fd:
+            json.dump(
+                {"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, trace_fd
+            )
+
+
+TRACER = Tracer()
+
+
+def traced(category: str, name: str = None):
+    """
+    Decorator recording the calls to the function. For methods of objects with a path (i.e. files),
+    the path is used as the event name.
+
+    :param str category: Phase of the execution
+    :param str name: Name of the event. Defaults to the path of the object, or the function name.
+    """
+
+    def get_name(func, args) -> str:
+        if name:
+            return name
+        if args and isinstance(getattr(args[0], "path", None), str):
+            return args[0].path
+        return func.__qualname__
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not TRACER.active:
+                    return await func(*args, **kwargs)
+                with TRACER.span(get_name(func, args), category):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not TRACER.active:
+                return func(*args, **kwargs)
+            with TRACER.span(get_name(func, args), category):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
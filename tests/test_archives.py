@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""Tests for the decompression and extraction of sources."""
+
+import gzip
+import hashlib
+import io
+import stat
+import tarfile
+import threading
+import zipfile
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ecs_files_composer.archives import ArchiveError, ArchiveExtractor
+from ecs_files_composer.ecs_files_composer import start_jobs
+
+CONTENT = b"line of configuration\n" * 4096
+
+
+@pytest.fixture
+def http_server(tmp_path):
+    served = tmp_path / "served"
+    served.mkdir()
+    (served / "config.txt.gz").write_bytes(gzip.compress(CONTENT))
+    with tarfile.open(served / "bundle.tar.gz", "w:gz") as archive:
+        for name in ["conf/app.conf", "conf.d/other.conf"]:
+            info = tarfile.TarInfo(name)
+            info.size = len(CONTENT)
+            archive.addfile(info, io.BytesIO(CONTENT))
+    with zipfile.ZipFile(served / "bundle.zip", "w") as archive:
+        archive.writestr("zipped/app.conf", CONTENT)
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), partial(SimpleHTTPRequestHandler, directory=str(served))
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", served
+    server.shutdown()
+
+
+def test_decompress_and_extract(tmp_path, http_server):
+    url, served = http_server
+    out_dir = tmp_path / "out"
+    config = {
+        "files": {
+            str(out_dir / "config.txt"): {
+                "source": {"Url": {"Url": f"{url}/config.txt.gz"}},
+                "decompress": "gzip",
+            },
+            str(out_dir / "tar"): {
+                "source": {
+                    "Url": {"Url": f"{url}/bundle.tar.gz"},
+                    "Sha256": hashlib.sha256(
+                        (served / "bundle.tar.gz").read_bytes()
+                    ).hexdigest(),
+                },
+                "extract": "tar",
+                "mode": "0600",
+            },
+            str(out_dir / "zip"): {
+                "source": {"Url": {"Url": f"{url}/bundle.zip"}},
+                "extract": "zip",
+            },
+        }
+    }
+    start_jobs(config)
+    assert (out_dir / "config.txt").read_bytes() == CONTENT
+    assert (out_dir / "tar/conf/app.conf").read_bytes() == CONTENT
+    assert (out_dir / "tar/conf.d/other.conf").read_bytes() == CONTENT
+    assert stat.S_IMODE((out_dir / "tar/conf/app.conf").stat().st_mode) == 0o600
+    assert stat.S_IMODE((out_dir / "tar/conf").stat().st_mode) == 0o700
+    assert (out_dir / "zip/zipped/app.conf").read_bytes() == CONTENT
+    assert sorted(path.name for path in out_dir.iterdir()) == [
+        "config.txt",
+        "tar",
+        "zip",
+    ]
+
+
+def test_extract_outside_target(tmp_path):
+    archive_fd = io.BytesIO()
+    with tarfile.open(fileobj=archive_fd, mode="w") as archive:
+        info = tarfile.TarInfo("../escaped.txt")
+        info.size = 4
+        archive.addfile(info, io.BytesIO(b"nope"))
+    extractor = ArchiveExtractor(str(tmp_path / "target"), "0644", "root", "root")
+    with pytest.raises(ArchiveError):
+        extractor.extract([archive_fd.getvalue()], "tar")
+    assert not (tmp_path / "escaped.txt").exists()
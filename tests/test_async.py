@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""Tests for the asyncio execution core."""
+
+import asyncio
+import base64
+import gzip
+import hashlib
+import io
+import tarfile
+import threading
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from boto3.session import Session
+from botocore.credentials import RefreshableCredentials
+
+pytest.importorskip("aiobotocore")
+pytest.importorskip("aiohttp")
+
+from ecs_files_composer.async_mgmt import SessionCredentialProvider
+from ecs_files_composer.ecs_files_composer import start_jobs
+from ecs_files_composer.jinja2_functions.prefetch import PrefetchedValues
+
+LARGE_CONTENT = b"line of configuration\n" * 256 * 1024
+
+
+@pytest.fixture
+def http_server(tmp_path):
+    (tmp_path / "served").mkdir()
+    (tmp_path / "served/remote.txt").write_text("FROM URL {{ env_var('ASYNC_VAR') }}")
+    (tmp_path / "served/large.txt.gz").write_bytes(gzip.compress(LARGE_CONTENT))
+    with tarfile.open(tmp_path / "served/conf.tar.gz", "w:gz") as archive:
+        info = tarfile.TarInfo("app.conf")
+        info.size = len(LARGE_CONTENT)
+        archive.addfile(info, io.BytesIO(LARGE_CONTENT))
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0),
+        partial(SimpleHTTPRequestHandler, directory=str(tmp_path / "served")),
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_async_jobs(tmp_path, monkeypatch, http_server):
+    monkeypatch.setenv("ASYNC_VAR", "async")
+    config = {
+        "files": {
+            str(tmp_path / "out/plain.txt"): {"content": "THIS IS A TEST"},
+            str(tmp_path / "out/jinja.txt"): {
+                "content": "{{ env_var('ASYNC_VAR') }}",
+                "context": "jinja2",
+            },
+            str(tmp_path / "out/url.txt"): {
+                "source": {"Url": {"Url": f"{http_server}/remote.txt"}},
+                "context": "jinja2",
+            },
+        }
+    }
+    start_jobs(config, use_async=True)
+    assert (tmp_path / "out/plain.txt").read_text() == "THIS IS A TEST"
+    assert (tmp_path / "out/jinja.txt").read_text() == "async"
+    assert (tmp_path / "out/url.txt").read_text() == "FROM URL async"
+
+
+def test_async_streamed_source(tmp_path, http_server):
+    compressed = (tmp_path / "served/large.txt.gz").read_bytes()
+    config = {
+        "files": {
+            str(tmp_path / "out/large.txt"): {
+                "source": {
+                    "Url": {"Url": f"{http_server}/large.txt.gz"},
+                    "Sha256": hashlib.sha256(compressed).hexdigest(),
+                },
+                "decompress": "gzip",
+            },
+            str(tmp_path / "out/mismatch.txt"): {
+                "source": {
+                    "Url": {"Url": f"{http_server}/large.txt.gz"},
+                    "Sha256": "0" * 64,
+                },
+                "decompress": "gzip",
+                "ignore_failure": True,
+            },
+        }
+    }
+    start_jobs(config, use_async=True)
+    assert (tmp_path / "out/large.txt").read_bytes() == LARGE_CONTENT
+    assert not (tmp_path / "out/mismatch.txt").exists()
+
+
+def test_async_post_fetch_processing(tmp_path, http_server):
+    config = {
+        "files": {
+            str(tmp_path / "out/conf"): {
+                "source": {"Url": {"Url": f"{http_server}/conf.tar.gz"}},
+                "context": "jinja2",
+                "extract": "tar",
+            },
+            str(tmp_path / "out/mismatch.txt"): {
+                "content": base64.b64encode(gzip.compress(b"content")).decode(),
+                "encoding": "base64",
+                "decompress": "gzip",
+                "source": {"Sha256": "0" * 64},
+                "ignore_failure": True,
+                "commands": {"post": ["false"]},
+            },
+        }
+    }
+    start_jobs(config, use_async=True)
+    assert (tmp_path / "out/conf/app.conf").read_bytes() == LARGE_CONTENT
+    assert not (tmp_path / "out/mismatch.txt").exists()
+
+
+def test_async_prefetched_template(tmp_path, monkeypatch):
+    batches: list = []
+
+    def fetch_ssm_parameters(self, names):
+        batches.append(names)
+        for name in names:
+            self.ssm_parameters[name] = f"value{name}"
+
+    monkeypatch.setattr(PrefetchedValues, "fetch_ssm_parameters", fetch_ssm_parameters)
+    content = "".join(
+        f"p{count}={{{{ from_ssm('/param{count}') }}}}\n" for count in range(12)
+    )
+    file_path = tmp_path / "prefetch.conf"
+    start_jobs(
+        {
+            "files": {
+                str(file_path): {
+                    "content": content,
+                    "context": "jinja2",
+                    "prefetch": True,
+                }
+            }
+        },
+        use_async=True,
+    )
+    assert [len(batch) for batch in batches] == [10, 2]
+    assert file_path.read_text().endswith("p11=value/param11")
+
+
+def test_async_credentials_refreshed():
+    refreshes: list = []
+
+    def refresh():
+        refreshes.append(1)
+        # Expiring within the mandatory refresh period, so every use refreshes them
+        return {
+            "access_key": f"key{len(refreshes)}",
+            "secret_key": "secret",
+            "token": "token",
+            "expiry_time": (
+                datetime.now(timezone.utc) + timedelta(minutes=5)
+            ).isoformat(),
+        }
+
+    session = Session(region_name="eu-west-1")
+    session._session._credentials = RefreshableCredentials.create_from_metadata(
+        refresh(), refresh, "assume-role"
+    )
+
+    async def load():
+        credentials = await SessionCredentialProvider(session).load()
+        return (await credentials.get_frozen_credentials()).access_key
+
+    # Loaded from the refreshed boto3 credentials, then refreshed through them again
+    assert asyncio.run(load()) == "key3"
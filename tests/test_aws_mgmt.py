@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""Tests for the AWS session & credentials handling."""
+
+import datetime
+from unittest.mock import MagicMock
+
+import pytest
+from botocore.exceptions import ClientError
+
+from ecs_files_composer import aws_mgmt
+from ecs_files_composer.aws_mgmt import (
+    AssumedRoleCredentialsCache,
+    BucketRegionsCache,
+    ClientsPool,
+    RetriesCounter,
+    S3Fetcher,
+    get_retries_config,
+    set_session_from_iam_object,
+)
+from ecs_files_composer.input import IamOverrideDef, RetriesDef
+
+ROLE_ARN = "arn:aws:iam::111122223333:role/files-composer"
+
+
+class StsClient:
+    def __init__(self):
+        self.calls = 0
+
+    def assume_role(self, **params):
+        self.calls += 1
+        return {
+            "Credentials": {
+                "AccessKeyId": f"ASIA{self.calls:016d}",
+                "SecretAccessKey": "secret",
+                "SessionToken": "token",
+                "Expiration": datetime.datetime.now(datetime.timezone.utc)
+                + datetime.timedelta(hours=1),
+            }
+        }
+
+
+class SourceSession:
+    def __init__(self):
+        self.sts = StsClient()
+
+    def client(self, service_name):
+        return self.sts
+
+
+@pytest.fixture
+def source_session():
+    return SourceSession()
+
+
+def test_assumed_role_is_cached(source_session):
+    cache = AssumedRoleCredentialsCache()
+    session = cache.get_session(
+        ROLE_ARN, "test", region="eu-west-1", source_session=source_session
+    )
+    assert (
+        cache.get_session(
+            ROLE_ARN, "test", region="eu-west-1", source_session=source_session
+        )
+        is session
+    )
+    assert source_session.sts.calls == 1
+    assert session.region_name == "eu-west-1"
+    assert session.get_credentials().get_frozen_credentials().token == "token"
+    cache.get_session(ROLE_ARN, "other", source_session=source_session)
+    assert source_session.sts.calls == 2
+
+
+def test_assumed_role_persisted(tmp_path, source_session):
+    cache = AssumedRoleCredentialsCache(cache_dir=str(tmp_path))
+    cache.get_session(ROLE_ARN, "test", external_id="x", source_session=source_session)
+    new_process_cache = AssumedRoleCredentialsCache(cache_dir=str(tmp_path))
+    session = new_process_cache.get_session(
+        ROLE_ARN, "test", external_id="x", source_session=source_session
+    )
+    assert source_session.sts.calls == 1
+    assert session.get_credentials().access_key == f"ASIA{1:016d}"
+
+
+def test_static_keys_session_cached(tmp_path, monkeypatch):
+    cache = AssumedRoleCredentialsCache(cache_dir=str(tmp_path))
+    monkeypatch.setattr(aws_mgmt, "CREDENTIALS_CACHE", cache)
+    iam_override = IamOverrideDef(
+        AccessKeyId="AKIAEXAMPLE", SecretAccessKey="secret", SessionToken="token"
+    )
+    session = set_session_from_iam_object(iam_override)
+    assert set_session_from_iam_object(iam_override) is session
+    assert session.get_credentials().token == "token"
+    other = set_session_from_iam_object(
+        IamOverrideDef(AccessKeyId="AKIAEXAMPLE", SecretAccessKey="secret")
+    )
+    assert other is not session
+    assert not (tmp_path / cache.file_name).exists()
+
+
+def test_retries_config():
+    assert get_retries_config(RetriesDef(Mode="standard", MaxAttempts=3)) == {
+        "mode": "standard",
+        "max_attempts": 3,
+    }
+    assert get_retries_config()["max_attempts"] >= 1
+
+
+def test_clients_pool_shares_clients():
+    pool = ClientsPool()
+    session = pool.default_session
+    client = pool.get_client(session, "ssm", region_name="eu-west-1")
+    assert pool.get_client(session, "ssm", region_name="eu-west-1") is client
+    assert client.meta.config.retries["mode"] == get_retries_config()["mode"]
+    other = pool.get_client(
+        session, "ssm", region_name="eu-west-1", retries=RetriesDef(MaxAttempts=2)
+    )
+    assert other is not client
+
+
+def test_retries_counter():
+    class Model:
+        class service_model:
+            service_name = "ssm"
+
+    counter = RetriesCounter()
+    counter(parsed={"ResponseMetadata": {"RetryAttempts": 2}}, model=Model)
+    counter(parsed={"ResponseMetadata": {"RetryAttempts": 0}}, model=Model)
+    assert counter.retries == {"ssm": 2}
+
+
+class BucketClient:
+    def __init__(self, region: str = None, error: bool = False):
+        self.region = region
+        self.error = error
+        self.calls = 0
+        self.meta = MagicMock()
+
+    def head_bucket(self, Bucket):
+        self.calls += 1
+        response = {
+            "ResponseMetadata": {"HTTPHeaders": {"x-amz-bucket-region": self.region}}
+        }
+        if self.error:
+            raise ClientError(response, "HeadBucket")
+        return response
+
+
+class PoolSession:
+    region_name = "us-east-1"
+
+    def __init__(self, client: BucketClient):
+        self.head_client = client
+        self.regions: list = []
+
+    def client(self, service_name, region_name=None, config=None):
+        self.regions.append(region_name)
+        return self.head_client if region_name is None else BucketClient(region_name)
+
+
+@pytest.fixture
+def bucket_regions(monkeypatch):
+    cache = BucketRegionsCache()
+    monkeypatch.setattr(aws_mgmt, "BUCKET_REGIONS", cache)
+    monkeypatch.setattr(aws_mgmt, "CLIENTS_POOL", ClientsPool())
+    return cache
+
+
+@pytest.mark.parametrize("error", [False, True])
+def test_bucket_region_discovered_once(bucket_regions, error):
+    session = PoolSession(BucketClient("eu-west-1", error=error))
+    fetcher = S3Fetcher(client_session_override=session)
+    client = fetcher.client_for("central-bucket")
+    assert client.region == "eu-west-1"
+    assert fetcher.client_for("central-bucket") is client
+    assert session.head_client.calls == 1
+    assert session.regions == [None, "eu-west-1"]
+    assert bucket_regions.get("central-bucket") == "eu-west-1"
+
+
+def test_bucket_region_set(bucket_regions):
+    session = PoolSession(BucketClient("eu-west-1"))
+    fetcher = S3Fetcher(client_session_override=session)
+    assert fetcher.client_for("bucket", "ap-south-1").region == "ap-south-1"
+    assert fetcher.client_for("bucket", "us-east-1") is session.head_client
+    assert session.head_client.calls == 0
+
+
+def test_bucket_regions_persisted(tmp_path):
+    BucketRegionsCache(cache_dir=str(tmp_path)).set("bucket", "eu-west-1")
+    assert BucketRegionsCache(cache_dir=str(tmp_path)).get("bucket") == "eu-west-1"
+    assert BucketRegionsCache().get("bucket") is None
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""Tests for the files bundles."""
+
+import io
+import json
+import tarfile
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from os import path
+
+import pytest
+
+from ecs_files_composer.bundle import BundleIntegrityError, apply_bundle, create_bundle
+
+
+@pytest.fixture
+def bundle_config():
+    return {
+        "files": {
+            "/etc/app/app.conf": {"content": "THIS IS A TEST", "mode": "0600"},
+            "/etc/app/conf.d/jinja.conf": {
+                "content": "{{ 'value' | env_override('BUNDLE_TEST_VAR') }}",
+                "context": "jinja2",
+                "commands": {"post": ["false"]},
+            },
+        },
+        "certificates": {
+            "x509": {"/etc/app/certs": {"keyFileName": "k", "certFileName": "c"}}
+        },
+    }
+
+
+def test_bundle_and_apply(tmp_path, monkeypatch, bundle_config):
+    monkeypatch.setenv("BUNDLE_TEST_VAR", "rendered")
+    bundle_path = str(tmp_path / "bundle.tar.gz")
+    manifest = create_bundle(bundle_config, bundle_path)
+    assert [file["path"] for file in manifest["files"]] == [
+        "/etc/app/app.conf",
+        "/etc/app/conf.d/jinja.conf",
+    ]
+    root_dir = tmp_path / "root"
+    apply_bundle(bundle_path, root_dir=str(root_dir))
+    with open(root_dir / "etc/app/conf.d/jinja.conf") as file_fd:
+        assert file_fd.read() == "rendered"
+    assert (root_dir / "etc/app/app.conf").stat().st_mode & 0o777 == 0o600
+    assert not path.exists(root_dir / "etc/app/certs")
+
+
+@pytest.fixture
+def archive_url(tmp_path):
+    served = tmp_path / "served"
+    served.mkdir()
+    with tarfile.open(served / "conf.tar.gz", "w:gz") as archive:
+        for name, content in (("app.conf", b"app"), ("conf.d/other.conf", b"other")):
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), partial(SimpleHTTPRequestHandler, directory=str(served))
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/conf.tar.gz"
+    server.shutdown()
+
+
+def test_bundle_extracted_archive(tmp_path, archive_url):
+    bundle_path = str(tmp_path / "bundle.tar.gz")
+    config = {
+        "files": {
+            "/etc/app": {
+                "source": {"Url": {"Url": archive_url}},
+                "extract": "tar",
+                "mode": "0600",
+            }
+        }
+    }
+    manifest = create_bundle(config, bundle_path)
+    assert [(file["path"], file["mode"]) for file in manifest["files"]] == [
+        ("/etc/app/app.conf", "0600"),
+        ("/etc/app/conf.d/other.conf", "0600"),
+    ]
+    root_dir = tmp_path / "root"
+    apply_bundle(bundle_path, root_dir=str(root_dir))
+    assert (root_dir / "etc/app/app.conf").read_bytes() == b"app"
+    assert (root_dir / "etc/app/conf.d/other.conf").read_bytes() == b"other"
+    assert (root_dir / "etc/app/app.conf").stat().st_mode & 0o777 == 0o600
+
+
+def test_apply_corrupted_bundle(tmp_path):
+    bundle_path = str(tmp_path / "bundle.tar.gz")
+    manifest = json.dumps(
+        {
+            "version": 1,
+            "files": [
+                {
+                    "path": "/test.txt",
+                    "mode": "0644",
+                    "owner": "root",
+                    "group": "root",
+                    "size": 4,
+                    "sha256": "0" * 64,
+                }
+            ],
+        }
+    ).encode()
+    with tarfile.open(bundle_path, "w:gz") as archive:
+        for name, content in (("manifest.json", manifest), ("test.txt", b"test")):
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    with pytest.raises(BundleIntegrityError):
+        apply_bundle(bundle_path, root_dir=str(tmp_path / "root"))
+    assert not path.exists(tmp_path / "root/test.txt")
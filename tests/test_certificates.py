@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""Tests for the x509 certificates and keystores generation."""
+
+from os import path
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.serialization import pkcs12
+
+from ecs_files_composer import certificates_mgmt
+from ecs_files_composer.ecs_files_composer import merge_configs, start_jobs
+
+
+@pytest.fixture()
+def keystores_config(tmp_path):
+    return {
+        "certificates": {
+            "x509": {
+                str(tmp_path): {
+                    "keyFileName": "server.key",
+                    "certFileName": "server.crt",
+                    "commonName": "kafka.internal",
+                    "keystore": {
+                        "fileName": "keystore.p12",
+                        "alias": "kafka",
+                        "password": {"EnvVar": "KEYSTORE_PASSWORD"},
+                    },
+                    "truststore": {"fileName": "truststore.p12"},
+                }
+            }
+        }
+    }
+
+
+def test_pkcs12_keystores(tmp_path, monkeypatch, keystores_config):
+    monkeypatch.setenv("KEYSTORE_PASSWORD", "changeit")
+    start_jobs(keystores_config)
+    with open(path.join(tmp_path, "keystore.p12"), "rb") as keystore_fd:
+        keystore = pkcs12.load_pkcs12(keystore_fd.read(), b"changeit")
+    assert keystore.key is not None
+    assert keystore.cert.friendly_name == b"kafka"
+    with open(path.join(tmp_path, "truststore.p12"), "rb") as truststore_fd:
+        truststore = pkcs12.load_pkcs12(truststore_fd.read(), None)
+    assert truststore.key is None
+    assert truststore.additional_certs[0].certificate == keystore.cert.certificate
+
+
+def test_missing_password(keystores_config):
+    with pytest.raises(KeyError):
+        start_jobs(keystores_config)
+
+
+def test_jks_keystore(tmp_path, monkeypatch, keystores_config):
+    jks = pytest.importorskip("jks")
+    monkeypatch.setenv("KEYSTORE_PASSWORD", "changeit")
+    keystore_def = list(keystores_config["certificates"]["x509"].values())[0]
+    keystore_def["keystore"].update({"fileName": "keystore.jks", "type": "JKS"})
+    start_jobs(keystores_config)
+    keystore = jks.KeyStore.load(path.join(tmp_path, "keystore.jks"), "changeit")
+    assert "kafka" in keystore.private_keys
+
+
+def read_file(file_path: str) -> str:
+    with open(file_path) as file_fd:
+        return file_fd.read()
+
+
+def test_reuse_existing_certificate(tmp_path):
+    cert_def = {
+        "keyFileName": "server.key",
+        "certFileName": "server.crt",
+        "commonName": "kafka.internal",
+        "subjectAltNames": ["kafka.internal", "10.0.0.1"],
+        "reuseExisting": True,
+    }
+    config = {"certificates": {"x509": {str(tmp_path): cert_def}}}
+    cert_path = path.join(tmp_path, "server.crt")
+    start_jobs(config)
+    cert_content = read_file(cert_path)
+    start_jobs(config)
+    assert read_file(cert_path) == cert_content
+
+    cert_def["subjectAltNames"] = ["kafka.internal"]
+    start_jobs(config)
+    assert read_file(cert_path) != cert_content
+    cert_content = read_file(cert_path)
+
+    cert_def["minRemainingValidityInSeconds"] = (
+        cert_def.get("validityEndInSeconds", 8035200) + 60
+    )
+    start_jobs(config)
+    assert read_file(cert_path) != cert_content
+
+
+def load_cert(file_path: str):
+    with open(file_path, "rb") as cert_fd:
+        return x509.load_pem_x509_certificate(cert_fd.read())
+
+
+def ca_config(tmp_path) -> dict:
+    return {
+        "certificates": {
+            "ca": {
+                "dir_path": str(tmp_path / "ca"),
+                "keyFileName": "ca.key",
+                "bundleFileName": "ca-bundle.pem",
+            },
+            "x509": {
+                str(tmp_path / name): {
+                    "keyFileName": "server.key",
+                    "certFileName": "server.crt",
+                    "commonName": f"{name}.internal",
+                    "subjectAltNames": [f"{name}.internal"],
+                    "truststore": {"fileName": "truststore.p12"},
+                }
+                for name in ["kafka", "connect"]
+            },
+        }
+    }
+
+
+def test_job_ca_signs_certificates(tmp_path):
+    start_jobs(ca_config(tmp_path))
+    ca_cert = load_cert(tmp_path / "ca" / "ca.crt")
+    assert read_file(tmp_path / "ca" / "ca-bundle.pem") == read_file(
+        tmp_path / "ca" / "ca.crt"
+    )
+    for name in ["kafka", "connect"]:
+        cert = load_cert(tmp_path / name / "server.crt")
+        cert.verify_directly_issued_by(ca_cert)
+        assert isinstance(cert.public_key(), ec.EllipticCurvePublicKey)
+        with open(tmp_path / name / "truststore.p12", "rb") as truststore_fd:
+            truststore = pkcs12.load_pkcs12(truststore_fd.read(), None)
+        assert truststore.additional_certs[0].certificate == ca_cert
+
+
+def test_job_ca_from_sources(tmp_path, monkeypatch):
+    ca_dir = tmp_path / "ca"
+    start_jobs(ca_config(tmp_path))
+    sources = {
+        "/ca/cert": (ca_dir / "ca-bundle.pem").read_bytes(),
+        "/ca/key": (ca_dir / "ca.key").read_bytes(),
+    }
+    monkeypatch.setattr(
+        certificates_mgmt,
+        "get_source_content",
+        lambda source, iam_override=None, retries=None: sources[
+            source.Ssm.ParameterName
+        ],
+    )
+    config = ca_config(tmp_path / "new")
+    config["certificates"]["ca"].update(
+        {
+            "certSource": {"Ssm": {"ParameterName": "/ca/cert"}},
+            "keySource": {"Ssm": {"ParameterName": "/ca/key"}},
+        }
+    )
+    start_jobs(config)
+    load_cert(tmp_path / "new" / "kafka" / "server.crt").verify_directly_issued_by(
+        load_cert(ca_dir / "ca.crt")
+    )
+
+
+def test_merged_jobs_keep_ca(tmp_path):
+    config = ca_config(tmp_path)
+    ca_job = {
+        "IamOverride": {"RoleArn": "arn:aws:iam::123456789012:role/ca"},
+        "certificates": {
+            "ca": dict(
+                config["certificates"]["ca"],
+                keyPassword={"Ssm": {"ParameterName": "/ca/password"}},
+            )
+        },
+    }
+    certs_job = {"certificates": {"x509": config["certificates"]["x509"]}}
+    merged = merge_configs([ca_job, certs_job])
+    assert (
+        merged["certificates"]["ca"]["keyPassword"]["Ssm"]["IamOverride"]
+        == ca_job["IamOverride"]
+    )
+    assert merge_configs([ca_job])["certificates"] == {
+        "ca": merged["certificates"]["ca"]
+    }
+    del merged["certificates"]["ca"]["keyPassword"]
+    start_jobs(merged)
+    load_cert(tmp_path / "kafka" / "server.crt").verify_directly_issued_by(
+        load_cert(tmp_path / "ca" / "ca.crt")
+    )
@@ -3,7 +3,10 @@
 # Copyright 2020-2021 John Mille<john@compose-x.io>
 
 """Tests for `ecs_files_composer` package."""
+
 import json
+import os
+import stat
 import uuid
 from base64 import b64encode
 from os import path
@@ -12,7 +15,9 @@ import boto3.session
 import pytest
 
 from ecs_files_composer import input
-from ecs_files_composer.ecs_files_composer import start_jobs
+from ecs_files_composer.aws_mgmt import RETRIES_COUNTER
+from ecs_files_composer.ecs_files_composer import merge_configs, run_jobs, start_jobs
+from ecs_files_composer.files_mgmt import File
 
 HERE = path.abspath(path.dirname(__file__))
 
@@ -109,3 +114,192 @@ def test_simple_cert(simple_json_config_with_certs):
 
 def test_base64_and_jinja(base64_template):
     start_jobs(base64_template)
+
+
+def test_jinja_same_file_names(tmp_path, monkeypatch):
+    monkeypatch.setenv("FILE_NAME_TEST", "value")
+    config = {
+        "files": {
+            str(tmp_path / f"{folder}/app.conf"): {
+                "content": f"{folder}={{{{ env_var('FILE_NAME_TEST') }}}}",
+                "context": "jinja2",
+            }
+            for folder in ("one", "two/nested")
+        }
+    }
+    start_jobs(config)
+    with open(tmp_path / "one/app.conf") as file_fd:
+        assert file_fd.read() == "one=value"
+    with open(tmp_path / "two/nested/app.conf") as file_fd:
+        assert file_fd.read() == "two/nested=value"
+
+
+def test_directories_attributes(tmp_path, monkeypatch):
+    existing = tmp_path / "existing"
+    existing.mkdir(mode=0o755)
+    config = {
+        "files": {
+            str(tmp_path / "private/nested/app.conf"): {
+                "content": "app",
+                "mode": "0600",
+                "owner": str(os.getuid()),
+                "group": str(os.getgid()),
+            },
+            str(existing / "app.conf"): {"content": "app", "mode": "0600"},
+        }
+    }
+    start_jobs(config)
+    for dir_path in ("private", "private/nested"):
+        assert stat.S_IMODE((tmp_path / dir_path).stat().st_mode) == 0o700
+    assert stat.S_IMODE(existing.stat().st_mode) == 0o755
+
+
+def test_run_jobs_retries(tmp_path, monkeypatch):
+    class Model:
+        class service_model:
+            service_name = "ssm"
+
+    def post_processing(file):
+        if file.path.endswith("retried.txt"):
+            RETRIES_COUNTER(
+                parsed={"ResponseMetadata": {"RetryAttempts": 2}}, model=Model
+            )
+
+    monkeypatch.setattr(File, "post_processing", post_processing)
+    results = run_jobs(
+        [
+            ("retried", {"files": {str(tmp_path / "retried.txt"): {"content": "a"}}}),
+            ("other", {"files": {str(tmp_path / "other.txt"): {"content": "b"}}}),
+        ]
+    )
+    assert [result.retries for result in results] == [{"ssm": 2}, {}]
+
+
+def test_run_jobs_and_merge(tmp_path):
+    job_a = {
+        "IamOverride": {"RoleArn": "arn:aws:iam::123456789012:role/a"},
+        "files": {
+            str(tmp_path / "a.txt"): {"content": "a"},
+            str(tmp_path / "ssm.txt"): {"source": {"Ssm": {"ParameterName": "/a"}}},
+        },
+    }
+    job_b = {"files": {str(tmp_path / "b.txt"): {"content": "b"}}}
+    merged = merge_configs([job_a, job_b])
+    assert "IamOverride" not in merged and "certificates" not in merged
+    assert len(merged["files"]) == 3
+    assert (
+        merged["files"][str(tmp_path / "ssm.txt")]["source"]["Ssm"]["IamOverride"]
+        == job_a["IamOverride"]
+    )
+    assert "IamOverride" not in job_a["files"][str(tmp_path / "ssm.txt")]["source"]
+
+    failing = {"files": {str(tmp_path / "c.txt"): {"source": {"Url": {}}}}}
+    results = run_jobs([("b", job_b), ("failing", failing)])
+    assert [result.success for result in results] == [True, False]
+    assert (tmp_path / "b.txt").read_text() == "b"
+
+
+def test_jinja_stream_render(tmp_path):
+    template = (
+        "upstream backends {\n{% for port in range(20000) %}"
+        "  server 127.0.0.1:{{ port }};\n{% endfor %}}\n"
+    )
+    config = {
+        "files": {
+            str(tmp_path / "rendered.conf"): {"content": template, "context": "jinja2"},
+            str(tmp_path / "streamed.conf"): {
+                "content": template,
+                "context": "jinja2",
+                "stream_render": True,
+            },
+        }
+    }
+    start_jobs(config)
+    streamed = (tmp_path / "streamed.conf").read_text()
+    assert streamed == (tmp_path / "rendered.conf").read_text()
+    assert streamed.count("server 127.0.0.1") == 20000
+
+    config["files"] = {
+        str(tmp_path / "streamed.conf"): {
+            "content": "{% for i in range(100000) %}{{ i }}{% endfor %}{{ 1 / 0 }}",
+            "context": "jinja2",
+            "stream_render": True,
+        }
+    }
+    with pytest.raises(ZeroDivisionError):
+        start_jobs(config)
+    assert (tmp_path / "streamed.conf").read_text() == streamed
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "rendered.conf",
+        "streamed.conf",
+    ]
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_critical_files_first(tmp_path, monkeypatch, use_async):
+    ready_file = tmp_path / "ready"
+    ready_file.write_text("stale")
+    processed: list = []
+    monkeypatch.setattr(
+        File,
+        "post_processing",
+        lambda file: processed.append((path.basename(file.path), ready_file.exists())),
+    )
+    files = {
+        "dashboard.json": {"priority": 1},
+        "app.conf": {"critical": True},
+        "plugin.conf": {"priority": 5},
+        "secrets.env": {"critical": True, "priority": 10},
+    }
+    config = {
+        "files": {
+            str(tmp_path / file_name): {"content": file_name, **file_def}
+            for file_name, file_def in files.items()
+        },
+        "certificates": {
+            "x509": {
+                str(tmp_path / "ssl"): {
+                    "keyFileName": "app.key",
+                    "certFileName": "app.crt",
+                    "keyType": "EC",
+                }
+            }
+        },
+    }
+    start_jobs(config, use_async=use_async, ready_file=str(ready_file))
+    assert ready_file.read_text() != "stale"
+    before_ready = [name for name, ready in processed if not ready]
+    after_ready = [name for name, ready in processed if ready]
+    assert {"app.crt", "app.key", "secrets.env", "app.conf"} == set(before_ready)
+    assert after_ready == ["plugin.conf", "dashboard.json"] or use_async
+    assert set(after_ready) == {"plugin.conf", "dashboard.json"}
+    if not use_async:
+        assert before_ready.index("secrets.env") < before_ready.index("app.conf")
+
+
+def test_files_phase(tmp_path):
+    config = {
+        "files": {
+            str(tmp_path / "app.conf"): {"content": "app", "critical": True},
+            str(tmp_path / "dashboard.json"): {"content": "{}"},
+        }
+    }
+    start_jobs(config, phase="critical")
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["app.conf"]
+    start_jobs(config, phase="non-critical", ready_file=str(tmp_path / "ready"))
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "app.conf",
+        "dashboard.json",
+        "ready",
+    ]
+    with pytest.raises(ValueError):
+        start_jobs(config, phase="fast")
+
+
+def test_files_phase_without_critical_files(tmp_path, caplog):
+    config = {"files": {str(tmp_path / "dashboard.json"): {"content": "{}"}}}
+    start_jobs(config, phase="critical")
+    assert not (tmp_path / "dashboard.json").exists()
+    assert "No file to process in the critical phase" in caplog.text
+    start_jobs(config, phase="non-critical")
+    assert (tmp_path / "dashboard.json").read_text() == "{}"
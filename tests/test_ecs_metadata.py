@@ -12,7 +12,13 @@ import pytest
 
 from ecs_files_composer import input
 from ecs_files_composer.ecs_files_composer import start_jobs
-from ecs_files_composer.jinja2_filters import get_property
+from ecs_files_composer.jinja2_filters import (
+    PropertyIndex,
+    get_literal_prefix,
+    get_property,
+)
+from ecs_files_composer.jinja2_functions import aws
+from ecs_files_composer.jinja2_functions.aws import get_metadata_property
 
 HERE = path.abspath(path.dirname(__file__))
 
@@ -127,3 +133,35 @@ def test_get_property():
         get_property(test_container, "PrivateDNSName")
         == "ip-10-0-0-222.us-west-2.compute.internal"
     )
+
+
+def test_property_index():
+    index = PropertyIndex(test_task)
+    assert index.get("Containers::0::Name") == "curl"
+    assert index.get("Limits::CPU") == 0.25
+    assert index.get("Limits") == {"CPU": 0.25, "Memory": 512}
+    assert get_property(test_task, "Containers")["0::Name"] == "curl"
+    assert index.get("^Containers_0_Networks_0_Private") == get_property(
+        test_task, "PrivateDNSName"
+    )
+    assert index.get("^NotAKey", "default") == "default"
+    assert index.get("Containers_\\d_DockerName") == "curl"
+    assert get_property(index, "Containers::0::Name") == "curl"
+    assert get_property(index, "Containers/0/Name", separator="/") == "curl"
+    assert get_metadata_property(index) is test_task
+    assert get_literal_prefix("^Containers_0_Na?me") == "Containers_0_N"
+    assert get_literal_prefix("^Containers|Name") is None
+    assert get_literal_prefix("Name") is None
+
+
+def test_metadata_index_reused(monkeypatch):
+    monkeypatch.setattr(aws, "METADATA_INDEXES", {})
+    fetched = json.loads(json.dumps(test_task))
+    assert get_metadata_property(fetched, "Containers::0::Name") == "curl"
+    index = aws.METADATA_INDEXES["task"]
+    assert get_metadata_property(json.loads(json.dumps(test_task)), "Cluster")
+    assert aws.METADATA_INDEXES["task"] is index
+    updated = json.loads(json.dumps(test_task))
+    updated["Containers"][0]["Name"] = "updated"
+    assert get_metadata_property(updated, "Containers::0::Name") == "updated"
+    assert aws.METADATA_INDEXES["task"] is not index
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""Tests for the environment variables substitution."""
+
+import pytest
+
+from ecs_files_composer.ecs_files_composer import start_jobs
+from ecs_files_composer.envsubst import (
+    expandvars,
+    expandvars_bytes_chunks,
+    expandvars_chunks,
+)
+
+CONTENT = (
+    "home=${HOME_DIR} user=$APP_USER default=${UNSET:-fallback} "
+    "defined=${APP_USER:+set} litteral=${!APP_USER} escaped=\\$APP_USER "
+    "nested=${UNSET${!APP_USER}} unknown=${UNKNOWN} region=${AWS::Region} "
+    "unicode=é€ $$APP_USER ${APP_USER}"
+)
+
+
+@pytest.fixture
+def app_env(monkeypatch):
+    monkeypatch.setenv("HOME_DIR", "/home/app")
+    monkeypatch.setenv("APP_USER", "app")
+    monkeypatch.delenv("UNSET", raising=False)
+    monkeypatch.delenv("UNKNOWN", raising=False)
+
+
+def test_expandvars(app_env):
+    assert expandvars(CONTENT).startswith(
+        "home=/home/app user=app default=fallback defined=set litteral=${APP_USER} "
+        "escaped=\\$APP_USER"
+    )
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64])
+def test_expandvars_chunks(app_env, chunk_size):
+    chunks = [
+        CONTENT[index : index + chunk_size]
+        for index in range(0, len(CONTENT), chunk_size)
+    ]
+    assert "".join(expandvars_chunks(chunks)) == expandvars(CONTENT)
+    content = CONTENT.encode("utf-8")
+    bytes_chunks = [
+        content[index : index + chunk_size]
+        for index in range(0, len(content), chunk_size)
+    ]
+    assert b"".join(expandvars_bytes_chunks(bytes_chunks)) == expandvars(
+        CONTENT
+    ).encode("utf-8")
+
+
+def test_envsubst_context(tmp_path, app_env):
+    start_jobs(
+        {
+            "files": {
+                str(tmp_path / "app.conf"): {
+                    "content": "home=${HOME_DIR} {{ not jinja }}",
+                    "context": "envsubst",
+                },
+                str(tmp_path / "app.b64"): {
+                    "content": "dXNlcj0ke0FQUF9VU0VSfQ==",
+                    "encoding": "base64",
+                    "context": "envsubst",
+                },
+                str(tmp_path / "plain.conf"): {"content": "home=${HOME_DIR}"},
+            }
+        }
+    )
+    assert (tmp_path / "app.conf").read_text() == "home=/home/app {{ not jinja }}"
+    assert (tmp_path / "app.b64").read_text() == "user=app"
+    assert (tmp_path / "plain.conf").read_text() == "home=${HOME_DIR}"
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""Tests for the exec-wrapper mode."""
+
+import os
+import sys
+
+import pytest
+
+from ecs_files_composer import cli
+from ecs_files_composer.ecs_files_composer import start_jobs
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_exports(tmp_path, use_async):
+    exports: dict = {}
+    start_jobs(
+        {
+            "files": {
+                str(tmp_path / "app.conf"): {
+                    "content": "port=8080",
+                    "export_env": "APP_CONF",
+                },
+                str(tmp_path / "secret"): {
+                    "content": "c2VjcmV0",
+                    "encoding": "base64",
+                    "export_env": "APP_SECRET",
+                    "export_only": True,
+                },
+            }
+        },
+        use_async=use_async,
+        exports=exports,
+    )
+    assert exports == {"APP_CONF": "port=8080", "APP_SECRET": "secret"}
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["app.conf"]
+
+
+def test_exec_command(tmp_path, monkeypatch):
+    config_path = tmp_path / "files.yaml"
+    config_path.write_text(f"""
+files:
+  {tmp_path / "secret"}:
+    content: secret
+    export_env: APP_SECRET
+    export_only: true
+""")
+    executed: list = []
+    monkeypatch.setattr(
+        os,
+        "execvp",
+        lambda file, args: executed.append((file, args, os.environ["APP_SECRET"])),
+    )
+    monkeypatch.delenv("APP_SECRET", raising=False)
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["ecs_files_composer", "-f", str(config_path), "--context", "plain"]
+        + ["--exec", "--", "nginx", "-g", "daemon off;"],
+    )
+    assert cli.main() == 0
+    assert executed == [("nginx", ["nginx", "-g", "daemon off;"], "secret")]
+    assert not (tmp_path / "secret").exists()
+
+
+def test_split_exec_command():
+    assert cli.split_exec_command(
+        ["-f", "files.yaml", "--exec", "--", "app", "--"]
+    ) == (
+        ["-f", "files.yaml", "--exec"],
+        ["app", "--"],
+    )
+    assert cli.split_exec_command(["-f", "files.yaml"]) == (["-f", "files.yaml"], [])
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""Tests for the verification of the content retrieved from sources."""
+
+import base64
+import hashlib
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ecs_files_composer.aws_mgmt import S3Fetcher
+from ecs_files_composer.ecs_files_composer import start_jobs
+
+CONTENT = b"remote content " * 1024
+
+
+@pytest.fixture
+def http_server(tmp_path):
+    (tmp_path / "served").mkdir()
+    (tmp_path / "served/remote.txt").write_bytes(CONTENT)
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0),
+        partial(SimpleHTTPRequestHandler, directory=str(tmp_path / "served")),
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/remote.txt"
+    server.shutdown()
+
+
+def test_url_source_digest(tmp_path, http_server):
+    out_dir = tmp_path / "out"
+    config = {
+        "files": {
+            str(out_dir / "valid.txt"): {
+                "source": {
+                    "Url": {"Url": http_server},
+                    "Sha512": hashlib.sha512(CONTENT).hexdigest(),
+                },
+            },
+            str(out_dir / "invalid.txt"): {
+                "source": {"Url": {"Url": http_server}, "Sha256": "0" * 64},
+                "ignore_failure": True,
+            },
+        }
+    }
+    start_jobs(config)
+    assert (out_dir / "valid.txt").read_bytes() == CONTENT
+    assert not (out_dir / "invalid.txt").exists()
+    assert [path.name for path in out_dir.iterdir()] == ["valid.txt"]
+
+    del config["files"][str(out_dir / "invalid.txt")]["ignore_failure"]
+    with pytest.raises(Exception):
+        start_jobs(config)
+
+
+def test_s3_checksum_sha256():
+    checksum = base64.b64encode(hashlib.sha256(CONTENT).digest()).decode()
+    assert (
+        S3Fetcher.checksum_sha256({"ChecksumSHA256": checksum})
+        == hashlib.sha256(CONTENT).hexdigest()
+    )
+    assert S3Fetcher.checksum_sha256({"ChecksumSHA256": f"{checksum}-3"}) is None
+    assert S3Fetcher.checksum_sha256({}) is None
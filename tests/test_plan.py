@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""Tests for the execution plan."""
+
+from ecs_files_composer.plan import build_plan
+
+ROLE_ARN = "arn:aws:iam::111122223333:role/files-composer"
+
+
+def test_plan_groups_and_collapses_sources(monkeypatch):
+    monkeypatch.setenv("BUCKET_NAME", "my-bucket")
+    files = {
+        f"/tmp/plan/ssm_{count}.txt": {
+            "source": {"Ssm": {"ParameterName": f"/app/param{count}"}}
+        }
+        for count in range(12)
+    }
+    files.update(
+        {
+            "/tmp/plan/a.txt": {"content": "test"},
+            "/tmp/plan/b.conf": {
+                "source": {"S3": {"BucketName": "${BUCKET_NAME}", "Key": "b.conf"}}
+            },
+            "/tmp/plan/b-copy.conf": {
+                "source": {"S3": {"S3Uri": "s3://my-bucket/b.conf"}}
+            },
+        }
+    )
+    plan = build_plan({"files": files, "IamOverride": {"RoleArn": ROLE_ARN}})
+    assert plan.files_count == 15
+    assert len(plan.fetches) == 13
+    assert plan.fetches[-1].resource == "s3://my-bucket/b.conf"
+    assert plan.fetches[-1].files == ["/tmp/plan/b.conf", "/tmp/plan/b-copy.conf"]
+    assert list(plan.grouped().keys()) == [ROLE_ARN]
+    assert plan.assume_role_calls == 1
+    assert plan.api_calls == 14
+    assert plan.api_calls_batched == 4
+    assert "batchable into 2 GetParameters call(s)" in plan.render()
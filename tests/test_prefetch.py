@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""Tests for the two-pass rendering of templates."""
+
+import json
+
+import pytest
+
+from ecs_files_composer.aws_mgmt import CLIENTS_POOL
+from ecs_files_composer.ecs_files_composer import start_jobs
+from ecs_files_composer.jinja2_functions.prefetch import (
+    CallsRecorder,
+    PrefetchedValues,
+)
+
+
+def test_prefetched_template(tmp_path, monkeypatch):
+    batches: list = []
+
+    def fetch_ssm_parameters(self, names):
+        batches.append(names)
+        for name in names:
+            self.ssm_parameters[name] = (
+                json.dumps({"key": "json"}) if name == "/json" else f"value{name}"
+            )
+
+    monkeypatch.setattr(PrefetchedValues, "fetch_ssm_parameters", fetch_ssm_parameters)
+    content = "".join(
+        f"p{count}={{{{ from_ssm('/param{count}') }}}}\n" for count in range(12)
+    )
+    content += "j={{ from_ssm_json('/json')['key'] }}\n"
+    file_path = str(tmp_path / "prefetch.conf")
+    start_jobs(
+        {
+            "files": {
+                file_path: {"content": content, "context": "jinja2", "prefetch": True}
+            }
+        }
+    )
+    assert [len(batch) for batch in batches] == [10, 3]
+    with open(file_path) as file_fd:
+        rendered = file_fd.read()
+    assert "p11=value/param11\n" in rendered
+    assert rendered.endswith("j=json")
+
+
+def test_prefetched_secrets_parsed_on_lookup(monkeypatch):
+    class SecretsClient:
+        @staticmethod
+        def batch_get_secret_value(SecretIdList):
+            return {
+                "SecretValues": [
+                    {"Name": "plain", "ARN": "arn:plain", "SecretString": "password"},
+                    {
+                        "Name": "json",
+                        "ARN": "arn:json",
+                        "SecretString": json.dumps({"user": "admin"}),
+                    },
+                ]
+            }
+
+    monkeypatch.setattr(
+        CLIENTS_POOL, "get_client", lambda *args, **kwargs: SecretsClient()
+    )
+    values = PrefetchedValues(CallsRecorder())
+    values.fetch_secrets(["plain", "json"])
+    assert values.from_resolve("{{resolve:secretsmanager:json:SecretString:user}}") == (
+        "admin"
+    )
+    with pytest.raises(json.JSONDecodeError):
+        values.from_resolve("{{resolve:secretsmanager:plain}}")
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""Tests for the profiling of the execution by phase."""
+
+import pstats
+
+from ecs_files_composer.ecs_files_composer import init_config, start_jobs
+from ecs_files_composer.profiling import Profiler
+from ecs_files_composer.tracing import TRACER
+
+
+def test_profile_phases(tmp_path):
+    config_path = tmp_path / "files.yaml"
+    config_path.write_text(f"""
+files:
+  {tmp_path / "app.conf"}:
+    content: value
+  {tmp_path / "app.j2"}:
+    content: "{{{{ 1 + 1 }}}}"
+    context: jinja2
+certificates:
+  x509:
+    {tmp_path / "ssl"}:
+      keyFileName: app.key
+      certFileName: app.crt
+      keyType: EC
+""")
+    profiler = Profiler(str(tmp_path / "profile"), top=5, sampling_interval=0.001)
+    profiler.start()
+    try:
+        start_jobs(init_config(file_path=str(config_path)))
+    finally:
+        profiler.stop()
+    written = profiler.write()
+    assert not TRACER.listeners
+    assert {"parse", "render", "write", "certs", "other"} <= set(profiler.phases)
+    assert str(tmp_path / "profile" / "render.pstats") in written
+    assert pstats.Stats(str(tmp_path / "profile" / "profile.pstats")).stats
+    assert profiler.phases["render"].runs == 1
+    assert profiler.phases["write"].runs >= 2
+    assert profiler.peak_memory > 0
+    summary = (tmp_path / "profile" / "summary.txt").read_text()
+    assert "== render: 1 run(s)" in summary
+    assert "== certs:" in summary
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""Tests for the S3 prefix synchronization."""
+
+import hashlib
+import io
+from datetime import datetime, timezone
+
+from botocore.response import StreamingBody
+
+from ecs_files_composer.s3_sync import S3PrefixSync
+
+MODIFIED = datetime(2022, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeS3Fetcher:
+    """Serves the objects from a dict, keeping track of the objects downloaded"""
+
+    def __init__(self, objects: dict):
+        self.objects = objects
+        self.downloaded = []
+
+    def list_objects(self, s3_bucket, prefix="", bucket_region=None):
+        for key, content in sorted(self.objects.items()):
+            if key.startswith(prefix):
+                yield {
+                    "Key": key,
+                    "Size": len(content),
+                    "ETag": f'"{hashlib.md5(content).hexdigest()}"',
+                    "LastModified": MODIFIED,
+                }
+
+    def get_object(self, s3_bucket, s3_key, checksum_mode=False, bucket_region=None):
+        self.downloaded.append(s3_key)
+        content = self.objects[s3_key]
+        return {"Body": StreamingBody(io.BytesIO(content), len(content))}
+
+
+def test_s3_prefix_sync(tmp_path):
+    objects = {
+        "dashboards/": b"",
+        "dashboards/a.json": b"{}",
+        "dashboards/team/b.json": b'{"b": 1}',
+        "dashboards/readme.md": b"# readme",
+        "dashboardsx/c.json": b"{}",
+    }
+    fetcher = FakeS3Fetcher(objects)
+    target = tmp_path / "dashboards"
+    target.mkdir()
+    (target / "old.json").write_text("{}")
+    (target / "keep.txt").write_text("not selected")
+    sync = S3PrefixSync(fetcher, "bucket", "dashboards", str(target), mode="0600")
+    result = sync.sync(include=["*.json"], delete=True, max_workers=4)
+    assert sorted(fetcher.downloaded) == ["dashboards/a.json", "dashboards/team/b.json"]
+    assert (target / "team/b.json").read_bytes() == b'{"b": 1}'
+    assert not (target / "old.json").exists()
+    assert (target / "keep.txt").exists()
+    assert not (target / "readme.md").exists()
+    assert len(result.deleted) == 1
+
+    fetcher.downloaded.clear()
+    result = sync.sync(include=["*.json"], max_workers=4)
+    assert fetcher.downloaded == []
+    assert len(result.unchanged) == 2
+
+    (target / "a.json").write_bytes(b"[]")
+    sync.sync(include=["*.json"], max_workers=4)
+    assert fetcher.downloaded == ["dashboards/a.json"]
+    assert (target / "a.json").read_bytes() == b"{}"
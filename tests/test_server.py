@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""Tests for the jobs server."""
+
+import os
+import stat
+import sys
+import threading
+
+import pytest
+
+from ecs_files_composer.cli import main
+from ecs_files_composer.files_mgmt import JINJA_BYTECODE_CACHE
+from ecs_files_composer.server import JobRequestHandler, JobsServer, submit_jobs
+
+
+def test_server_jobs(tmp_path):
+    socket_path = str(tmp_path / "composer.sock")
+    server = JobsServer(socket_path, JobRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    file_path = str(tmp_path / "output" / "test.txt")
+    config = {"files": {file_path: {"content": "{{ 1 + 1 }}", "context": "jinja2"}}}
+    config_path = tmp_path / "config.json"
+    config_path.write_text('{"files": {"%s": {"content": "plain"}}}' % file_path)
+    try:
+        results = submit_jobs(
+            socket_path,
+            [
+                {"name": "inline", "config": config},
+                {"name": "again", "config": config},
+                {"name": "source", "source": {"file_path": str(config_path)}},
+                {"name": "invalid"},
+            ],
+            timeout=30,
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert [result["success"] for result in results] == [True, True, True, False]
+    assert results[0]["files"] == {file_path: "completed"}
+    assert JINJA_BYTECODE_CACHE.buckets
+    with open(file_path) as file_fd:
+        assert file_fd.read() == "plain"
+
+
+@pytest.fixture
+def server_socket(tmp_path):
+    socket_path = str(tmp_path / "composer.sock")
+    umask = os.umask(0o022)
+    try:
+        server = JobsServer(socket_path, JobRequestHandler)
+    finally:
+        os.umask(umask)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield socket_path
+    server.shutdown()
+    server.server_close()
+
+
+def test_submit_config_content(tmp_path, monkeypatch, server_socket):
+    assert stat.S_IMODE(os.stat(server_socket).st_mode) == 0o600
+    file_path = tmp_path / "output" / "env.txt"
+    monkeypatch.setenv(
+        "ECS_CONFIG_CONTENT", '{"files": {"%s": {"content": "from env"}}}' % file_path
+    )
+    monkeypatch.setattr(sys, "argv", ["files_composer", "--submit", server_socket])
+    assert main() == 0
+    assert file_path.read_text() == "from env"
+
+
+@pytest.mark.parametrize(
+    "options",
+    [["--from-file", "config.yaml"], ["--exec", "--", "true"]],
+)
+def test_server_options_rejected(monkeypatch, options):
+    monkeypatch.setattr(
+        sys, "argv", ["files_composer", "--server", "composer.sock"] + options
+    )
+    with pytest.raises(SystemExit):
+        main()
+
+
+def test_submit_without_config(monkeypatch):
+    monkeypatch.delenv("ECS_CONFIG_CONTENT", raising=False)
+    monkeypatch.setattr(sys, "argv", ["files_composer", "--submit", "composer.sock"])
+    with pytest.raises(SystemExit):
+        main()
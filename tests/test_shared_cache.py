@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""Tests for the download cache shared between composers."""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ecs_files_composer.shared_cache import SharedCache, url_version
+
+
+class Downloads:
+    def __init__(self, content: bytes, delay: float = 0):
+        self.content = content
+        self.delay = delay
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.count += 1
+        time.sleep(self.delay)
+        return [self.content[:3], self.content[3:]]
+
+
+def test_shared_cache_downloads_once(tmp_path):
+    cache = SharedCache(str(tmp_path))
+    downloads = Downloads(b"truststore", delay=0.2)
+
+    def read():
+        with cache.open("s3://bucket/truststore.jks", '"etag"', downloads) as cache_fd:
+            return cache_fd.read()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        contents = list(executor.map(lambda _: read(), range(4)))
+    assert contents == [b"truststore"] * 4
+    assert downloads.count == 1
+    with cache.open("s3://bucket/truststore.jks", '"new-etag"', downloads) as cache_fd:
+        assert cache_fd.read() == b"truststore"
+    assert downloads.count == 2
+
+
+def test_shared_cache_failed_download(tmp_path):
+    cache = SharedCache(str(tmp_path))
+
+    def failing():
+        yield b"part"
+        raise OSError("connection reset")
+
+    try:
+        cache.open("https://example.com/file", "v1", failing)
+    except OSError:
+        pass
+    assert os.listdir(cache.entries_dir) == []
+    downloads = Downloads(b"content")
+    with cache.open("https://example.com/file", "v1", downloads) as cache_fd:
+        assert cache_fd.read() == b"content"
+
+
+def test_shared_cache_lru_eviction(tmp_path):
+    cache = SharedCache(str(tmp_path), max_size=20)
+    for index, name in enumerate(["first", "second"]):
+        cache.open(name, "v1", Downloads(b"x" * 8)).close()
+        key = cache.entry_key(name, "v1")
+        os.utime(cache.entry_path(key), (index, index))
+    cache.open("first", "v1", Downloads(b"")).close()
+    cache.open("third", "v1", Downloads(b"x" * 8)).close()
+    assert sorted(os.listdir(cache.entries_dir)) == sorted(
+        [cache.entry_key("first", "v1"), cache.entry_key("third", "v1")]
+    )
+
+
+def test_url_version():
+    assert url_version({"ETag": '"abc"'}) == '"abc"'
+    assert (
+        url_version({"Last-Modified": "Wed, 21 Oct 2015", "Content-Length": "10"})
+        == "Wed, 21 Oct 2015|10"
+    )
+    assert url_version({"Content-Length": "10"}) is None
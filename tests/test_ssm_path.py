@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""Tests for the rendering of SSM parameters hierarchies."""
+
+import json
+
+import yaml
+
+from ecs_files_composer.ssm_path import render_parameters, write_parameters_files
+
+PARAMETERS = {
+    "/app/prod/db/host": "db.internal",
+    "/app/prod/db/password": "p@ss word",
+    "/app/prod/log-level": "info",
+    "/app/prod/log-level/debug": "skipped",
+}
+
+
+def test_render_parameters():
+    tree = {"db": {"host": "db.internal", "password": "p@ss word"}, "log-level": "info"}
+    assert json.loads(render_parameters(PARAMETERS, "/app/prod", "json")) == tree
+    assert yaml.safe_load(render_parameters(PARAMETERS, "/app/prod/", "yaml")) == tree
+    env = render_parameters(PARAMETERS, "/app/prod", "env").splitlines()
+    assert "DB_HOST=db.internal" in env
+    assert "DB_PASSWORD='p@ss word'" in env
+    assert "LOG_LEVEL=info" in env
+    properties = render_parameters(PARAMETERS, "/app/prod", "properties")
+    assert "db.password=p@ss word\n" in properties
+
+
+def test_write_parameters_files(tmp_path):
+    written = write_parameters_files(PARAMETERS, "/app/prod", str(tmp_path))
+    assert len(written) == 3
+    assert (tmp_path / "db/host").read_text() == "db.internal"
+    assert (tmp_path / "log-level").read_text() == "info"
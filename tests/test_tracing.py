@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MPL-2.0
+# Copyright 2020-2022 John Mille<john@compose-x.io>
+
+"""Tests for the execution timeline."""
+
+import asyncio
+import json
+
+import pytest
+
+from ecs_files_composer.ecs_files_composer import start_jobs
+from ecs_files_composer.tracing import TRACER, Tracer, traced
+
+
+@pytest.fixture
+def tracer():
+    TRACER.enable()
+    yield TRACER
+    TRACER.disable()
+
+
+def test_job_trace(tmp_path, tracer):
+    start_jobs(
+        {
+            "files": {
+                str(tmp_path / "app.conf"): {"content": "value"},
+                str(tmp_path / "app.j2"): {
+                    "content": "{{ 1 + 1 }}",
+                    "context": "jinja2",
+                },
+            },
+            "certificates": {
+                "x509": {
+                    str(tmp_path / "ssl"): {
+                        "keyFileName": "app.key",
+                        "certFileName": "app.crt",
+                        "keyType": "EC",
+                    }
+                }
+            },
+        }
+    )
+    trace_path = tmp_path / "trace.json"
+    tracer.write(str(trace_path))
+    with open(trace_path) as trace_fd:
+        events = json.load(trace_fd)["traceEvents"]
+    spans = [event for event in events if event["ph"] == "X"]
+    categories = {event["cat"] for event in spans}
+    assert {"job", "certificates", "keygen", "file", "write", "render"} <= categories
+    assert {event["name"] for event in spans if event["cat"] == "render"} == {
+        str(tmp_path / "app.j2")
+    }
+    assert all(event["dur"] >= 0 for event in spans)
+    assert any(event["ph"] == "M" for event in events)
+
+
+def test_async_tasks_tracks():
+    tracer = Tracer()
+    tracer.enable()
+
+    async def task(name: str):
+        with tracer.span(name, "fetch"):
+            await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(task("first"), task("second"))
+
+    asyncio.run(main())
+    assert len({event["tid"] for event in tracer.events}) == 2
+
+
+def test_disabled_tracer():
+    @traced("fetch")
+    def fetch():
+        return "content"
+
+    TRACER.disable()
+    recorded = len(TRACER.events)
+    assert fetch() == "content"
+    assert len(TRACER.events) == recorded